@@ -1,17 +1,29 @@
-from fastapi import APIRouter, UploadFile, File as FastAPIFile, Form, Depends, BackgroundTasks, Query
+from fastapi import APIRouter, UploadFile, File as FastAPIFile, Form, Depends, BackgroundTasks, Query, Request
 from sqlalchemy.orm import Session
-from fastapi.responses import FileResponse as FastAPIFileResponse, JSONResponse
-from app.schemas import FileResponse, FolderCreate, FolderResponse, FileRename, FolderRename, MoveFile, UserCreate, MessageResponse, TokenResponse, StatsResponse, PasswordRequest, CodeRequest, PhoneRequest, SharedFolderResponse
-from app.client.client import upload_file_to_tgcloud, download_file_from_tgcloud, delete_file_from_tgcloud, delete_folder_from_tgcloud
-from app.client.files_db import SessionLocal, File, Folder, User, ShareToken
+from fastapi.responses import FileResponse as FastAPIFileResponse, JSONResponse, Response, StreamingResponse
+from app.schemas import FileResponse, FolderCreate, FolderResponse, FileRename, FolderRename, MoveFile, UserCreate, MessageResponse, TokenResponse, StatsResponse, PasswordRequest, CodeRequest, PhoneRequest, SharedFolderResponse, RebalanceRequest, ChangesResponse, ArchiveEntriesResponse
+from app.client.transfers import transfers
+from app.client.files_db import SessionLocal, File, Folder, User, ShareToken, record_change, new_share_id
 from app.core.config import settings
-from telethon.errors import SessionPasswordNeededError, PhoneCodeInvalidError
 from telethon.sessions import StringSession
-from app.client.client import telegram_client, ensure_telegram_ready
+from app.client.scheduler import Priority
 from app.core.db import get_db
 from app.core.files import human_readable_size
 from app.services.progress_service import progress_manager
+from app.services.change_service import change_feed
+from app.services.share_service import share_cache, token_key
+from app.services.archive_service import archive_members, stream_archive, archive_index_cache, member_data_offset, stream_member
+from app.services.prefetch_service import chunk_cache, prefetcher, file_size
+from app.services.preview_service import is_text, read_text_page
+from app.client.quotas import user_tenant, share_tenant
+from app.core.http_cache import (
+    content_etag, listing_etag, set_validators, not_modified, PRIVATE_REVALIDATE, PUBLIC_REVALIDATE
+)
+from app.services.thumbnail_service import get_thumbnail, is_thumbnailable, THUMBNAIL_MEDIA_TYPE
+from app.services.metadata_service import MetadataExtractor
+from app.client.placement import channel_usage
 import uuid
+from urllib.parse import quote
 from app.services.file_service import (
     get_file_by_filename,
     get_all_files,
@@ -39,12 +51,13 @@ from app.core.errors import (
     ExternalServiceError,
     TgCloudError,
 )
-from typing import List
+from typing import List, Optional
 import shutil
 from datetime import timedelta, datetime
 import os
 from fastapi.security import OAuth2PasswordRequestForm
-from app.auth.jwt_auth import authenticate_user, create_access_token, get_current_user, get_password_hash
+from app.auth.jwt_auth import authenticate_user, create_access_token, get_current_user
+from app.auth.passwords import password_hasher, ip_limiter
 
 router = APIRouter()
 UPLOAD_DIR = "uploaded_files"
@@ -55,18 +68,51 @@ def remove_file_from_disk(path: str):
     if os.path.exists(path):
         os.remove(path)
 
+def catalog_etag(db: Session, variant: str = "") -> str:
+    """Weak validator of anything derived from the catalog: it changes with every recorded change"""
+    return listing_etag(change_feed.current_cursor(db), variant)
+
+def file_etag(file_db: File, variant: str = "") -> str:
+    return content_etag(
+        file_db.storage_chat_id, file_db.message_id, variant, file_db.filename, file_db.original_name, file_db.mime_type
+    )
+
+def select_files(files: List[File], selection: Optional[List[str]]) -> List[File]:
+    """Files of a folder restricted to the requested names, if any"""
+    if not selection:
+        return files
+    wanted = set(selection)
+    selected = [file for file in files if file.filename in wanted]
+    missing = wanted - {file.filename for file in selected}
+    if missing:
+        raise NotFoundError("File", ", ".join(sorted(missing)))
+    return selected
+
+def archive_response(foldername: str, files: List[File], tenant: str) -> StreamingResponse:
+    response = StreamingResponse(stream_archive(archive_members(files), tenant=tenant), media_type="application/zip")
+    response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(foldername)}.zip"
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Expose-Headers"] = "Content-Disposition"
+    return response
+
 @router.get("/files/", response_model=List[FileResponse])
 async def list_files(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
     """Return all fthe files from de Database"""
-    
-    return get_all_files(db)
+    etag = catalog_etag(db)
+    set_validators(response, etag)
+    return not_modified(request, etag) or get_all_files(db)
 
 @router.get("/folders/{foldername}/files/", response_model=List[FileResponse])
 async def list_files_in_folder(
     foldername: str,
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
@@ -74,12 +120,27 @@ async def list_files_in_folder(
     
     validate_names(foldername)
 
-    return get_files_in_folder(db, foldername)
+    etag = catalog_etag(db)
+    set_validators(response, etag)
+    unchanged = not_modified(request, etag)
+    if unchanged:
+        return unchanged
+
+    files = get_files_in_folder(db, foldername)
+
+    # Resolve the document locations in one batch so the next preview or download skips the lookup
+    background_tasks.add_task(transfers.resolve_locations, files)
+    # and warm the caches for the files most likely to be previewed next
+    prefetcher.schedule(files, user_tenant(current_user.username))
+
+    return files
 
 @router.get("/folders/{foldername}/files/{filename}", response_model=FileResponse)
 async def get_file_info(
     foldername: str,
     filename: str,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
@@ -87,6 +148,12 @@ async def get_file_info(
 
     validate_names(foldername, filename)
 
+    etag = catalog_etag(db)
+    set_validators(response, etag)
+    unchanged = not_modified(request, etag)
+    if unchanged:
+        return unchanged
+
     file = get_file_by_filename(db, filename, foldername)
 
     if not file:
@@ -98,6 +165,7 @@ async def get_file_info(
 async def download_file(
     foldername: str,
     filename: str,
+    request: Request,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
@@ -110,7 +178,6 @@ async def download_file(
     operation_id = str(uuid.uuid4())
     
     try:        
-        await ensure_telegram_ready() # Make sure that telegram session is correctly running
         validate_names(foldername, filename)
 
         file_db = get_file_by_filename(db, filename, foldername)
@@ -120,6 +187,13 @@ async def download_file(
         if file_db.encrypted and not current_user.encryption_enabled:
             return {"detail": "This file is encrypted. Please enable encryption in your account to download it."}
 
+        etag = file_etag(file_db)
+        unchanged = not_modified(request, etag)
+        if unchanged:
+            return unchanged
+
+        await transfers.ensure_ready() # Make sure that telegram session is correctly running
+
         # Start tracking the download progress
         await progress_manager.update_progress(operation_id, current_user.username, {
             'progress': 0,
@@ -130,38 +204,35 @@ async def download_file(
             'eta': 'calculating...'
         })
 
-        async def progress_callback(current, total):
-            """Update the progress of the download operation"""
+        def render_progress(current, total):
+            """Progress info of the download operation"""
 
             if total is None or total == 0:
                 estimated_progress = min(int((current / (10 * 1024 * 1024)) * 80), 85)
-                await progress_manager.update_progress(
-                    operation_id, 
-                    current_user.username, 
-                    {
-                        'progress': estimated_progress,
-                        'status': 'downloading_from_telegram',
-                        'filename': filename,
-                        'operation': 'download',
-                        'speed': f'{human_readable_size(current)} downloaded',
-                        'eta': 'calculating...'
-                    }
-                )
-            else:
-                await progress_manager.update_progress(
-                    operation_id, 
-                    current_user.username, 
-                    {
-                        'progress': min(int((current / total) * 95), 95),
-                        'status': 'downloading_from_telegram',
-                        'filename': filename,
-                        'operation': 'download',
-                        'speed': f'{human_readable_size(current)}/{human_readable_size(total)}',
-                        'eta': 'downloading...'
-                    }
-                )
-
-        result = await download_file_from_tgcloud(filename, foldername, db, progress_callback)
+                return {
+                    'progress': estimated_progress,
+                    'status': 'downloading_from_telegram',
+                    'filename': filename,
+                    'operation': 'download',
+                    'speed': f'{human_readable_size(current)} downloaded',
+                    'eta': 'calculating...'
+                }
+            return {
+                'progress': min(int((current / total) * 95), 95),
+                'status': 'downloading_from_telegram',
+                'filename': filename,
+                'operation': 'download',
+                'speed': f'{human_readable_size(current)}/{human_readable_size(total)}',
+                'eta': 'downloading...'
+            }
+
+        def progress_callback(current, total):
+            """Called by Telethon for every part; only records the state, flushing is throttled"""
+            progress_manager.report(operation_id, current_user.username, render_progress, current, total)
+
+        result = await transfers.download(
+            filename, foldername, db, progress_callback, tenant=user_tenant(current_user.username)
+        )
         
         if not result or not result[0]:
             await progress_manager.complete_operation(operation_id, current_user.username, False)
@@ -180,6 +251,7 @@ async def download_file(
             filename=original_name,
             media_type="application/octet-stream"
         )
+        set_validators(response, etag)
         
         # Set CORS headers for the response
         response.headers["Access-Control-Allow-Origin"] = "*"
@@ -217,10 +289,7 @@ async def upload_file(
     
     try:
 
-        if not telegram_client.is_connected():
-            raise ExternalServiceError("Telegram", "Not authorized")
-
-        await ensure_telegram_ready()
+        await transfers.ensure_ready()
         validate_names(foldername)
 
         folder_exists = get_folder_by_name(db, foldername)
@@ -240,12 +309,13 @@ async def upload_file(
         safe_filename = os.path.basename(file.filename)
         file_location = os.path.join(UPLOAD_DIR, safe_filename)
 
-        # Save the uploaded file to disk
-        file_size = 0
+        # Save the uploaded file to disk, extracting catalog metadata as the bytes stream through
+        extractor = MetadataExtractor(safe_filename)
         with open(file_location, "wb") as buffer:
             while chunk := await file.read(8192):
                 buffer.write(chunk)
-                file_size += len(chunk)
+                extractor.update(chunk)
+        metadata = extractor.finalize(file_location)
         
         # Update progress after saving the file
         await progress_manager.update_progress(operation_id, current_user.username, {
@@ -257,52 +327,50 @@ async def upload_file(
             'eta': 'calculating...'
         })
 
-        async def progress_callback(current, total):
-            """Update the progress of the upload operation"""
+        def render_progress(current, total):
+            """Progress info of the upload operation"""
 
             if total is None or total == 0:
                 estimated_progress = min(25 + int((current / (10 * 1024 * 1024)) * 60), 85)
-                await progress_manager.update_progress(
-                    operation_id, 
-                    current_user.username, 
-                    {
-                        'progress': estimated_progress,
-                        'status': 'uploading_to_telegram',
-                        'filename': file.filename,
-                        'operation': 'upload',
-                        'speed': f'{human_readable_size(current)} uploaded',
-                        'eta': 'uploading...'
-                    }
-                )
-            else:
-                await progress_manager.update_progress(
-                    operation_id, 
-                    current_user.username, 
-                    {
-                        'progress': min(25 + int((current / total) * 70), 95),
-                        'status': 'uploading_to_telegram',
-                        'filename': file.filename,
-                        'operation': 'upload',
-                        'speed': f'{human_readable_size(current)}/{human_readable_size(total)}',
-                        'eta': 'uploading...'
-                    }
-                )
+                return {
+                    'progress': estimated_progress,
+                    'status': 'uploading_to_telegram',
+                    'filename': file.filename,
+                    'operation': 'upload',
+                    'speed': f'{human_readable_size(current)} uploaded',
+                    'eta': 'uploading...'
+                }
+            return {
+                'progress': min(25 + int((current / total) * 70), 95),
+                'status': 'uploading_to_telegram',
+                'filename': file.filename,
+                'operation': 'upload',
+                'speed': f'{human_readable_size(current)}/{human_readable_size(total)}',
+                'eta': 'uploading...'
+            }
+
+        def progress_callback(current, total):
+            """Called by Telethon for every part; only records the state, flushing is throttled"""
+            progress_manager.report(operation_id, current_user.username, render_progress, current, total)
 
         # Upload the file to TgCloud
-        db_file = await upload_file_to_tgcloud(
+        uploaded = await transfers.upload(
             file_location,
-            folder=foldername,
-            db_session=db,
-            username=current_user.username,
-            progress_callback=progress_callback
+            foldername,
+            db,
+            current_user.username,
+            progress_callback=progress_callback,
+            metadata=metadata
         )
 
-        if not db_file:
+        if not uploaded:
             await progress_manager.complete_operation(operation_id, current_user.username, False)
             raise TgCloudError("Could not save file to TgCloud", "FILE_UPLOAD_ERROR")
+        db_file, change_id = uploaded
         
         # Update progress to completed
         await progress_manager.complete_operation(operation_id, current_user.username, True)
+        await change_feed.publish_recorded(db, [change_id])
         
         # Prepare the response with file details
         file_response = {
@@ -313,7 +381,12 @@ async def upload_file(
             "encrypted": db_file.encrypted,
             "original_name": db_file.original_name,
             "message_id": db_file.message_id,
-            "uploaded_at": db_file.uploaded_at
+            "uploaded_at": db_file.uploaded_at,
+            "mime_type": db_file.mime_type,
+            "sha256": db_file.sha256,
+            "width": db_file.width,
+            "height": db_file.height,
+            "duration": db_file.duration
         }
         
         # Return the operation ID and file details
@@ -341,15 +414,19 @@ async def upload_file(
 async def preview_file(
     foldername: str,
     filename: str,
+    request: Request,
     background_tasks: BackgroundTasks,
     token: str = Query(None),
+    offset: int = Query(0, ge=0, description="Byte offset of a text preview page"),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum bytes of a text preview page"),
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
-    """Preview a file from the specified folder in TgCloud."""
+    """Preview a file from the specified folder in TgCloud.
+    Text files larger than a page are previewed page by page: the X-Preview-Truncated and
+    X-Preview-Next-Offset headers tell the client whether and where to continue."""
 
     try:
-        await ensure_telegram_ready()
         validate_names(foldername, filename)
 
         file_db = get_file_by_filename(db, filename, foldername)
@@ -359,30 +436,70 @@ async def preview_file(
         if file_db.encrypted and not current_user.encryption_enabled:
             raise TgCloudError("This file is encrypted. Please enable encryption to preview it.", "FILE_UPLOAD_ERROR")
 
-        result = await download_file_from_tgcloud(filename, foldername, db, None)
-        
-        if not result or not result[0]:
-            raise NotFoundError("File", filename)
-        
-        download_path, original_name = result
-        
-        import mimetypes
-        mime_type, _ = mimetypes.guess_type(original_name)
+        original_name = file_db.original_name
+        mime_type = file_db.mime_type
+        if not mime_type:
+            import mimetypes
+            mime_type, _ = mimetypes.guess_type(original_name)
         if not mime_type:
             mime_type = "application/octet-stream"
+
+        size = file_size(file_db)
+        page_limit = min(limit or settings.PREVIEW_TEXT_BYTES, settings.PREVIEW_TEXT_BYTES)
+        # Encrypted documents can only be decrypted whole
+        paged = is_text(mime_type) and not file_db.encrypted and (offset > 0 or size is None or size > page_limit)
+        if paged and size is not None and offset >= max(size, 1):
+            raise ValidationError(f"Offset {offset} is beyond the end of the file", "offset")
+
+        etag = file_etag(file_db, f"text{offset}-{page_limit}" if paged else "")
+        unchanged = not_modified(request, etag)
+        if unchanged:
+            return unchanged
+
+        await transfers.ensure_ready()
+
+        if paged:
+            page = await read_text_page(file_db.copies, size, offset, page_limit, user_tenant(current_user.username))
+            if page is None:
+                raise NotFoundError("File", filename)
+            response = Response(content=page.data, media_type=mime_type)
+            response.headers["X-Preview-Offset"] = str(page.offset)
+            response.headers["X-Preview-Truncated"] = "true" if page.next_offset is not None else "false"
+            if page.next_offset is not None:
+                response.headers["X-Preview-Next-Offset"] = str(page.next_offset)
+            if size is not None:
+                response.headers["X-Preview-Total-Size"] = str(size)
+        elif not file_db.encrypted and size is not None and size <= settings.PREFETCH_HEAD_BYTES:
+            # Small files are served from the prefetched chunks, or read into them
+            data = await chunk_cache.read(file_db.copies, 0, size, Priority.INTERACTIVE, user_tenant(current_user.username))
+            if data is None:
+                raise NotFoundError("File", filename)
+            response = Response(content=data, media_type=mime_type)
+        else:
+            result = await transfers.download(
+                filename, foldername, db, None, Priority.INTERACTIVE, user_tenant(current_user.username)
+            )
+
+            if not result or not result[0]:
+                raise NotFoundError("File", filename)
+
+            download_path, original_name = result
+            background_tasks.add_task(remove_file_from_disk, download_path)
+
+            response = FastAPIFileResponse(
+                path=download_path,
+                filename=original_name,
+                media_type=mime_type
+            )
         
-        background_tasks.add_task(remove_file_from_disk, download_path)
-        
-        response = FastAPIFileResponse(
-            path=download_path,
-            filename=original_name,
-            media_type=mime_type
-        )
-        
+        set_validators(response, etag)
         response.headers["Access-Control-Allow-Origin"] = "*"
         response.headers["Access-Control-Allow-Methods"] = "GET, OPTIONS"
         response.headers["Access-Control-Allow-Headers"] = "*"
-        response.headers["Access-Control-Expose-Headers"] = "Content-Disposition, Content-Type"
+        response.headers["Access-Control-Expose-Headers"] = (
+            "Content-Disposition, Content-Type, ETag, "
+            "X-Preview-Offset, X-Preview-Truncated, X-Preview-Next-Offset, X-Preview-Total-Size"
+        )
         
         if mime_type.startswith(('image/', 'video/', 'audio/', 'text/', 'application/pdf')):
             response.headers["Content-Disposition"] = f'inline; filename="{original_name}"'
@@ -390,10 +507,142 @@ async def preview_file(
             response.headers["Content-Disposition"] = f'attachment; filename="{original_name}"'
         
         return response
-        
+
+    except TgCloudError:
+        raise
     except Exception as e:
         raise TgCloudError(f"Preview failed: {str(e)}", "PREVIEW_ERROR")
 
+@router.get("/folders/{foldername}/files/{filename}/thumbnail")
+async def thumbnail_file(
+    foldername: str,
+    filename: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Return a small JPEG thumbnail of an image stored in TgCloud.
+    Uses the thumbnail Telegram attached to the document when there is one,
+    otherwise renders one from the original. Results are cached in memory."""
+
+    validate_names(foldername, filename)
+
+    file_db = get_file_by_filename(db, filename, foldername)
+    if not file_db:
+        raise NotFoundError("File", filename)
+
+    if not is_thumbnailable(file_db.original_name or file_db.filename, file_db.mime_type):
+        raise ValidationError(f"Thumbnails are only available for images: {filename}", "filename")
+
+    if file_db.encrypted and not current_user.encryption_enabled:
+        raise TgCloudError("This file is encrypted. Please enable encryption to preview it.", "THUMBNAIL_ERROR")
+
+    etag = file_etag(file_db, f"thumb{settings.THUMBNAIL_SIZE}")
+    cache_control = "private, max-age=86400"
+    unchanged = not_modified(request, etag, cache_control)
+    if unchanged:
+        return unchanged
+
+    await transfers.ensure_ready()
+
+    try:
+        data = await get_thumbnail(file_db, user_tenant(current_user.username))
+    except Exception as e:
+        raise TgCloudError(f"Thumbnail failed: {str(e)}", "THUMBNAIL_ERROR")
+
+    if not data:
+        raise NotFoundError("File", filename)
+
+    response = Response(content=data, media_type=THUMBNAIL_MEDIA_TYPE)
+    set_validators(response, etag, cache_control)
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Allow-Methods"] = "GET, OPTIONS"
+    response.headers["Access-Control-Allow-Headers"] = "*"
+
+    return response
+
+def stored_archive(db: Session, foldername: str, filename: str) -> File:
+    validate_names(foldername, filename)
+    file_db = get_file_by_filename(db, filename, foldername)
+    if not file_db:
+        raise NotFoundError("File", filename)
+    # Encrypted uploads are one Fernet token: nothing inside can be reached by offset
+    if file_db.encrypted:
+        raise ValidationError(f"Encrypted files cannot be inspected: {filename}", "filename")
+    return file_db
+
+@router.get("/folders/{foldername}/files/{filename}/entries", response_model=ArchiveEntriesResponse)
+async def list_archive_entries(
+    foldername: str,
+    filename: str,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """List the members of a stored ZIP file, reading only its central directory"""
+    file_db = stored_archive(db, foldername, filename)
+
+    etag = file_etag(file_db, "entries")
+    set_validators(response, etag)
+    unchanged = not_modified(request, etag)
+    if unchanged:
+        return unchanged
+
+    await transfers.ensure_ready()
+    index = await archive_index_cache.index(file_db, file_size(file_db))
+    return {
+        "filename": filename,
+        "entries": [
+            {
+                "name": info.filename,
+                "size": info.file_size,
+                "compressed_size": info.compress_size,
+                "modified": datetime(*info.date_time),
+                "is_dir": info.is_dir(),
+            }
+            for info in index.values()
+        ],
+    }
+
+@router.get("/folders/{foldername}/files/{filename}/entries/{member:path}")
+async def extract_archive_entry(
+    foldername: str,
+    filename: str,
+    member: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Download one member of a stored ZIP file, reading only that member's bytes"""
+    file_db = stored_archive(db, foldername, filename)
+
+    etag = file_etag(file_db, f"entry-{quote(member)}")
+    unchanged = not_modified(request, etag)
+    if unchanged:
+        return unchanged
+
+    await transfers.ensure_ready()
+    index = await archive_index_cache.index(file_db, file_size(file_db))
+    info = index.get(member)
+    if info is None:
+        raise NotFoundError("Archive entry", member)
+    copies = file_db.copies
+    offset = await member_data_offset(copies, info)
+
+    import mimetypes
+    name = member.rsplit("/", 1)[-1]
+    response = StreamingResponse(
+        stream_member(copies, info, offset, tenant=user_tenant(current_user.username)),
+        media_type=mimetypes.guess_type(name)[0] or "application/octet-stream",
+    )
+    response.headers["Content-Length"] = str(info.file_size)
+    response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(name)}"
+    set_validators(response, etag)
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Expose-Headers"] = "Content-Disposition, ETag"
+    return response
+
 @router.options("/folders/{foldername}/files/{filename}/preview")
 async def preview_file_options(foldername: str, filename: str):
     response = JSONResponse(content={})
@@ -411,7 +660,7 @@ async def delete_file(
     current_user=Depends(get_current_user)
 ):
     """Delete a file from the specified folder in TgCloud."""
-    await ensure_telegram_ready()
+    await transfers.ensure_ready()
     validate_names(foldername, filename)
 
     folder = get_folder_by_name(db, foldername)
@@ -422,20 +671,13 @@ async def delete_file(
     if not file_db:
         raise NotFoundError("File", filename)
 
-    deleted = await delete_file_from_tgcloud(filename, foldername, db)
-    if not deleted:
+    change_id = await transfers.delete_file(filename, foldername, db)
+    if change_id is None:
         raise NotFoundError("File", filename)
 
-    if folder.file_count is not None and folder.file_count > 0:
-        folder.file_count -= 1
-    else:
-        folder.file_count = 0
-
-    if folder.message_ids:
-        ids = [mid for mid in folder.message_ids.split(",") if mid and mid != str(file_db.message_id)]
-        folder.message_ids = ",".join(ids)
-
-    db.commit()
+    # The daemon may have committed the deletion from its own connection
+    db.expire_all()
+    await change_feed.publish_recorded(db, [change_id])
 
     return {"message": f"File '{filename}' deleted from folder '{foldername}'"}
 
@@ -455,18 +697,44 @@ async def create_folder(
     new_folder = Folder(name=folder_data.folder)
 
     db.add(new_folder)
+    change = record_change(db, "folder_created", new_folder.name)
     db.commit()
     db.refresh(new_folder)
+    await change_feed.publish(change)
 
     return new_folder
 
 @router.get("/folders/", response_model=List[FolderResponse])
 async def list_folders(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
     """Return all folders from TgCloud."""
-    return get_all_folders(db)
+    etag = catalog_etag(db)
+    set_validators(response, etag)
+    return not_modified(request, etag) or get_all_folders(db)
+
+@router.get("/folders/{foldername}/archive")
+async def download_folder_archive(
+    foldername: str,
+    files: Optional[List[str]] = Query(None, description="Only these files of the folder"),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Stream a ZIP archive of a folder, or of selected files in it, straight from Telegram."""
+    await transfers.ensure_ready()
+    validate_names(foldername, *(files or []))
+
+    if not get_folder_by_name(db, foldername):
+        raise NotFoundError("Folder", foldername)
+
+    selected = select_files(get_files_in_folder(db, foldername), files)
+    if not current_user.encryption_enabled:
+        # Same rule as single downloads: encrypted files need encryption enabled
+        selected = [file for file in selected if not file.encrypted]
+    return archive_response(foldername, selected, user_tenant(current_user.username))
 
 @router.delete("/folders/{foldername}/", response_model=MessageResponse)
 async def delete_folder(
@@ -475,20 +743,24 @@ async def delete_folder(
     current_user=Depends(get_current_user)
 ):
     """Delete a folder from TgCloud."""
-    await ensure_telegram_ready()
+    await transfers.ensure_ready()
     validate_names(foldername)
 
     folder = get_folder_by_name(db, foldername)
     if not folder:
         raise NotFoundError("Folder", foldername)
     
-    if folder.message_ids:
-        deleted = await delete_folder_from_tgcloud(folder.name, db)
-        if not deleted:
+    if get_files_in_folder(db, foldername):
+        change_ids = await transfers.delete_folder(folder.name, db)
+        if change_ids is None:
             raise TgCloudError(f"Could not delete folder: {foldername}", "FOLDER_DELETE_ERROR")
+        db.expire_all()
+        await change_feed.publish_recorded(db, change_ids)
         
     db.delete(folder)
+    change = record_change(db, "folder_deleted", foldername)
     db.commit()
+    await change_feed.publish(change)
 
     return {"message": f"Folder '{folder.name}' deleted"}
 
@@ -512,9 +784,11 @@ async def rename_file(
         raise ConflictError(f"File already exists: {filename, foldername}", "file")
     
     file.filename = data.new_name
+    change = record_change(db, "file_renamed", foldername, filename, new_name=data.new_name)
 
     db.commit()
     db.refresh(file)
+    await change_feed.publish(change)
 
     return {"message": f"File '{filename}' renamed to '{data.new_name}' in folder '{foldername}'"}
 
@@ -539,9 +813,11 @@ async def rename_folder(
     folder.name = data.new_name
 
     rename_folder_of_files(foldername, data.new_name, db)
+    change = record_change(db, "folder_renamed", foldername, new_name=data.new_name)
 
     db.commit()
     db.refresh(folder)
+    await change_feed.publish(change)
 
     return {"message": f"Folder '{foldername}' renamed to '{data.new_name}'"}
 
@@ -586,18 +862,30 @@ async def move_file(
     else:
         dest_folder.message_ids = str(file.message_id)
 
+    change = record_change(db, "file_moved", foldername, filename, dest_folder=data.dest_folder)
+
     db.commit()
     db.refresh(file)
     db.refresh(folder)
     db.refresh(dest_folder)
+    await change_feed.publish(change)
     
     return {"message": f"File '{filename}' moved from '{foldername}' to '{data.dest_folder}'"}
 
 @router.get("/stats/", response_model=StatsResponse)
 async def get_stats(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
+    # The stats also carry the user's encryption setting
+    etag = catalog_etag(db, "e1" if current_user.encryption_enabled else "e0")
+    set_validators(response, etag)
+    unchanged = not_modified(request, etag)
+    if unchanged:
+        return unchanged
+
     total_space_used = human_readable_size(get_used_space(db))
     total_files = get_total_files(db)
     total_folders = get_total_folders(db)
@@ -611,14 +899,73 @@ async def get_stats(
         "encryption_enabled": encryption_enabled,
     }
 
+@router.get("/changes", response_model=ChangesResponse)
+async def list_changes(
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(500, ge=1, le=1000),
+    wait: float = Query(0, ge=0, le=60),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Return catalog changes after the `since` cursor, oldest first.
+    Without `since` only the current cursor is returned, to start syncing after a full listing.
+    With `wait` the request long-polls up to that many seconds for the next change."""
+    if since is None:
+        return {"cursor": change_feed.current_cursor(db), "changes": [], "has_more": False}
+
+    changes, has_more = await change_feed.wait_for_changes(db, since, limit, wait)
+    return {
+        "cursor": changes[-1].id if changes else since,
+        "changes": [change.to_dict() for change in changes],
+        "has_more": has_more,
+    }
+
+@router.get("/channels/")
+async def list_storage_channels(
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Return the storage channels with the files and bytes each one holds"""
+    return {
+        "placement_policy": settings.TG_PLACEMENT_POLICY,
+        "channels": channel_usage(db),
+        "rebalance": await transfers.rebalance_status(),
+    }
+
+@router.post("/channels/rebalance", response_model=MessageResponse)
+async def rebalance_storage_channels(
+    data: RebalanceRequest,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Migrate files between storage channels in the background.
+    Without a source channel the channels are evened out by size,
+    with one every file in it is moved (to `target` if given)."""
+    for chat in (data.source, data.target):
+        if chat is not None and chat not in settings.TG_CHAT_IDS:
+            raise NotFoundError("Channel", str(chat))
+
+    if (await transfers.rebalance_status())["running"]:
+        raise ConflictError("A rebalance is already running", "channels")
+
+    await transfers.ensure_ready()
+
+    planned = await transfers.rebalance(db, data.source, data.target, data.max_moves)
+
+    return {"message": f"Rebalance scheduled: {planned} files to migrate"}
+
 @router.post("/register", response_model=MessageResponse)
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, request: Request, db: Session = Depends(get_db)):
     """Register a new user in TgCloud."""
+    # Registrations hash a password too, so they share the per-IP login budget
+    client_ip = request.client.host if request.client else "unknown"
+    ip_limiter.check(client_ip)
+    ip_limiter.hit(client_ip)
     existing = get_user(user.username, db)
     if existing:
         raise ConflictError(f"Username already exists: {user.username}", "user")
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     new_user = User(username=user.username, hashed_password=hashed_password)
 
     db.add(new_user)
@@ -629,9 +976,10 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/token", response_model=TokenResponse)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """Authenticate user and return access token."""
-    user = authenticate_user(db, form_data.username, form_data.password)
+    client_ip = request.client.host if request.client else None
+    user = await authenticate_user(db, form_data.username, form_data.password, client_ip)
     if not user:
         raise AuthenticationError("Invalid credentials")
     access_token = create_access_token(data={"sub": user.username})
@@ -643,9 +991,9 @@ async def enable_encryption(
     current_user= Depends(get_current_user)
 ):
     """Enable encryption for the current user's account."""
-    current_user.encryption_enabled = True
+    # current_user is a cached snapshot; committing the change invalidates it
+    get_user(current_user.username, db).encryption_enabled = True
     db.commit()
-    db.refresh(current_user)
     return {"message": "Encryption enabled for this account"}
 
 @router.post("/encryption/off", response_model=MessageResponse)
@@ -654,10 +1002,9 @@ async def disable_encryption(
     current_user = Depends(get_current_user)
 ):
     """Disable encryption for the current user's account."""
-    current_user.encryption_enabled = False
-
+    # current_user is a cached snapshot; committing the change invalidates it
+    get_user(current_user.username, db).encryption_enabled = False
     db.commit()
-    db.refresh(current_user)
     return {"message": "Encryption disabled for this account"}
 
 @router.post("/folders/{foldername}/files/{filename}/share", response_model=MessageResponse)
@@ -676,18 +1023,8 @@ async def share_file(
     
     expires_at = datetime.now() + timedelta(minutes=SHARE_TOKEN_EXPIRE_MINUTES)
     
-    # Create a share token for the file
-    token = create_access_token(
-        data={
-            "folder": foldername,
-            "filename": filename,
-            "type": "file",
-            "owner": current_user.username
-        },
-        expires_delta=timedelta(minutes=SHARE_TOKEN_EXPIRE_MINUTES)
-    )
-
-    # Store the share token in the database
+    # The link carries a short random id; the claims stay in the database
+    token = new_share_id()
     db_token = ShareToken(
         token=token,
         type="file",
@@ -717,15 +1054,7 @@ async def share_folder(
         raise NotFoundError("Folder", foldername)
     expires_at = datetime.now() + timedelta(minutes=SHARE_TOKEN_EXPIRE_MINUTES)
 
-    token = create_access_token(
-        data={
-            "folder": foldername,
-            "type": "folder",
-            "owner": current_user.username
-        },
-        expires_delta=timedelta(minutes=SHARE_TOKEN_EXPIRE_MINUTES)
-    )
-
+    token = new_share_id()
     db_token = ShareToken(
         token=token,
         type="folder",
@@ -744,11 +1073,18 @@ async def share_folder(
 @router.get("/access/file/{token}", response_model=FileResponse)
 async def access_shared_file_info(
     token: str,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
 ):
     """Access shared file information using a share token."""
 
-    payload, db_token = validate_share_token(db, token, "file")
+    payload = validate_share_token(db, token, "file")
+    etag = catalog_etag(db)
+    set_validators(response, etag, PUBLIC_REVALIDATE)
+    unchanged = not_modified(request, etag, PUBLIC_REVALIDATE)
+    if unchanged:
+        return unchanged
     folder = payload["folder"]
     filename = payload["filename"]
     file_db = get_file_by_filename(db, filename, folder)
@@ -759,20 +1095,26 @@ async def access_shared_file_info(
 @router.get("/access/file/{token}/download")
 async def download_shared_file(
     token: str,
+    request: Request,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """Download a shared file using a share token."""
-    await ensure_telegram_ready()
-
-    payload, db_token = validate_share_token(db, token, "file")
+    payload = validate_share_token(db, token, "file")
     folder = payload["folder"]
     filename = payload["filename"]
     file_db = get_file_by_filename(db, filename, folder)
     if not file_db:
         raise NotFoundError("File", filename)
+
+    etag = file_etag(file_db)
+    unchanged = not_modified(request, etag, PUBLIC_REVALIDATE)
+    if unchanged:
+        return unchanged
+
+    await transfers.ensure_ready()
     
-    result = await download_file_from_tgcloud(filename, folder, db, None)
+    result = await transfers.download(filename, folder, db, tenant=share_tenant(token_key(token)))
     if not result or not result[0]:
         raise NotFoundError("File", filename)
     
@@ -785,6 +1127,7 @@ async def download_shared_file(
         filename=original_name,
         media_type="application/octet-stream"
     )
+    set_validators(response, etag, PUBLIC_REVALIDATE)
     
     # Set CORS headers for the response
     response.headers["Access-Control-Allow-Origin"] = "*"
@@ -797,11 +1140,20 @@ async def download_shared_file(
 @router.get("/access/folder/{token}", response_model=SharedFolderResponse)
 async def access_shared_folder_info(
     token: str,
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """Access shared folder information using a share token."""
-    payload, db_token = validate_share_token(db, token, "folder")
+    payload = validate_share_token(db, token, "folder")
     folder_name = payload["folder"]
+
+    etag = catalog_etag(db)
+    set_validators(response, etag, PUBLIC_REVALIDATE)
+    unchanged = not_modified(request, etag, PUBLIC_REVALIDATE)
+    if unchanged:
+        return unchanged
     
     # Get folder info
     folder = get_folder_by_name(db, folder_name)
@@ -810,6 +1162,8 @@ async def access_shared_folder_info(
     
     # Get files in folder
     files = get_files_in_folder(db, folder_name)
+    background_tasks.add_task(transfers.resolve_locations, files)
+    prefetcher.schedule(files, share_tenant(token_key(token)))
     
     return SharedFolderResponse(
         foldername=folder_name,
@@ -820,19 +1174,26 @@ async def access_shared_folder_info(
 @router.get("/access/folder/{token}/{filename}/download")
 async def download_file_from_shared_folder(
     token: str,
+    request: Request,
     background_tasks: BackgroundTasks,
     filename: str,
     db: Session = Depends(get_db)
 ):
     """Download a file from a shared folder using a share token."""
-    await ensure_telegram_ready()
-    payload, db_token = validate_share_token(db, token, "folder")
+    payload = validate_share_token(db, token, "folder")
     folder = payload["folder"]
     file_db = get_file_by_filename(db, filename, folder)
     if not file_db:
         raise NotFoundError("File", filename)
+
+    etag = file_etag(file_db)
+    unchanged = not_modified(request, etag, PUBLIC_REVALIDATE)
+    if unchanged:
+        return unchanged
+
+    await transfers.ensure_ready()
     
-    result = await download_file_from_tgcloud(filename, folder, db, None)
+    result = await transfers.download(filename, folder, db, tenant=share_tenant(token_key(token)))
     if not result or not result[0]:
         raise NotFoundError("File", filename)
     
@@ -844,6 +1205,7 @@ async def download_file_from_shared_folder(
         filename=original_name,
         media_type="application/octet-stream"
     )
+    set_validators(response, etag, PUBLIC_REVALIDATE)
     
     response.headers["Access-Control-Allow-Origin"] = "*"
     response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
@@ -852,6 +1214,18 @@ async def download_file_from_shared_folder(
     
     return response
 
+@router.get("/access/folder/{token}/archive")
+async def download_shared_folder_archive(
+    token: str,
+    files: Optional[List[str]] = Query(None, description="Only these files of the folder"),
+    db: Session = Depends(get_db)
+):
+    """Stream a ZIP archive of a shared folder, or of selected files in it."""
+    await transfers.ensure_ready()
+    payload = validate_share_token(db, token, "folder")
+    folder = payload["folder"]
+    return archive_response(folder, select_files(get_files_in_folder(db, folder), files), share_tenant(token_key(token)))
+
 @router.post("/access/revoke/{token}", response_model=MessageResponse)
 async def revoke_share_token(
     token: str,
@@ -865,6 +1239,7 @@ async def revoke_share_token(
     
     db_token.revoked = True
     db.commit()
+    await share_cache.revoke(token, db_token.expires_at)
     return {"message": "Share token revoked"}
 
 
@@ -875,8 +1250,7 @@ async def tgcloud_send_phone(data: PhoneRequest):
         return {"message": "Telegram API credentials not configured"}
     
     try:
-        await telegram_client.connect()
-        await telegram_client.send_code_request(data.phone)
+        await transfers.send_code(data.phone)
         return {"message": "Code sent"}
     except Exception as e:
         return {"message": f"Error sending code: {str(e)}"}
@@ -888,13 +1262,12 @@ async def tgcloud_verify_code(data: CodeRequest):
         return {"message": "Telegram API credentials not configured"}
     
     try:
-        await telegram_client.connect()
-        await telegram_client.sign_in(data.phone, data.code)
+        result = await transfers.sign_in(data.phone, data.code)
+        if result == "password_required":
+            return {"message": "Password required"}
+        if result == "invalid_code":
+            return {"message": "Invalid code"}
         return {"message": "Authenticated"}
-    except SessionPasswordNeededError:
-        return {"message": "Password required"}
-    except PhoneCodeInvalidError:
-        return {"message": "Invalid code"}
     except Exception as e:
         return {"message": f"Error verifying code: {str(e)}"}
 
@@ -905,8 +1278,7 @@ async def tgcloud_send_password(data: PasswordRequest):
         return {"message": "Telegram API credentials not configured"}
     
     try:
-        await telegram_client.connect()
-        await telegram_client.sign_in(password=data.password)
+        await transfers.sign_in(password=data.password)
         return {"message": "Authenticated"}
     except Exception as e:
         return {"message": f"Error verifying password: {str(e)}"}
@@ -918,8 +1290,7 @@ async def tgcloud_auth_status():
         return {"message": "Telegram API credentials not configured"}
     
     try:
-        await telegram_client.connect()
-        if await telegram_client.is_user_authorized():
+        if await transfers.is_authorized():
             return {"message": "Authorized"}
         else:
             return {"message": "Not authorized"}
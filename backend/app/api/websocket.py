@@ -22,7 +22,7 @@ async def websocket_progress_endpoint(websocket: WebSocket, token: str = None):
                     message = await websocket.receive_text()
                     
                     if message == "ping":
-                        await websocket.send_text("pong")
+                        progress_manager.send(websocket, user.username, "pong")
                         
                 except WebSocketDisconnect:
                     break
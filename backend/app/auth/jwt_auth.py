@@ -1,26 +1,22 @@
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from typing import Callable, Optional
+from app.auth.passwords import password_hasher, ip_limiter, user_limiter, login_stats
+from app.auth.principal_cache import Principal, principal_cache
 from app.client.files_db import SessionLocal, User
 from app.core.db import get_db
 from sqlalchemy.orm import Session
 from app.core.config import settings
+from app.core.errors import RateLimitError
 
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=settings.API_V1_STR + "/token")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.now() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -30,56 +26,77 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 def get_user(db, username: str):
     return db.query(User).filter(User.username == username).first()
 
-def authenticate_user(db, username: str, password: str):
+async def authenticate_user(db, username: str, password: str, client_ip: str = None):
+    """Check credentials with bcrypt off the event loop, after the per-IP and per-user limits"""
+    client_ip = client_ip or "unknown"
+    login_stats.attempts += 1
+    try:
+        ip_limiter.check(client_ip)
+        user_limiter.check(username)
+    except RateLimitError:
+        login_stats.rate_limited += 1
+        raise
+    # Counted before hashing, so a concurrent burst cannot overshoot the limit
+    ip_limiter.hit(client_ip)
+
     user = get_user(db, username)
-    if not user or not verify_password(password, user.hashed_password):
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not valid:
+        # Only failed attempts count against the username, and a successful login clears them
+        user_limiter.hit(username)
+        login_stats.failed += 1
         return False
+    user_limiter.clear(username)
+    if new_hash:
+        # Stored with outdated cost parameters
+        user.hashed_password = new_hash
+        db.commit()
+        login_stats.rehashed += 1
+    login_stats.succeeded += 1
     return user
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
+def resolve_principal(token: str, load_user: Callable[[str], Optional[User]]) -> Optional[Principal]:
+    """Authenticate a token through the principal cache; `load_user` only runs on a miss"""
+    username = principal_cache.verified_username(token)
+    if username is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        username = payload.get("sub")
         if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = get_user(db, username)
-    if user is None:
-        raise credentials_exception
-    return user
+            return None
+        principal_cache.remember_token(token, username, payload.get("exp"))
+    principal = principal_cache.get(username)
+    if principal is None:
+        user = load_user(username)
+        if user is None:
+            return None
+        principal = principal_cache.put(Principal.from_user(user))
+    return principal if principal.is_active else None
 
-def decode_access_token(token: str):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    # The session only connects when the principal is not cached
+    principal = resolve_principal(token, lambda username: get_user(db, username))
+    if principal is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
+            detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return principal
 
-async def get_current_user_websocket(token: str):
+async def get_current_user_websocket(token: str) -> Optional[Principal]:
     if not token:
         return None
-        
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-    except JWTError:
-        return None
-        
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.username == username).first()
-        return user
-    finally:
-        db.close()
\ No newline at end of file
+
+    def load_user(username: str) -> Optional[User]:
+        db = SessionLocal()
+        try:
+            return get_user(db, username)
+        finally:
+            db.close()
+
+    return resolve_principal(token, load_user)
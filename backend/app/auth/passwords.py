@@ -0,0 +1,123 @@
+"""
+Password hashing off the event loop, with admission control for logins.
+
+bcrypt costs hundreds of milliseconds of CPU per call; running it inline froze every
+transfer during a burst of logins. Hashes now run in a small thread pool (bcrypt releases
+the GIL) behind a queue limit. Login attempts are rate limited per client IP before any
+hashing happens, and failed ones per username as well, so an account locks only after
+wrong passwords and a successful login unlocks it.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from passlib.context import CryptContext
+from app.core.config import settings
+from app.core.errors import RateLimitError
+from app.core.metrics import metrics
+import asyncio
+import time
+
+# min_rounds makes hashes of a lower cost "need update", so they are rehashed on login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.AUTH_BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.AUTH_BCRYPT_ROUNDS,
+)
+
+class PasswordHasher:
+    """Bounded worker pool for bcrypt; callers beyond `queue_limit` are rejected right away"""
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self.rejected = 0
+        # Queueing plus hashing time of recent calls
+        self.durations = deque(maxlen=500)
+
+    async def run(self, function, *args):
+        if self.pending >= self.queue_limit:
+            self.rejected += 1
+            raise RateLimitError("Too many logins in progress, try again shortly", retry_after=1)
+        self.pending += 1
+        started = time.monotonic()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            self.pending -= 1
+            self.durations.append(time.monotonic() - started)
+
+    async def hash(self, password: str) -> str:
+        return await self.run(pwd_context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password; the second value is a new hash when the stored one uses outdated parameters"""
+        return await self.run(pwd_context.verify_and_update, password, hashed)
+
+    def percentile(self, rank: float) -> Optional[float]:
+        if not self.durations:
+            return None
+        ordered = sorted(self.durations)
+        return round(ordered[min(len(ordered) - 1, int(rank * len(ordered)))] * 1000, 1)
+
+class RateLimiter:
+    """Fixed-window counters per key; the whole table is dropped when the window rolls over"""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.window_start = time.monotonic()
+        self.counts: Dict[str, int] = {}
+
+    def _roll(self) -> float:
+        now = time.monotonic()
+        if now - self.window_start >= self.window:
+            self.window_start = now
+            self.counts.clear()
+        return now
+
+    def check(self, key: str):
+        """Raise RateLimitError if `key` used up its attempts in the current window"""
+        now = self._roll()
+        if self.limit and self.counts.get(key, 0) >= self.limit:
+            raise RateLimitError(
+                "Too many login attempts, try again later",
+                retry_after=int(self.window_start + self.window - now) + 1,
+            )
+
+    def hit(self, key: str):
+        self._roll()
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def clear(self, key: str):
+        self.counts.pop(key, None)
+
+class LoginStats:
+    def __init__(self):
+        self.attempts = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.rehashed = 0
+
+    def metrics(self) -> dict:
+        return {
+            "attempts": self.attempts,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "overloaded": password_hasher.rejected,
+            "rehashed": self.rehashed,
+            "hashing": password_hasher.pending,
+            "workers": password_hasher.workers,
+            "latency_p50_ms": password_hasher.percentile(0.5),
+            "latency_p95_ms": password_hasher.percentile(0.95),
+        }
+
+password_hasher = PasswordHasher(settings.AUTH_HASH_WORKERS, settings.AUTH_HASH_QUEUE_LIMIT)
+ip_limiter = RateLimiter(settings.LOGIN_RATE_LIMIT_PER_IP, settings.LOGIN_RATE_WINDOW)
+user_limiter = RateLimiter(settings.LOGIN_RATE_LIMIT_PER_USER, settings.LOGIN_RATE_WINDOW)
+login_stats = LoginStats()
+metrics.register("login", login_stats.metrics)
@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Set, Tuple
+from sqlalchemy import event, inspect
+from app.client.files_db import SessionLocal, User
+from app.core.config import settings
+from app.core.events import event_bus
+from app.core.metrics import metrics
+import asyncio
+import time
+
+# Changing any of these must drop the cached principal in every worker
+INVALIDATING_FIELDS = ("encryption_enabled", "hashed_password", "is_active")
+
+@dataclass(frozen=True)
+class Principal:
+    """Detached snapshot of the authenticated user, safe to share between requests"""
+    id: int
+    username: str
+    encryption_enabled: bool
+    is_active: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            encryption_enabled=bool(user.encryption_enabled),
+            is_active=user.is_active is not False,
+        )
+
+class PrincipalCache:
+    """
+    Verified token signatures and user principals, so authenticated requests skip
+    the JWT verification and the user lookup in the common case.
+    Principals live for `ttl` seconds; committed changes to a user's encryption, password
+    or active flag drop them right away, in every worker through the event bus.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # token -> (username, exp); exp is the token's own expiry, None if it has none
+        self.tokens: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+        # username -> (principal, cached until)
+        self.principals: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self.token_hits = 0
+        self.token_misses = 0
+        self.principal_hits = 0
+        self.principal_misses = 0
+        self.invalidations = 0
+
+    def verified_username(self, token: str) -> Optional[str]:
+        entry = self.tokens.get(token)
+        if entry is None or (entry[1] is not None and entry[1] <= time.time()):
+            if entry is not None:
+                del self.tokens[token]
+            self.token_misses += 1
+            return None
+        self.tokens.move_to_end(token)
+        self.token_hits += 1
+        return entry[0]
+
+    def remember_token(self, token: str, username: str, exp: Optional[float]):
+        self.tokens[token] = (username, exp)
+        self.tokens.move_to_end(token)
+        while len(self.tokens) > self.max_entries:
+            self.tokens.popitem(last=False)
+
+    def get(self, username: str) -> Optional[Principal]:
+        entry = self.principals.get(username)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self.principals[username]
+            self.principal_misses += 1
+            return None
+        self.principals.move_to_end(username)
+        self.principal_hits += 1
+        return entry[0]
+
+    def put(self, principal: Principal) -> Principal:
+        self.principals[principal.username] = (principal, time.monotonic() + self.ttl)
+        self.principals.move_to_end(principal.username)
+        while len(self.principals) > self.max_entries:
+            self.principals.popitem(last=False)
+        return principal
+
+    def invalidate(self, username: str):
+        if self.principals.pop(username, None) is not None:
+            self.invalidations += 1
+
+    def handle_event(self, channel: str, event: dict):
+        if channel == "auth":
+            self.invalidate(event["username"])
+
+    def metrics(self) -> dict:
+        return {
+            "tokens": len(self.tokens),
+            "principals": len(self.principals),
+            "token_hits": self.token_hits,
+            "token_misses": self.token_misses,
+            "principal_hits": self.principal_hits,
+            "principal_misses": self.principal_misses,
+            "invalidations": self.invalidations,
+        }
+
+principal_cache = PrincipalCache(settings.AUTH_CACHE_TTL, settings.AUTH_CACHE_SIZE)
+event_bus.subscribe(principal_cache.handle_event)
+metrics.register("auth_cache", principal_cache.metrics)
+
+@event.listens_for(User, "after_update")
+def _collect_changed_user(mapper, connection, user: User):
+    state = inspect(user)
+    if any(state.attrs[field].history.has_changes() for field in INVALIDATING_FIELDS):
+        changed: Set[str] = state.session.info.setdefault("changed_users", set())
+        changed.add(user.username)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_changed_users(session):
+    # After the commit, so no worker can reload the old row into its cache
+    for username in session.info.pop("changed_users", ()):
+        principal_cache.invalidate(username)
+        try:
+            asyncio.get_running_loop().create_task(event_bus.publish("auth", {"username": username}))
+        except RuntimeError:
+            pass  # no event loop: a script, nothing else to notify
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_changed_users(session):
+    session.info.pop("changed_users", None)
@@ -1,14 +1,26 @@
 import os
 from pathlib import Path
 from telethon.tl.types import DocumentAttributeFilename
-from .files_db import SessionLocal, File, Folder, User
+from .files_db import SessionLocal, File, FileReplica, Folder, User, record_change
 from datetime import datetime
 import re
+import asyncio
+import random
+import time
 from app.core.config import settings
 from sqlalchemy.orm import Session
 from app.core.errors import ExternalServiceError
-from telethon import TelegramClient
+from telethon import TelegramClient, functions
+from telethon.sessions import StringSession
+from telethon.errors import FileReferenceExpiredError, AuthKeyError, UnauthorizedError
 from app.utils.encryption import encrypt_file, decrypt_file
+from app.client.scheduler import Priority, FloodWaitDeferred
+from app.client.session_pool import SessionPool, PooledSession
+from app.client.placement import placement_policy
+from app.client.hedging import LatencyTracker
+from app.client.crypto_backend import install_crypto_backend
+from app.core.metrics import metrics
+from app.core.logging import logger
 
 # Use configurable paths
 BASE_DIR = Path(__file__).parent.parent.parent
@@ -30,21 +42,147 @@ except PermissionError as e:
     SESSION_DIR = BASE_DIR
     SESSION_FILE = SESSION_DIR / "tgcloud_session.session"
 
+# Telegram serves at most 512 KB per upload.getFile request, and a request may not cross a
+# 1 MB boundary: ranged reads fetch whole 512 KB-aligned parts and slice them
+RANGE_REQUEST_SIZE = 512 * 1024
+
+# Swap Telethon's AES-IGE for a native implementation before any connection is made
+crypto_backend = install_crypto_backend()
+
 telegram_client = TelegramClient(str(SESSION_FILE.with_suffix('')), settings.TG_API_ID, settings.TG_API_HASH)
 chat_id = settings.TG_CHAT_ID
-
+storage_channels = settings.TG_CHAT_IDS
+
+def _build_session_pool() -> SessionPool:
+    """The primary user session first, then extra user sessions and bots from the settings"""
+    pool = SessionPool()
+    pool.add(PooledSession("primary", telegram_client, storage_channels))
+    for index, session_string in enumerate(settings.TG_EXTRA_SESSIONS):
+        client = TelegramClient(StringSession(session_string), settings.TG_API_ID, settings.TG_API_HASH)
+        pool.add(PooledSession(f"user_{index + 1}", client, storage_channels))
+    for index, bot_token in enumerate(settings.TG_BOT_TOKENS):
+        # Bots keep a session file so restarts do not re-import the authorization
+        client = TelegramClient(str(SESSION_DIR / f"tgcloud_bot_{index + 1}"), settings.TG_API_ID, settings.TG_API_HASH)
+        pool.add(PooledSession(f"bot_{index + 1}", client, storage_channels, bot_token=bot_token))
+    for session in pool.sessions:
+        # FloodWait errors must reach the scheduler instead of being slept through inside Telethon
+        session.client.flood_sleep_threshold = 0
+    return pool
+
+session_pool = _build_session_pool()
+primary_session = session_pool.primary
+telegram_scheduler = primary_session.scheduler
+document_cache = primary_session.document_cache
+metrics.register("telegram_sessions", session_pool.metrics)
+first_byte_latency = LatencyTracker()
+metrics.register("hedged_reads", first_byte_latency.metrics)
+
+def set_telegram_authorized(authorized):
+    """Record a known authorization state of the primary session, e.g. after signing in"""
+    primary_session.authorized = authorized
+    if not authorized:
+        primary_session.storage_peers.clear()
+
+async def _check_session_authorized(session: PooledSession, refresh: bool = False) -> bool:
+    if refresh or session.authorized is None:
+        if not session.client.is_connected():
+            await session.client.connect()
+        if session.bot_token and not await session.client.is_user_authorized():
+            await session.scheduler.call(
+                "auth", lambda: session.client.sign_in(bot_token=session.bot_token), Priority.INTERACTIVE
+            )
+        authorized = await session.scheduler.call(
+            "is_user_authorized", session.client.is_user_authorized, Priority.INTERACTIVE
+        )
+        if session is primary_session:
+            authorized = authorized and SESSION_FILE.exists()
+        session.authorized = authorized
+        if not authorized:
+            session.storage_peers.clear()
+    return session.authorized
+
+async def check_telegram_authorized(refresh: bool = False) -> bool:
+    return await _check_session_authorized(primary_session, refresh)
 
 async def ensure_telegram_ready():
     if not telegram_client.is_connected():
         await telegram_client.connect()
 
-    if not SESSION_FILE.exists():
+    if not await check_telegram_authorized():
         raise ExternalServiceError("Telegram", "Not authorized")
-    
-    if not await telegram_client.is_user_authorized():
-        raise ExternalServiceError("Telegram", "Not authorized")
-    
-async def upload_file_to_tgcloud(file_path: str, folder: str = "default", db_session: Session = None, username: str = None, progress_callback=None):
+
+async def _warm_up_session(session: PooledSession) -> bool:
+    if not await _check_session_authorized(session):
+        return False
+    for channel in session.chat_ids:
+        if channel in session.storage_peers:
+            continue
+        session.storage_peers[channel] = await session.scheduler.call(
+            "get_input_entity", lambda: session.client.get_input_entity(channel), Priority.INTERACTIVE
+        )
+        logger.info("Telegram storage channel resolved", extra_fields={"session": session.name, "chat_id": channel})
+    return True
+
+async def warm_up_telegram():
+    """Connect, check authorization and resolve the storage channel ahead of the first request"""
+    return await _warm_up_session(primary_session)
+
+async def _keep_session_alive(session: PooledSession, interval: int):
+    try:
+        if session.client.is_connected() and session.authorized:
+            await asyncio.wait_for(
+                session.scheduler.call(
+                    "ping",
+                    lambda: session.client(functions.PingRequest(ping_id=random.getrandbits(63))),
+                    Priority.INTERACTIVE
+                ),
+                timeout=interval
+            )
+        if await _warm_up_session(session):
+            session.record_success()
+    except asyncio.CancelledError:
+        raise
+    except (AuthKeyError, UnauthorizedError) as e:
+        logger.warning("Telegram session is no longer authorized", extra_fields={"session": session.name, "error": str(e)})
+        session.authorized = False
+        session.storage_peers.clear()
+    except Exception as e:
+        session.record_failure(e)
+        logger.warning("Telegram keepalive failed, reconnecting", extra_fields={"session": session.name, "error": str(e)})
+        try:
+            await session.client.disconnect()
+            await session.client.connect()
+        except Exception as e:
+            logger.error("Telegram reconnect failed", extra_fields={"session": session.name, "error": str(e)})
+
+async def telegram_supervisor(interval: int = settings.TG_KEEPALIVE_SECONDS):
+    """Keep every pooled Telegram connection warm, reconnecting proactively when a ping fails"""
+    while True:
+        await asyncio.gather(*(_keep_session_alive(session, interval) for session in session_pool.sessions))
+        await asyncio.sleep(interval)
+
+async def disconnect_telegram():
+    for session in session_pool.sessions:
+        if session.client.is_connected():
+            await session.client.disconnect()
+
+def document_metadata(document) -> dict:
+    """Catalog metadata Telegram reports for a stored document"""
+    metadata = {
+        "document_id": document.id,
+        "dc_id": document.dc_id,
+    }
+    for attribute in document.attributes:
+        duration = getattr(attribute, "duration", None)
+        if duration:
+            metadata["duration"] = float(duration)
+        if getattr(attribute, "w", None) and getattr(attribute, "h", None):
+            metadata["width"] = attribute.w
+            metadata["height"] = attribute.h
+    return metadata
+
+async def upload_file_to_tgcloud(file_path: str, folder: str = "default", db_session: Session = None, username: str = None, progress_callback=None, metadata: dict = None):
+    """Store a file; returns its catalog row and the id of the change recording it"""
     close_db = False
     if db_session is None:
         db_session = SessionLocal()
@@ -78,49 +216,77 @@ async def upload_file_to_tgcloud(file_path: str, folder: str = "default", db_ses
     if not telegram_client.is_connected():
         await telegram_client.connect()
 
-    uploaded_file = await telegram_client.upload_file(
-        file_path,
-        part_size_kb=512,
-        progress_callback=progress_callback
+    target_chat = placement_policy.choose(db_session, folder, os.path.getsize(file_path))
+
+    # The uploaded parts belong to the session that uploaded them, so send through the same one
+    session = session_pool.acquire()
+    uploaded_file = await session_pool.run(
+        "upload_file",
+        lambda s: s.client.upload_file(
+            file_path,
+            part_size_kb=512,
+            progress_callback=progress_callback
+        ),
+        Priority.TRANSFER,
+        measure_latency=False,
+        session=session
     )
 
-    message = await telegram_client.send_file(
-        chat_id,
-        file=uploaded_file,
-        caption=filename,
-        attributes=[DocumentAttributeFilename(filename)],
-        force_document=True
+    message = await session_pool.run(
+        "send_file",
+        lambda s: s.client.send_file(
+            s.storage_chat(target_chat),
+            file=uploaded_file,
+            caption=filename,
+            attributes=[DocumentAttributeFilename(filename)],
+            force_document=True
+        ),
+        Priority.TRANSFER,
+        session=session
     )
 
     uploaded_at = message.date if hasattr(message, "date") and message.date else datetime.now()
 
+    file_metadata = dict(metadata or {})
+    if message.document:
+        for key, value in document_metadata(message.document).items():
+            if file_metadata.get(key) is None:
+                file_metadata[key] = value
+
     db_file = File(
         folder=folder,
         filename=filename,
         message_id=message.id,
+        chat_id=target_chat,
         size=str(os.path.getsize(file_path)),
         encrypted=encrypted,
         original_name=os.path.basename(file_path) if not encrypted else os.path.basename(file_path).replace("encrypted_", "", 1),
-        uploaded_at=uploaded_at
+        uploaded_at=uploaded_at,
+        **file_metadata
     )
     db_session.add(db_file)
-    db_session.commit()
-    db_session.refresh(db_file)
 
-    folder = db_session.query(Folder).filter_by(name=folder).first()
+    # The folder counters go in the same commit as the change entry, so listings validated
+    # against the change cursor never see the file without them
+    folder_db = db_session.query(Folder).filter_by(name=folder).first()
 
-    if folder:
-        if folder.message_ids:
-            folder.message_ids += f",{message.id}"
+    if folder_db:
+        if folder_db.message_ids:
+            folder_db.message_ids += f",{message.id}"
         else:
-            folder.message_ids = str(message.id)
+            folder_db.message_ids = str(message.id)
         
-        if folder.file_count is None:
-            folder.file_count = 1
+        if folder_db.file_count is None:
+            folder_db.file_count = 1
         else:
-            folder.file_count += 1
-        
-        db_session.commit()
+            folder_db.file_count += 1
+
+    change = record_change(db_session, "file_uploaded", folder, filename)
+    db_session.commit()
+    db_session.refresh(db_file)
+    change_id = change.id
+
+    await replicate_file(db_session, db_file)
 
     if os.path.exists(file_path):
         os.remove(file_path)
@@ -128,9 +294,9 @@ async def upload_file_to_tgcloud(file_path: str, folder: str = "default", db_ses
     if close_db:
         db_session.close()
 
-    return db_file
+    return db_file, change_id
 
-async def download_file_from_tgcloud(filename: str, folder: str ="default", db_session: Session = None, progress_callback=None):
+async def download_file_from_tgcloud(filename: str, folder: str ="default", db_session: Session = None, progress_callback=None, priority: Priority = Priority.TRANSFER):
     close_db = False
 
     if db_session is None:
@@ -143,22 +309,27 @@ async def download_file_from_tgcloud(filename: str, folder: str ="default", db_s
             db_session.close()
         return None
 
-    message = await telegram_client.get_messages(chat_id, ids=db_file.message_id)
-    if not message or not message.document:
+    DOWNLOADS_DIR.mkdir(parents=True, exist_ok=True)
+    download_path = DOWNLOADS_DIR / db_file.filename
+
+    try:
+        found = await download_copies(
+            db_file.copies,
+            str(download_path),
+            part_size_kb=1024*2,
+            progress_callback=progress_callback,
+            priority=priority
+        )
+    except BaseException:
+        # A failed or cancelled transfer leaves a partial file behind
+        if os.path.exists(download_path):
+            os.remove(download_path)
+        raise
+    if not found:
         if close_db:
             db_session.close()
         return None, None
 
-    DOWNLOADS_DIR.mkdir(parents=True, exist_ok=True)
-    download_path = DOWNLOADS_DIR / db_file.filename
-    
-    await telegram_client.download_file(
-        message.document,
-        file=str(download_path),
-        part_size_kb=1024*2,
-        progress_callback=progress_callback
-    )
-
     if db_file.encrypted:
         decrypt_file(download_path)
 
@@ -170,7 +341,253 @@ async def download_file_from_tgcloud(filename: str, folder: str ="default", db_s
 
     return download_path, db_file.original_name
 
+def replica_channels(primary_chat: int):
+    """Channels that hold the extra copies of a file stored in `primary_chat`"""
+    channels = list(storage_channels)
+    if primary_chat not in channels:
+        return []
+    start = channels.index(primary_chat)
+    count = min(settings.TG_REPLICATION_FACTOR, len(channels)) - 1
+    return [channels[(start + offset) % len(channels)] for offset in range(1, count + 1)]
+
+async def replicate_file(db_session: Session, db_file: File):
+    """Copy a freshly stored file into the replica channels. A failed copy is logged and
+    skipped: the file stays readable from its primary copy."""
+    for target in replica_channels(db_file.storage_chat_id):
+        try:
+            message = await copy_message_to_channel(db_file.storage_chat_id, db_file.message_id, target)
+        except Exception as e:
+            logger.warning("Could not replicate file", extra_fields={"file_id": db_file.id, "target": target, "error": str(e)})
+            continue
+        if message is not None:
+            db_session.add(FileReplica(file_id=db_file.id, chat_id=target, message_id=message.id))
+    db_session.commit()
+
+async def download_copies(copies, file, part_size_kb: int = None, progress_callback=None, thumb: bool = False, priority: Priority = Priority.TRANSFER):
+    """Download a document stored as several (channel, message id) copies.
+    Interactive reads are hedged: when the first copy has not delivered a byte within the
+    usual time-to-first-byte percentile, the next copy is requested too, whichever starts
+    delivering first is kept and the other request is cancelled. Other reads try the copies
+    in order, moving on when one fails. Hedged file downloads write to a side path that
+    replaces `file` if it wins. The last error is raised only when every copy failed."""
+    copies = list(copies)
+    if priority != Priority.INTERACTIVE or len(copies) < 2:
+        error = None
+        for chat, message_id in copies:
+            try:
+                result = await download_document(chat, message_id, file, part_size_kb, progress_callback, thumb, priority)
+            except Exception as e:
+                error = e
+                _copy_failed(chat, message_id, e)
+                continue
+            if result:
+                return result
+        if error is not None:
+            raise error
+        return False
+
+    winner = None
+    first_byte = asyncio.Event()
+
+    def target(index):
+        return file if file is bytes or index == 0 else f"{file}.copy{index}"
+
+    def start(index):
+        chat, message_id = copies[index]
+        started = time.monotonic()
+
+        def on_progress(current, total):
+            nonlocal winner
+            if winner is None:
+                winner = index
+                first_byte_latency.record(time.monotonic() - started)
+                first_byte.set()
+            if winner == index and progress_callback:
+                return progress_callback(current, total)
+
+        return asyncio.create_task(
+            download_document(chat, message_id, target(index), part_size_kb, on_progress, thumb, priority)
+        )
+
+    tasks = [start(0)]
+    signal = asyncio.create_task(first_byte.wait())
+    try:
+        while winner is None:
+            running = [task for task in tasks if not task.done()]
+            can_hedge = len(tasks) < len(copies)
+            if not running:
+                if not can_hedge:
+                    break
+                # Every request so far failed or found nothing: go straight to the next copy
+                tasks.append(start(len(tasks)))
+                continue
+            done, _ = await asyncio.wait(
+                running + [signal],
+                timeout=first_byte_latency.hedge_delay() if can_hedge else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                first_byte_latency.hedged += 1
+                tasks.append(start(len(tasks)))
+                continue
+            for task in done:
+                if task is not signal and winner is None and task.exception() is None and task.result():
+                    winner = tasks.index(task)
+
+        for index, task in enumerate(tasks):
+            if index != winner:
+                task.cancel()
+        if winner is None:
+            errors = [task.exception() for task in tasks if not task.cancelled() and task.exception()]
+            if errors:
+                raise errors[-1]
+            return False
+
+        result = await tasks[winner]
+        if winner > 0:
+            first_byte_latency.hedge_wins += 1
+            if result and file is not bytes:
+                os.replace(target(winner), file)
+        return result
+    finally:
+        signal.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if file is not bytes:
+            for index in range(1, len(tasks)):
+                if os.path.exists(target(index)):
+                    os.remove(target(index))
+
+async def download_document(chat: int, message_id: int, file, part_size_kb: int = None, progress_callback=None, thumb: bool = False, priority: Priority = Priority.TRANSFER):
+    """Download a stored document (or its largest thumbnail) through the location cache
+    of the least loaded session. Returns False when the message no longer holds a document."""
+    tried = []
+    refreshed = False
+    while True:
+        session = session_pool.acquire(exclude=tried)
+        # Resolve before taking a transfer slot so lookups never queue behind their own download
+        location = await session.document_cache.resolve(chat, message_id)
+        if not location or (thumb and not location.thumb_size):
+            return False
+        try:
+            result = await session_pool.run(
+                "download_file",
+                lambda s: s.client.download_file(
+                    location.input_location(location.thumb_size if thumb else ""),
+                    file=file,
+                    part_size_kb=part_size_kb,
+                    file_size=None if thumb else location.size,
+                    progress_callback=progress_callback,
+                    dc_id=location.dc_id
+                ),
+                priority,
+                measure_latency=thumb,
+                session=session,
+                move_on_flood=True
+            )
+            return result if file is bytes else True
+        except FloodWaitDeferred:
+            tried.append(session)
+        except FileReferenceExpiredError:
+            if refreshed:
+                raise
+            refreshed = True
+            logger.debug("File reference expired, refreshing", extra_fields={"message_id": message_id})
+            await session.document_cache.refresh(chat, message_id)
+
+async def read_document_range(copies, offset: int, limit: int, priority: Priority = Priority.TRANSFER):
+    """Read up to `limit` bytes at `offset` of a stored document without downloading the rest.
+    Returns fewer bytes at the end of the document and None when no copy holds it; a copy
+    that fails is skipped, and the last error raised only when every copy failed."""
+    error = None
+    for chat, message_id in copies:
+        try:
+            data = await _read_range(chat, message_id, offset, limit, priority)
+        except Exception as e:
+            error = e
+            _copy_failed(chat, message_id, e)
+            continue
+        if data is not None:
+            return data
+    if error is not None:
+        raise error
+    return None
+
+def _copy_failed(chat: int, message_id: int, error: Exception):
+    logger.warning("Could not read stored copy, trying the next one", extra_fields={
+        "chat_id": chat, "message_id": message_id, "error": f"{type(error).__name__}: {error}"
+    })
+
+async def _read_range(chat: int, message_id: int, offset: int, limit: int, priority: Priority):
+    tried = []
+    refreshed = False
+    while True:
+        session = session_pool.acquire(exclude=tried)
+        location = await session.document_cache.resolve(chat, message_id)
+        if not location:
+            return None
+        if offset >= location.size or limit <= 0:
+            return b""
+
+        aligned = offset - offset % RANGE_REQUEST_SIZE
+        end = min(offset + limit, location.size)
+
+        async def collect(s: PooledSession) -> bytes:
+            buffer = bytearray()
+            async for chunk in s.client.iter_download(
+                location.input_location(),
+                offset=aligned,
+                limit=-(-(end - aligned) // RANGE_REQUEST_SIZE),
+                request_size=RANGE_REQUEST_SIZE,
+                file_size=location.size,
+                dc_id=location.dc_id
+            ):
+                buffer += chunk
+            return bytes(buffer[offset - aligned:][:limit])
+
+        try:
+            return await session_pool.run(
+                "download_file", collect, priority, measure_latency=False, session=session, move_on_flood=True
+            )
+        except FloodWaitDeferred:
+            tried.append(session)
+        except FileReferenceExpiredError:
+            if refreshed:
+                raise
+            refreshed = True
+            await session.document_cache.refresh(chat, message_id)
+
+def invalidate_document(chat: int, message_id: int):
+    for session in session_pool.sessions:
+        session.document_cache.invalidate(chat, message_id)
+
+def _group_by_channel(files, include_replicas: bool = False):
+    grouped = {}
+    for file in files:
+        copies = file.copies if include_replicas else [(file.storage_chat_id, file.message_id)]
+        for chat, message_id in copies:
+            grouped.setdefault(chat, []).append(message_id)
+    return grouped
+
+async def resolve_document_locations(files):
+    """Warm the location cache for many files with batched lookups per channel"""
+    if not files or not telegram_client.is_connected():
+        return
+    try:
+        session = session_pool.acquire()
+        for chat, message_ids in _group_by_channel(files).items():
+            await session.document_cache.resolve_many(chat, message_ids)
+    except Exception as e:
+        logger.warning("Could not resolve document locations", extra_fields={"error": str(e)})
+
+async def download_thumbnail_from_tgcloud(copies, priority: Priority = Priority.INTERACTIVE):
+    """Download the largest thumbnail Telegram attached to the document, if any"""
+    data = await download_copies(copies, bytes, thumb=True, priority=priority)
+    return data or None
+
 async def delete_file_from_tgcloud(filename: str, folder: str = "default", db_session: Session = None):
+    """Delete a file; returns the id of the change recording it, None if there is no such file"""
     close_db = False
     if db_session is None:
         db_session = SessionLocal()
@@ -180,38 +597,84 @@ async def delete_file_from_tgcloud(filename: str, folder: str = "default", db_se
     if not db_file:
         if close_db:
             db_session.close()
-        return False
+        return None
+
+    for chat, message_ids in _group_by_channel([db_file], include_replicas=True).items():
+        await delete_stored_messages(chat, message_ids)
 
-    await telegram_client.delete_messages(chat_id, db_file.message_id)
+    # As for uploads, the folder counters are committed together with the change entry
+    folder_db = db_session.query(Folder).filter_by(name=folder).first()
+    if folder_db:
+        folder_db.file_count = max(0, (folder_db.file_count or 0) - 1)
+        if folder_db.message_ids:
+            folder_db.message_ids = ",".join(
+                mid for mid in folder_db.message_ids.split(",") if mid and mid != str(db_file.message_id)
+            )
 
     db_session.delete(db_file)
+    change = record_change(db_session, "file_deleted", folder, filename)
     db_session.commit()
+    change_id = change.id
 
     if close_db:
         db_session.close()
 
-    return True
+    return change_id
 
 async def delete_folder_from_tgcloud(folder: str, db_session: Session = None):
+    """Delete the files of a folder; returns the ids of the changes recording it, None if there is no such folder"""
     close_db = False
     if db_session is None:
         db_session = SessionLocal()
         close_db = True
 
     folder_obj = db_session.query(Folder).filter_by(name=folder).first()
-    if not folder_obj or not folder_obj.message_ids:
+    if not folder_obj:
         if close_db:
             db_session.close()
-        return False
+        return None
 
-    message_ids_parsed = [mid for mid in folder_obj.message_ids.split(",") if mid]
-    for message_id in message_ids_parsed:
-        await telegram_client.delete_messages(chat_id, int(message_id))
+    # Delete by catalog rows: message ids are only unique within a channel
+    files = db_session.query(File).filter_by(folder=folder).all()
+    for chat, message_ids in _group_by_channel(files, include_replicas=True).items():
+        await delete_stored_messages(chat, message_ids)
 
+    changes = [record_change(db_session, "file_deleted", folder, file.filename) for file in files]
+    # Bulk deletes skip the ORM cascade, so drop the replica rows explicitly
+    db_session.query(FileReplica).filter(FileReplica.file_id.in_([file.id for file in files])).delete(synchronize_session=False)
     db_session.query(File).filter_by(folder=folder).delete()
+    db_session.flush()
+    change_ids = [change.id for change in changes]
     db_session.commit()
 
     if close_db:
         db_session.close()
 
-    return True
\ No newline at end of file
+    return change_ids
+
+async def delete_stored_messages(chat: int, message_ids):
+    """Delete messages from a storage channel, up to 100 per request"""
+    message_ids = list(message_ids)
+    for start in range(0, len(message_ids), 100):
+        batch = message_ids[start:start + 100]
+        await session_pool.run(
+            "delete_messages",
+            lambda s: s.client.delete_messages(s.storage_chat(chat), batch),
+            Priority.BULK
+        )
+        for message_id in batch:
+            invalidate_document(chat, message_id)
+
+async def copy_message_to_channel(chat: int, message_id: int, target_chat: int):
+    """Copy a stored message into another channel server-side, without re-uploading the bytes.
+    Returns the new message, or None when the source no longer holds a document."""
+    message = await session_pool.run(
+        "forward_messages",
+        lambda s: s.client.forward_messages(
+            s.storage_chat(target_chat), message_id, s.storage_chat(chat), drop_author=True, silent=True
+        ),
+        Priority.BULK
+    )
+    if not message or not message.document:
+        return None
+    return message
@@ -0,0 +1,200 @@
+"""
+AES-IGE backend selection for Telethon's MTProto encryption.
+
+Telethon encrypts every MTProto message with AES-IGE and uses `cryptg` when installed,
+then the system libssl, otherwise pure-Python `pyaes`, which caps transfers at a few
+hundred KB/s per core. Telethon's libssl wrapper copies every buffer byte by byte
+through ctypes, so it is replaced by a zero-copy call into the same library; without
+a system libssl, IGE is built on the `cryptography` package (AES block operations in
+OpenSSL, IGE chaining in Python). The active backend is checked against known-answer
+vectors before use.
+
+Run `python -m app.client.crypto_backend` to benchmark every available backend.
+"""
+import ctypes
+import os
+import time
+import pyaes
+from telethon.crypto import aes as telethon_aes
+from telethon.crypto import libssl
+from app.core.logging import logger
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
+
+# (key, iv, plaintext, ciphertext); the first vector is from OpenSSL's IGE test suite
+KNOWN_ANSWERS = [
+    (
+        bytes(range(16)),
+        bytes(range(32)),
+        bytes(32),
+        bytes.fromhex("1a8519a6557be652e9da8e43da4ef4453cf456b4ca488aa383c79c98b34797cb"),
+    ),
+    (
+        bytes(range(32)),
+        bytes(range(32, 64)),
+        bytes(range(64)),
+        bytes.fromhex(
+            "42e66e1a756cccf5b27acc47523ad074ee39bf54e3db37bbdf415df6b400fca9"
+            "77f708327c9e9341cc3dc8efd31e76463daa65b1f0d0252f790d77f1824a662c"
+        ),
+    ),
+]
+
+def _xor(a: bytes, b: bytes) -> bytes:
+    return (int.from_bytes(a, "big") ^ int.from_bytes(b, "big")).to_bytes(16, "big")
+
+def cryptography_encrypt_ige(plain_text: bytes, key: bytes, iv: bytes) -> bytes:
+    padding = len(plain_text) % 16
+    if padding:
+        plain_text += os.urandom(16 - padding)
+    block = Cipher(algorithms.AES(key), modes.ECB()).encryptor().update
+    iv1, iv2 = iv[:16], iv[16:]
+    out = bytearray()
+    for start in range(0, len(plain_text), 16):
+        chunk = plain_text[start:start + 16]
+        iv1 = _xor(block(_xor(chunk, iv1)), iv2)
+        iv2 = chunk
+        out += iv1
+    return bytes(out)
+
+def cryptography_decrypt_ige(cipher_text: bytes, key: bytes, iv: bytes) -> bytes:
+    block = Cipher(algorithms.AES(key), modes.ECB()).decryptor().update
+    iv1, iv2 = iv[:16], iv[16:]
+    out = bytearray()
+    for start in range(0, len(cipher_text) - len(cipher_text) % 16, 16):
+        chunk = cipher_text[start:start + 16]
+        iv2 = _xor(block(_xor(chunk, iv2)), iv1)
+        iv1 = chunk
+        out += iv2
+    return bytes(out)
+
+_libcrypto = getattr(libssl, "_libssl", None)
+
+def _openssl_ige(data: bytes, key: bytes, iv: bytes, encrypt: bool) -> bytes:
+    aes_key = libssl.AES_KEY()
+    set_key = _libcrypto.AES_set_encrypt_key if encrypt else _libcrypto.AES_set_decrypt_key
+    set_key(key, ctypes.c_int(8 * len(key)), ctypes.byref(aes_key))
+    out = ctypes.create_string_buffer(len(data))
+    _libcrypto.AES_ige_encrypt(
+        data,
+        out,
+        ctypes.c_size_t(len(data)),
+        ctypes.byref(aes_key),
+        ctypes.create_string_buffer(iv, len(iv)),  # OpenSSL updates the IV in place
+        ctypes.c_int(1 if encrypt else 0)
+    )
+    return out.raw
+
+def openssl_encrypt_ige(plain_text: bytes, key: bytes, iv: bytes) -> bytes:
+    padding = len(plain_text) % 16
+    if padding:
+        plain_text += os.urandom(16 - padding)
+    return _openssl_ige(plain_text, key, iv, True)
+
+def openssl_decrypt_ige(cipher_text: bytes, key: bytes, iv: bytes) -> bytes:
+    return _openssl_ige(cipher_text, key, iv, False)
+
+def detect_backend() -> str:
+    """Name of the implementation Telethon's AES class currently uses"""
+    if telethon_aes.AES.encrypt_ige is openssl_encrypt_ige:
+        return "openssl"
+    if telethon_aes.AES.encrypt_ige is cryptography_encrypt_ige:
+        return "cryptography"
+    if telethon_aes.cryptg:
+        return "cryptg"
+    if libssl.encrypt_ige and libssl.decrypt_ige:
+        return "libssl"
+    return "pyaes"
+
+def verify_backend() -> bool:
+    for key, iv, plain_text, cipher_text in KNOWN_ANSWERS:
+        if telethon_aes.AES.encrypt_ige(plain_text, key, iv) != cipher_text:
+            return False
+        if telethon_aes.AES.decrypt_ige(cipher_text, key, iv) != plain_text:
+            return False
+    return True
+
+def _use(encrypt, decrypt):
+    telethon_aes.AES.encrypt_ige = staticmethod(encrypt)
+    telethon_aes.AES.decrypt_ige = staticmethod(decrypt)
+
+_TELETHON_ENCRYPT = telethon_aes.AES.__dict__["encrypt_ige"]
+_TELETHON_DECRYPT = telethon_aes.AES.__dict__["decrypt_ige"]
+
+def _restore_telethon():
+    telethon_aes.AES.encrypt_ige = _TELETHON_ENCRYPT
+    telethon_aes.AES.decrypt_ige = _TELETHON_DECRYPT
+
+def install_crypto_backend() -> str:
+    """Make sure Telethon runs on a native AES-IGE backend and return the active backend's name"""
+    backend = detect_backend()
+    if backend == "cryptg":
+        candidates = []
+    else:
+        candidates = [("openssl", openssl_encrypt_ige, openssl_decrypt_ige)] if _libcrypto else []
+        if Cipher is not None:
+            candidates.append(("cryptography", cryptography_encrypt_ige, cryptography_decrypt_ige))
+
+    for name, encrypt, decrypt in candidates:
+        _use(encrypt, decrypt)
+        try:
+            if verify_backend():
+                return name
+            logger.warning("AES-IGE backend failed its self-test", extra_fields={"backend": name})
+        except (AttributeError, OSError) as e:
+            # e.g. a libssl build without the legacy AES_* symbols
+            logger.warning("AES-IGE backend unavailable", extra_fields={"backend": name, "error": str(e)})
+        _restore_telethon()
+
+    if verify_backend():
+        return detect_backend()
+    logger.error("AES-IGE backend failed its self-test, using pure Python", extra_fields={"backend": backend})
+    telethon_aes.cryptg = None
+    libssl.encrypt_ige = libssl.decrypt_ige = None
+    return "pyaes"
+
+def _pyaes_ige(data: bytes, key: bytes, iv: bytes) -> bytes:
+    """Telethon's pure-Python path, used as the benchmark baseline"""
+    cipher = pyaes.AES(key)
+    iv1, iv2 = list(iv[:16]), list(iv[16:])
+    out = []
+    for start in range(0, len(data), 16):
+        chunk = list(data[start:start + 16])
+        block = cipher.encrypt([a ^ b for a, b in zip(chunk, iv1)])
+        iv1 = [a ^ b for a, b in zip(block, iv2)]
+        iv2 = chunk
+        out.extend(iv1)
+    return bytes(out)
+
+def benchmark(size: int = 1024 * 1024, seconds: float = 1.0) -> dict:
+    """Single-core encryption throughput in MB/s of every available backend"""
+    candidates = {"pyaes": _pyaes_ige}
+    if Cipher is not None:
+        candidates["cryptography"] = cryptography_encrypt_ige
+    if libssl.encrypt_ige:
+        candidates["libssl"] = libssl.encrypt_ige
+    if _libcrypto:
+        candidates["openssl"] = openssl_encrypt_ige
+    if telethon_aes.cryptg:
+        candidates["cryptg"] = telethon_aes.cryptg.encrypt_ige
+
+    key, iv = os.urandom(32), os.urandom(32)
+    results = {}
+    for name, encrypt in candidates.items():
+        # The pure-Python baseline is too slow for full-size buffers
+        data = os.urandom(size if name != "pyaes" else size // 16)
+        processed = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            encrypt(data, key, iv)
+            processed += len(data)
+        results[name] = round(processed / (time.perf_counter() - start) / (1024 * 1024), 2)
+    return results
+
+if __name__ == "__main__":
+    print(f"active backend: {install_crypto_backend()}")
+    for name, rate in benchmark().items():
+        print(f"{name:>12}: {rate:8.2f} MB/s per core")
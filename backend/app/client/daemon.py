@@ -0,0 +1,180 @@
+"""
+Transfer daemon: the only process holding the Telegram sessions.
+
+API workers started with TRANSFER_DAEMON_SOCKET send their Telegram work here over a
+Unix socket (protocol in app.client.ipc), so the API can run with as many uvicorn
+workers as there are cores. Run it next to the API with the same environment:
+
+    python -m app.client.daemon
+"""
+from typing import Dict
+from app.client.files_db import SessionLocal, File, init_db
+from app.client.ipc import LINE_LIMIT, encode_line
+from app.client.local_transfers import LocalTransfers
+from app.client.scheduler import Priority
+from app.core.config import settings
+from app.core.errors import TgCloudError
+from app.core.logging import logger, setup_logging
+from app.core.metrics import metrics
+import asyncio
+import base64
+import json
+import os
+
+class TransferDaemon:
+    def __init__(self, path: str, transfers: LocalTransfers):
+        self.path = path
+        self.transfers = transfers
+        self.active: Dict[str, int] = {}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        def progress(current, total):
+            writer.write(encode_line({"type": "progress", "current": current, "total": total}))
+
+        op = None
+        db = SessionLocal()
+        try:
+            request = json.loads(await reader.readline())
+            op = request["op"]
+            handler = getattr(self, f"op_{op}", None)
+            if handler is None:
+                raise TgCloudError(f"Unknown transfer daemon operation: {op}", "TRANSFER_DAEMON_ERROR")
+            self.active[op] = self.active.get(op, 0) + 1
+            try:
+                task = asyncio.create_task(handler(db, progress, **request.get("args", {})))
+                # Clients send nothing after the request, so the connection only becomes
+                # readable when they hang up (an aborted request or a cancelled hedge)
+                hangup = asyncio.create_task(reader.read(1))
+                try:
+                    await asyncio.wait({task, hangup}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    hangup.cancel()
+                if hangup.done() and not hangup.cancelled():
+                    await self._abandon(op, task)
+                    return
+                value = task.result()
+            finally:
+                self.active[op] -= 1
+            writer.write(encode_line({"type": "result", "value": value}))
+        except TgCloudError as e:
+            writer.write(encode_line({
+                "type": "error", "message": e.message, "code": e.code, "status_code": e.status_code, "details": e.details
+            }))
+        except Exception as e:
+            logger.error("Transfer daemon operation failed", extra_fields={"op": op, "error": str(e)})
+            writer.write(encode_line({
+                "type": "error", "message": f"{type(e).__name__}: {e}", "code": "TRANSFER_DAEMON_ERROR", "status_code": 502
+            }))
+        finally:
+            db.close()
+            try:
+                await writer.drain()
+                writer.close()
+            except ConnectionError:
+                pass
+
+    async def _abandon(self, op: str, task: asyncio.Task):
+        """Stop an operation whose client went away, and remove what it produced for it"""
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        logger.info("Transfer daemon client went away", extra_fields={"op": op, "cancelled": task.cancelled()})
+        discard = getattr(self, f"discard_{op}", None)
+        if discard and not task.cancelled() and task.exception() is None:
+            discard(task.result())
+
+    def discard_download(self, value):
+        if value and os.path.exists(value[0]):
+            os.remove(value[0])
+
+    async def op_info(self, db, progress):
+        """Daemon details that do not need Telegram"""
+        return {"crypto_backend": self.transfers.crypto_backend, "active": self.active}
+
+    async def op_status(self, db, progress):
+        try:
+            authorized = await self.transfers.is_authorized()
+        except Exception:
+            authorized = False
+        return {"authorized": authorized, "crypto_backend": self.transfers.crypto_backend, "active": self.active}
+
+    async def op_ensure_ready(self, db, progress):
+        await self.transfers.ensure_ready()
+
+    async def op_send_code(self, db, progress, phone):
+        await self.transfers.send_code(phone)
+
+    async def op_sign_in(self, db, progress, phone=None, code=None, password=None):
+        return await self.transfers.sign_in(phone, code, password)
+
+    async def op_upload(self, db, progress, file_location, folder, username, metadata=None):
+        result = await self.transfers.upload(file_location, folder, db, username, progress, metadata)
+        if not result:
+            return None
+        db_file, change_id = result
+        return [db_file.id, change_id]
+
+    async def op_download(self, db, progress, filename, folder, priority=Priority.TRANSFER, tenant=None):
+        result = await self.transfers.download(filename, folder, db, progress, Priority(priority), tenant)
+        if not result or not result[0]:
+            return None
+        download_path, original_name = result
+        return [os.path.abspath(str(download_path)), original_name]
+
+    async def op_transfer_slot(self, db, progress, tenant=None):
+        async with self.transfers.transfer_slot(tenant):
+            progress(0, 0)
+            await asyncio.Event().wait()  # until the client hangs up
+
+    async def op_download_thumbnail(self, db, progress, copies, priority=Priority.INTERACTIVE):
+        data = await self.transfers.download_thumbnail([tuple(copy) for copy in copies], Priority(priority))
+        return base64.b64encode(data).decode() if data else None
+
+    async def op_read_range(self, db, progress, copies, offset, limit, priority=Priority.TRANSFER, tenant=None):
+        data = await self.transfers.read_range([tuple(copy) for copy in copies], offset, limit, Priority(priority), tenant)
+        return base64.b64encode(data).decode() if data is not None else None
+
+    async def op_delete_file(self, db, progress, filename, folder):
+        return await self.transfers.delete_file(filename, folder, db)
+
+    async def op_delete_folder(self, db, progress, folder):
+        return await self.transfers.delete_folder(folder, db)
+
+    async def op_resolve_locations(self, db, progress, file_ids):
+        await self.transfers.resolve_locations(db.query(File).filter(File.id.in_(file_ids)).all())
+
+    async def op_rebalance(self, db, progress, source=None, target=None, max_moves=None):
+        return await self.transfers.rebalance(db, source, target, max_moves)
+
+    async def op_rebalance_status(self, db, progress):
+        return await self.transfers.rebalance_status()
+
+    async def op_metrics(self, db, progress):
+        return {**metrics.collect(), "transfer_daemon": {"active": self.active}}
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)  # left behind by a previous run
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        server = await asyncio.start_unix_server(self.handle, path=self.path, limit=LINE_LIMIT)
+        os.chmod(self.path, 0o660)
+        logger.info("Transfer daemon listening", extra_fields={"socket": self.path, "crypto_backend": self.transfers.crypto_backend})
+        await self.transfers.start()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.transfers.stop()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+async def main():
+    setup_logging()
+    init_db()
+    path = settings.TRANSFER_DAEMON_SOCKET or os.path.join(settings.DB_PATH, "transfers.sock")
+    await TransferDaemon(path, LocalTransfers()).serve()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
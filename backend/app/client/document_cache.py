@@ -0,0 +1,126 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from telethon.tl.types import InputDocumentFileLocation, PhotoSize, PhotoSizeProgressive
+
+# Telegram's messages.getMessages accepts at most this many ids per call
+RESOLVE_BATCH_SIZE = 100
+
+@dataclass
+class DocumentLocation:
+    """Everything needed to download a stored document without fetching its message"""
+    chat_id: int
+    message_id: int
+    id: int
+    access_hash: int
+    file_reference: bytes
+    dc_id: int
+    size: int
+    thumb_size: Optional[str] = None
+
+    def input_location(self, thumb_size: str = "") -> InputDocumentFileLocation:
+        return InputDocumentFileLocation(
+            id=self.id,
+            access_hash=self.access_hash,
+            file_reference=self.file_reference,
+            thumb_size=thumb_size,
+        )
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        return self.chat_id, self.message_id
+
+    @classmethod
+    def from_message(cls, chat_id: int, message) -> Optional["DocumentLocation"]:
+        if not message or not message.document:
+            return None
+        document = message.document
+        return cls(
+            chat_id=chat_id,
+            message_id=message.id,
+            id=document.id,
+            access_hash=document.access_hash,
+            file_reference=document.file_reference,
+            dc_id=document.dc_id,
+            size=document.size,
+            thumb_size=_largest_thumb_type(document.thumbs),
+        )
+
+def _largest_thumb_type(thumbs) -> Optional[str]:
+    """Type of the biggest downloadable thumbnail (stripped and cached sizes are inline and tiny)"""
+    best = None
+    best_size = -1
+    for thumb in thumbs or []:
+        if isinstance(thumb, PhotoSize):
+            size = thumb.size
+        elif isinstance(thumb, PhotoSizeProgressive):
+            size = max(thumb.sizes)
+        else:
+            continue
+        if size > best_size:
+            best, best_size = thumb.type, size
+    return best
+
+class DocumentCache:
+    """Bounded LRU cache of resolved document locations keyed by (chat id, message id).
+    `fetch_messages` receives a chat id and a list of message ids and returns the matching messages."""
+
+    def __init__(self, fetch_messages: Callable[[int, List[int]], Awaitable[list]], max_entries: int):
+        self.fetch_messages = fetch_messages
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple[int, int], DocumentLocation]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chat_id: int, message_id: int) -> Optional[DocumentLocation]:
+        location = self.entries.get((chat_id, message_id))
+        if location is not None:
+            self.entries.move_to_end((chat_id, message_id))
+        return location
+
+    def put(self, location: DocumentLocation):
+        self.entries[location.key] = location
+        self.entries.move_to_end(location.key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, chat_id: int, message_id: int):
+        self.entries.pop((chat_id, message_id), None)
+
+    async def resolve(self, chat_id: int, message_id: int) -> Optional[DocumentLocation]:
+        location = self.get(chat_id, message_id)
+        if location is not None:
+            self.hits += 1
+            return location
+        self.misses += 1
+        return (await self._fetch(chat_id, [message_id])).get(message_id)
+
+    async def refresh(self, chat_id: int, message_id: int) -> Optional[DocumentLocation]:
+        """Drop the cached entry and fetch a fresh file reference"""
+        self.invalidate(chat_id, message_id)
+        return (await self._fetch(chat_id, [message_id])).get(message_id)
+
+    async def resolve_many(self, chat_id: int, message_ids: Iterable[int]) -> Dict[int, DocumentLocation]:
+        """Resolve several message ids of one chat, fetching only the uncached ones in batched calls"""
+        resolved = {}
+        missing = []
+        for message_id in dict.fromkeys(message_ids):
+            location = self.get(chat_id, message_id)
+            if location is not None:
+                resolved[message_id] = location
+            else:
+                missing.append(message_id)
+
+        for start in range(0, len(missing), RESOLVE_BATCH_SIZE):
+            resolved.update(await self._fetch(chat_id, missing[start:start + RESOLVE_BATCH_SIZE]))
+        return resolved
+
+    async def _fetch(self, chat_id: int, message_ids: List[int]) -> Dict[int, DocumentLocation]:
+        messages = await self.fetch_messages(chat_id, message_ids)
+        resolved = {}
+        for message in messages or []:
+            location = DocumentLocation.from_message(chat_id, message)
+            if location:
+                self.put(location)
+                resolved[location.message_id] = location
+        return resolved
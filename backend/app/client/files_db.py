@@ -1,7 +1,10 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, create_engine, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Float, Text, create_engine, ForeignKey, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
+import json
+import secrets
+from app.core.config import settings
 
 DATABASE_URL = "sqlite:///./tg_files.db"
 
@@ -9,6 +12,9 @@ engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Length of share identifiers from new_share_id()
+SHARE_ID_LENGTH = 22
+
 class File(Base):
     __tablename__ = "files"
     id = Column(Integer, primary_key=True, index=True)
@@ -19,6 +25,32 @@ class File(Base):
     encrypted = Column(Boolean)
     original_name = Column(String)
     uploaded_at = Column(DateTime, default=datetime.now())
+    mime_type = Column(String, nullable=True)
+    sha256 = Column(String(64), nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    duration = Column(Float, nullable=True)
+    document_id = Column(BigInteger, nullable=True)
+    dc_id = Column(Integer, nullable=True)
+    chat_id = Column(BigInteger, nullable=True, index=True)
+    replicas = relationship("FileReplica", cascade="all, delete-orphan", lazy="selectin")
+
+    @property
+    def storage_chat_id(self):
+        """Channel holding the message; rows from before sharding live in the default channel"""
+        return self.chat_id or settings.TG_CHAT_ID
+
+    @property
+    def copies(self):
+        """(channel, message id) of the primary copy followed by its replicas"""
+        return [(self.storage_chat_id, self.message_id)] + [(r.chat_id, r.message_id) for r in self.replicas]
+
+class FileReplica(Base):
+    __tablename__ = "file_replicas"
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(Integer, ForeignKey("files.id"), index=True, nullable=False)
+    chat_id = Column(BigInteger, nullable=False)
+    message_id = Column(Integer, nullable=False)
 
 class Folder(Base):
     __tablename__ = "folders"
@@ -38,16 +70,77 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.now)
 
 class ShareToken(Base):
+    """A share link; `token` is a short random identifier (links created before were whole JWTs)
+    and the row holds the claims. Expired and revoked rows are swept periodically."""
     __tablename__ = "share_tokens"
     id = Column(Integer, primary_key=True, index=True)
-    token = Column(String, unique=True, index=True, nullable=False)
+    token = Column(String(SHARE_ID_LENGTH), unique=True, index=True, nullable=False)
     type = Column(String, nullable=False)
     folder = Column(String, nullable=False)
     filename = Column(String, nullable=True)
     owner = Column(String, ForeignKey("users.username"), nullable=False)
-    expires_at = Column(DateTime, nullable=False)
-    revoked = Column(Boolean, default=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked = Column(Boolean, default=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    @property
+    def claims(self) -> dict:
+        claims = {"type": self.type, "folder": self.folder, "owner": self.owner}
+        if self.filename is not None:
+            claims["filename"] = self.filename
+        return claims
+
+def new_share_id() -> str:
+    """128 random bits, URL-safe"""
+    return secrets.token_urlsafe(16)
+
+class Change(Base):
+    """Catalog change log; ids only ever grow, so a change id is a sync cursor"""
+    __tablename__ = "changes"
+    __table_args__ = {"sqlite_autoincrement": True}
+    id = Column(Integer, primary_key=True)
+    action = Column(String, nullable=False)
+    folder = Column(String, nullable=False)
+    filename = Column(String, nullable=True)
+    details = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def to_dict(self) -> dict:
+        return {
+            "cursor": self.id,
+            "action": self.action,
+            "folder": self.folder,
+            "filename": self.filename,
+            "details": json.loads(self.details) if self.details else {},
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+def record_change(db, action: str, folder: str, filename: str = None, **details) -> Change:
+    """Add a change log entry to the caller's transaction; it is committed with the mutation"""
+    change = Change(action=action, folder=folder, filename=filename, details=json.dumps(details) if details else None)
+    db.add(change)
+    return change
+
+def add_missing_columns():
+    """create_all never alters existing tables, so add columns introduced after a database was created"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+def add_missing_indexes():
+    """create_all skips indexes of tables that already exist"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    add_missing_indexes()
\ No newline at end of file
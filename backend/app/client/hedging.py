@@ -0,0 +1,36 @@
+from collections import deque
+from app.core.config import settings
+
+# Samples needed before the observed percentile replaces TG_HEDGE_DEFAULT_DELAY
+MIN_SAMPLES = 20
+
+class LatencyTracker:
+    """Rolling window of time-to-first-byte samples of Telegram downloads.
+    The hedge delay is a high percentile of it, so only the slowest reads get a second request."""
+
+    def __init__(self, window: int = 500, percentile: float = settings.TG_HEDGE_PERCENTILE):
+        self.samples = deque(maxlen=window)
+        self.percentile_rank = percentile
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, rank: float) -> float:
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(rank * len(ordered)))]
+
+    def hedge_delay(self) -> float:
+        if len(self.samples) < MIN_SAMPLES:
+            return settings.TG_HEDGE_DEFAULT_DELAY
+        return self.percentile(self.percentile_rank)
+
+    def metrics(self) -> dict:
+        return {
+            "samples": len(self.samples),
+            "hedge_delay_ms": round(self.hedge_delay() * 1000, 1),
+            "p50_ms": round(self.percentile(0.5) * 1000, 1) if self.samples else None,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
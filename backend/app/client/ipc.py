@@ -0,0 +1,157 @@
+"""
+Client side of the transfer daemon protocol.
+
+API workers send each request on its own Unix socket connection as one JSON line
+{"op": ..., "args": {...}}. The daemon answers with any number of
+{"type": "progress", "current": ..., "total": ...} lines followed by one
+{"type": "result", "value": ...} or {"type": "error", ...} line. File contents never
+cross the socket: uploads and downloads are exchanged as absolute paths on the shared
+disk, since the daemon may run from another working directory. A transfer slot is held
+for as long as its "transfer_slot" connection stays open.
+"""
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.client.files_db import File
+from app.client.scheduler import Priority
+from app.core.errors import TgCloudError, ExternalServiceError
+from app.core.logging import logger
+import asyncio
+import base64
+import json
+import os
+
+# Thumbnails and ranged reads travel base64-encoded in a single line
+LINE_LIMIT = 16 * 1024 * 1024
+
+def encode_line(message: dict) -> bytes:
+    return (json.dumps(message) + "\n").encode()
+
+class DaemonTransfers:
+    """Telegram transfers delegated to the transfer daemon owning the Telegram sessions"""
+
+    name = "daemon"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.crypto_backend = "unknown"
+
+    async def call(self, op: str, progress_callback: Callable = None, **args):
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.path, limit=LINE_LIMIT)
+        except OSError as e:
+            raise ExternalServiceError("Transfer daemon", f"Transfer daemon unreachable: {e}")
+        try:
+            writer.write(encode_line({"op": op, "args": args}))
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise ExternalServiceError("Transfer daemon", "Transfer daemon closed the connection")
+                message = json.loads(line)
+                if message["type"] == "progress":
+                    if progress_callback:
+                        progress_callback(message["current"], message["total"])
+                elif message["type"] == "result":
+                    return message["value"]
+                else:
+                    raise TgCloudError(message["message"], message["code"], message["status_code"], message.get("details"))
+        finally:
+            writer.close()
+
+    async def start(self):
+        try:
+            info = await self.call("info")
+            self.crypto_backend = info["crypto_backend"]
+        except TgCloudError as e:
+            logger.warning("Transfer daemon not available yet", extra_fields={"error": e.message})
+
+    async def stop(self):
+        pass
+
+    async def ensure_ready(self):
+        await self.call("ensure_ready")
+
+    async def is_authorized(self) -> bool:
+        return (await self.call("status"))["authorized"]
+
+    async def send_code(self, phone: str):
+        await self.call("send_code", phone=phone)
+
+    async def sign_in(self, phone: str = None, code: str = None, password: str = None) -> str:
+        return await self.call("sign_in", phone=phone, code=code, password=password)
+
+    async def upload(self, file_location: str, folder: str, db: Session, username: str, progress_callback: Callable = None, metadata: dict = None) -> Optional[Tuple[File, int]]:
+        result = await self.call(
+            "upload", progress_callback, file_location=os.path.abspath(file_location), folder=folder, username=username, metadata=metadata
+        )
+        if result is None:
+            return None
+        file_id, change_id = result
+        db.expire_all()
+        db_file = db.query(File).filter_by(id=file_id).first()
+        return (db_file, change_id) if db_file else None
+
+    async def download(self, filename: str, folder: str, db: Session, progress_callback: Callable = None, priority: Priority = Priority.TRANSFER, tenant: str = None) -> Optional[Tuple]:
+        result = await self.call("download", progress_callback, filename=filename, folder=folder, priority=int(priority), tenant=tenant)
+        return tuple(result) if result else None
+
+    @asynccontextmanager
+    async def transfer_slot(self, tenant: str = None) -> AsyncIterator[None]:
+        """The daemon reports the slot held with a progress line and keeps it until the
+        connection closes"""
+        if tenant is None:
+            yield
+            return
+        held = asyncio.Event()
+        call = asyncio.create_task(self.call("transfer_slot", lambda current, total: held.set(), tenant=tenant))
+        try:
+            waiting = asyncio.create_task(held.wait())
+            try:
+                await asyncio.wait({call, waiting}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiting.cancel()
+            if not held.is_set():
+                call.result()
+                raise ExternalServiceError("Transfer daemon", "Transfer daemon released the transfer slot")
+            yield
+        finally:
+            call.cancel()
+            await asyncio.gather(call, return_exceptions=True)
+
+    async def download_thumbnail(self, copies: List[Tuple[int, int]], priority: Priority = Priority.INTERACTIVE) -> Optional[bytes]:
+        data = await self.call("download_thumbnail", copies=[list(copy) for copy in copies], priority=int(priority))
+        return base64.b64decode(data) if data else None
+
+    async def read_range(self, copies: List[Tuple[int, int]], offset: int, limit: int, priority: Priority = Priority.TRANSFER, tenant: str = None) -> Optional[bytes]:
+        data = await self.call(
+            "read_range", copies=[list(copy) for copy in copies], offset=offset, limit=limit, priority=int(priority), tenant=tenant
+        )
+        return base64.b64decode(data) if data is not None else None
+
+    async def delete_file(self, filename: str, folder: str, db: Session) -> Optional[int]:
+        return await self.call("delete_file", filename=filename, folder=folder)
+
+    async def delete_folder(self, folder: str, db: Session) -> Optional[List[int]]:
+        return await self.call("delete_folder", folder=folder)
+
+    async def resolve_locations(self, files: List[File]):
+        if not files:
+            return
+        try:
+            await self.call("resolve_locations", file_ids=[file.id for file in files])
+        except TgCloudError as e:
+            logger.warning("Could not resolve document locations", extra_fields={"error": e.message})
+
+    async def rebalance(self, db: Session, source: int = None, target: int = None, max_moves: int = None) -> int:
+        return await self.call("rebalance", source=source, target=target, max_moves=max_moves)
+
+    async def rebalance_status(self) -> dict:
+        return await self.call("rebalance_status")
+
+    async def metrics(self) -> dict:
+        """The daemon's metrics: sessions, schedulers, hedged reads, rebalance and quotas"""
+        try:
+            return await self.call("metrics")
+        except TgCloudError as e:
+            return {"transfer_daemon": {"error": e.message}}
@@ -0,0 +1,130 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from telethon.errors import SessionPasswordNeededError, PhoneCodeInvalidError
+from app.client.client import (
+    telegram_client, telegram_scheduler, crypto_backend, ensure_telegram_ready, check_telegram_authorized,
+    set_telegram_authorized, warm_up_telegram, telegram_supervisor, disconnect_telegram,
+    upload_file_to_tgcloud, download_file_from_tgcloud, download_thumbnail_from_tgcloud, read_document_range,
+    delete_file_from_tgcloud, delete_folder_from_tgcloud, resolve_document_locations,
+)
+from app.client.files_db import File
+from app.client.quotas import transfer_quotas, user_tenant
+from app.client.scheduler import Priority
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.rebalance_service import plan_rebalance, run_rebalance, rebalance_state
+import asyncio
+
+# Registered here rather than in app.client.quotas: API workers in daemon mode import the
+# tenant helpers only, and the quotas that count are the daemon's
+metrics.register("transfer_quotas", transfer_quotas.metrics)
+
+class LocalTransfers:
+    """Telegram transfers run by this process, which owns the Telegram sessions"""
+
+    name = "local"
+
+    def __init__(self):
+        self.crypto_backend = crypto_backend
+        self.supervisor: Optional[asyncio.Task] = None
+        self.rebalance_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        # Connect to Telegram and resolve the storage channels in the background
+        if settings.TG_API_ID and settings.TG_API_HASH:
+            self.supervisor = asyncio.create_task(telegram_supervisor())
+
+    async def stop(self):
+        if self.supervisor:
+            self.supervisor.cancel()
+            try:
+                await self.supervisor
+            except asyncio.CancelledError:
+                pass
+        await disconnect_telegram()
+
+    async def ensure_ready(self):
+        await ensure_telegram_ready()
+
+    async def is_authorized(self) -> bool:
+        return await check_telegram_authorized()
+
+    async def send_code(self, phone: str):
+        await telegram_client.connect()
+        await telegram_scheduler.call("auth", lambda: telegram_client.send_code_request(phone), Priority.INTERACTIVE)
+
+    async def sign_in(self, phone: str = None, code: str = None, password: str = None) -> str:
+        """Returns "authenticated", "password_required" or "invalid_code" """
+        await telegram_client.connect()
+        try:
+            if password is not None:
+                await telegram_scheduler.call("auth", lambda: telegram_client.sign_in(password=password), Priority.INTERACTIVE)
+            else:
+                await telegram_scheduler.call("auth", lambda: telegram_client.sign_in(phone, code), Priority.INTERACTIVE)
+        except SessionPasswordNeededError:
+            return "password_required"
+        except PhoneCodeInvalidError:
+            return "invalid_code"
+        set_telegram_authorized(True)
+        await warm_up_telegram()
+        return "authenticated"
+
+    async def upload(self, file_location: str, folder: str, db: Session, username: str, progress_callback: Callable = None, metadata: dict = None) -> Optional[Tuple[File, int]]:
+        """The stored file and the id of the change recording it, to publish"""
+        async with transfer_quotas.transfer(user_tenant(username) if username else None, progress_callback) as progress:
+            return await upload_file_to_tgcloud(
+                file_location,
+                folder=folder,
+                db_session=db,
+                username=username,
+                progress_callback=progress,
+                metadata=metadata
+            )
+
+    async def download(self, filename: str, folder: str, db: Session, progress_callback: Callable = None, priority: Priority = Priority.TRANSFER, tenant: str = None) -> Optional[Tuple]:
+        """`tenant` (a user or share link, see app.client.quotas) is charged for the transfer"""
+        async with transfer_quotas.transfer(tenant, progress_callback) as progress:
+            return await download_file_from_tgcloud(filename, folder, db, progress, priority)
+
+    @asynccontextmanager
+    async def transfer_slot(self, tenant: str = None) -> AsyncIterator[None]:
+        """Hold a transfer slot of `tenant` around a stream made of ranged reads"""
+        async with transfer_quotas.transfer(tenant):
+            yield
+
+    async def download_thumbnail(self, copies: List[Tuple[int, int]], priority: Priority = Priority.INTERACTIVE) -> Optional[bytes]:
+        return await download_thumbnail_from_tgcloud(copies, priority)
+
+    async def read_range(self, copies: List[Tuple[int, int]], offset: int, limit: int, priority: Priority = Priority.TRANSFER, tenant: str = None) -> Optional[bytes]:
+        data = await read_document_range(copies, offset, limit, priority)
+        # Ranged reads take no transfer slot, but their bytes count against the tenant's bandwidth
+        if data:
+            await transfer_quotas.consume(tenant, len(data))
+        return data
+
+    async def delete_file(self, filename: str, folder: str, db: Session) -> Optional[int]:
+        """Id of the change recording the deletion; None if there is no such file"""
+        return await delete_file_from_tgcloud(filename, folder, db)
+
+    async def delete_folder(self, folder: str, db: Session) -> Optional[List[int]]:
+        return await delete_folder_from_tgcloud(folder, db)
+
+    async def resolve_locations(self, files: List[File]):
+        await resolve_document_locations(files)
+
+    async def rebalance(self, db: Session, source: int = None, target: int = None, max_moves: int = None) -> int:
+        """Plan a rebalance and run it in the background; returns the number of planned moves"""
+        moves = plan_rebalance(db, source, target, max_moves)
+        if moves:
+            rebalance_state["running"] = True
+            self.rebalance_task = asyncio.create_task(run_rebalance(moves))
+        return len(moves)
+
+    async def rebalance_status(self) -> dict:
+        return dict(rebalance_state)
+
+    async def metrics(self) -> dict:
+        """Metrics of the components next to the Telegram sessions; in this process they are
+        in the metrics registry already"""
+        return {}
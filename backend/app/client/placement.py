@@ -0,0 +1,61 @@
+from typing import Dict, List
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.client.files_db import File
+from app.core.config import settings
+import zlib
+
+def channel_usage(db: Session) -> Dict[int, dict]:
+    """Files and bytes stored per storage channel"""
+    usage = {chat: {"files": 0, "bytes": 0} for chat in settings.TG_CHAT_IDS}
+    rows = db.query(File.chat_id, func.count(File.id), func.sum(File.size)).group_by(File.chat_id).all()
+    for chat, files, size in rows:
+        chat = chat or settings.TG_CHAT_ID
+        entry = usage.setdefault(chat, {"files": 0, "bytes": 0})
+        entry["files"] += files
+        entry["bytes"] += int(size or 0)
+    return usage
+
+class RoundRobinPlacement:
+    """Cycle through the channels so write pressure is spread evenly"""
+
+    def __init__(self, channels: List[int]):
+        self.channels = channels
+        self._next = 0
+
+    def choose(self, db: Session, folder: str, size: int) -> int:
+        chat = self.channels[self._next % len(self.channels)]
+        self._next += 1
+        return chat
+
+class SizeWeightedPlacement:
+    """Send each file to the channel currently holding the fewest bytes"""
+
+    def __init__(self, channels: List[int]):
+        self.channels = channels
+
+    def choose(self, db: Session, folder: str, size: int) -> int:
+        usage = channel_usage(db)
+        return min(self.channels, key=lambda chat: usage.get(chat, {}).get("bytes", 0))
+
+class PerFolderPlacement:
+    """Keep every file of a folder in the same channel"""
+
+    def __init__(self, channels: List[int]):
+        self.channels = channels
+
+    def choose(self, db: Session, folder: str, size: int) -> int:
+        return self.channels[zlib.crc32(folder.encode()) % len(self.channels)]
+
+PLACEMENT_POLICIES = {
+    "round_robin": RoundRobinPlacement,
+    "size_weighted": SizeWeightedPlacement,
+    "per_folder": PerFolderPlacement,
+}
+
+def build_placement_policy(name: str = settings.TG_PLACEMENT_POLICY, channels: List[int] = None):
+    if name not in PLACEMENT_POLICIES:
+        raise ValueError(f"Unknown placement policy: {name}")
+    return PLACEMENT_POLICIES[name](channels or settings.TG_CHAT_IDS)
+
+placement_policy = build_placement_policy()
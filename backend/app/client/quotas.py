@@ -0,0 +1,237 @@
+"""
+Per-user and per-share-link transfer quotas.
+
+Whole-file uploads and downloads take one of TRANSFER_SLOTS slots. A slot goes to the
+waiting tenant (a user or a share link) with the fewest transfers running, then to the
+one served least recently, so a 50-file batch from one user queues behind its own
+concurrency limit instead of in front of everyone else. Bytes are shaped with a token
+bucket per tenant: the progress callbacks Telethon awaits between parts sleep off any
+debt, which slows the transfer itself rather than its progress reports. While sleeping,
+the transfer gives its Telegram scheduler slot back, so a throttled tenant never holds
+up other tenants' requests on the session.
+
+Quotas live in the process that owns the Telegram sessions, so with the transfer
+daemon every API worker shares one queue.
+"""
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+from app.client.scheduler import slot_released
+from app.core.config import settings
+import asyncio
+import hashlib
+import itertools
+import time
+
+def user_tenant(username: str) -> str:
+    return f"user:{username}"
+
+def share_tenant(token_digest: int) -> str:
+    """Share links are keyed by a digest so the link itself never shows up in metrics"""
+    return f"share:{token_digest:016x}"
+
+def tenant_label(key: str) -> str:
+    """How a tenant shows up in the unauthenticated /metrics: usernames are hashed"""
+    kind, _, name = key.partition(":")
+    if kind == "user":
+        return f"user:{hashlib.blake2b(name.encode(), digest_size=8).hexdigest()}"
+    return key
+
+class ByteBucket:
+    """Token bucket in bytes. Consumers may overdraw it and then wait until it is back at zero,
+    so chunks larger than the burst still pass at the configured rate."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def level(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def debit(self, amount: int) -> float:
+        """Take `amount` bytes; returns the seconds to wait before using more"""
+        self.tokens = self.level() - amount
+        return max(0.0, -self.tokens / self.rate)
+
+class Tenant:
+    def __init__(self, key: str, concurrency: int, bandwidth: float, burst_seconds: float):
+        self.key = key
+        self.concurrency = concurrency
+        self.bucket = ByteBucket(bandwidth, bandwidth * burst_seconds) if bandwidth > 0 else None
+        self.active = 0
+        self.reading = 0  # ranged reads being charged, which take no slot
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.last_served = 0
+        self.bytes = 0
+        self.throttled_seconds = 0.0
+        self.queued_seconds = 0.0
+
+    @property
+    def eligible(self) -> bool:
+        return bool(self.waiters) and (self.concurrency <= 0 or self.active < self.concurrency)
+
+    @property
+    def idle(self) -> bool:
+        return not self.active and not self.reading and not self.waiters
+
+    def debit(self, amount: int) -> float:
+        self.bytes += amount
+        if not self.bucket or amount <= 0:
+            return 0.0
+        delay = self.bucket.debit(amount)
+        self.throttled_seconds += delay
+        return delay
+
+class TransferQuotas:
+    """Fair admission of transfers across tenants, and per-tenant bandwidth shaping"""
+
+    def __init__(
+        self,
+        slots: int = settings.TRANSFER_SLOTS,
+        user_limits: Tuple[int, float] = (settings.TRANSFER_USER_CONCURRENCY, settings.TRANSFER_USER_BANDWIDTH),
+        share_limits: Tuple[int, float] = (settings.TRANSFER_SHARE_CONCURRENCY, settings.TRANSFER_SHARE_BANDWIDTH),
+        overrides: Dict[str, str] = settings.TRANSFER_QUOTA_OVERRIDES,
+        burst_seconds: float = settings.TRANSFER_BURST_SECONDS,
+    ):
+        self.slots = slots
+        self.user_limits = user_limits
+        self.share_limits = share_limits
+        # "concurrency:bytes per second" per username
+        self.overrides = {
+            user_tenant(name): (int(concurrency), float(bandwidth or 0))
+            for name, (concurrency, _, bandwidth) in ((name, value.partition(":")) for name, value in overrides.items())
+        }
+        self.burst_seconds = burst_seconds
+        self.active = 0
+        self.tenants: Dict[str, Tenant] = {}
+        self._served = itertools.count(1)
+        # Totals of tenants that went idle and were dropped
+        self.finished = {"transfers": 0, "bytes": 0, "throttled_seconds": 0.0, "queued_seconds": 0.0}
+
+    def limits(self, key: str) -> Tuple[int, float]:
+        if key in self.overrides:
+            return self.overrides[key]
+        return self.share_limits if key.startswith("share:") else self.user_limits
+
+    def tenant(self, key: str) -> Tenant:
+        if key not in self.tenants:
+            self.tenants[key] = Tenant(key, *self.limits(key), self.burst_seconds)
+        return self.tenants[key]
+
+    def _dispatch(self):
+        while self.slots <= 0 or self.active < self.slots:
+            candidates = [tenant for tenant in self.tenants.values() if tenant.eligible]
+            if not candidates:
+                return
+            tenant = min(candidates, key=lambda t: (t.active, t.last_served))
+            future = tenant.waiters.popleft()
+            if future.done():
+                continue
+            tenant.active += 1
+            tenant.last_served = next(self._served)
+            self.active += 1
+            future.set_result(None)
+
+    def _release(self, tenant: Tenant):
+        tenant.active -= 1
+        self.active -= 1
+        self.finished["transfers"] += 1
+        self._forget(tenant)
+        self._dispatch()
+
+    def _forget(self, tenant: Tenant):
+        # A tenant whose bucket is in debt is kept, or dropping it would forgive the debt
+        if tenant.idle and (tenant.bucket is None or tenant.bucket.level() >= 0) and self.tenants.get(tenant.key) is tenant:
+            del self.tenants[tenant.key]
+            self.finished["bytes"] += tenant.bytes
+            self.finished["throttled_seconds"] += tenant.throttled_seconds
+            self.finished["queued_seconds"] += tenant.queued_seconds
+
+    async def _admit(self, tenant: Tenant):
+        future = asyncio.get_running_loop().create_future()
+        tenant.waiters.append(future)
+        self._dispatch()
+        if future.done():
+            return
+        started = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future in tenant.waiters:
+                tenant.waiters.remove(future)
+                self._forget(tenant)
+            elif future.done() and not future.cancelled():
+                self._release(tenant)  # the slot was handed over just before cancellation
+            raise
+        finally:
+            tenant.queued_seconds += time.monotonic() - started
+
+    @asynccontextmanager
+    async def transfer(self, key: Optional[str], progress_callback: Callable = None) -> AsyncIterator[Callable]:
+        """Hold a transfer slot of tenant `key` (no limits without a tenant); yields the progress
+        callback to pass to the transfer, which reports to `progress_callback` and shapes bandwidth"""
+        if key is None:
+            yield progress_callback
+            return
+        tenant = self.tenant(key)
+        await self._admit(tenant)
+        sent = 0
+
+        async def on_progress(current, total):
+            nonlocal sent
+            if progress_callback:
+                progress_callback(current, total)
+            # A transfer restarted on another session reports from zero again
+            amount, sent = max(0, current - sent), current
+            delay = tenant.debit(amount)
+            if delay:
+                async with slot_released():
+                    await asyncio.sleep(delay)
+
+        try:
+            yield on_progress
+        finally:
+            self._release(tenant)
+
+    async def consume(self, key: Optional[str], amount: int):
+        """Charge bytes read outside a whole-file transfer, such as ranged reads"""
+        if key is None:
+            return
+        tenant = self.tenant(key)
+        tenant.reading += 1
+        try:
+            delay = tenant.debit(amount)
+            if delay:
+                await asyncio.sleep(delay)
+        finally:
+            tenant.reading -= 1
+            self._forget(tenant)
+
+    def metrics(self) -> dict:
+        tenants = self.tenants.values()
+        return {
+            "slots": self.slots,
+            "active": self.active,
+            "queued": sum(len(tenant.waiters) for tenant in tenants),
+            "transfers": self.finished["transfers"],
+            "bytes": self.finished["bytes"] + sum(tenant.bytes for tenant in tenants),
+            "throttled_seconds": round(self.finished["throttled_seconds"] + sum(t.throttled_seconds for t in tenants), 2),
+            "queued_seconds": round(self.finished["queued_seconds"] + sum(t.queued_seconds for t in tenants), 2),
+            "tenants": {
+                tenant_label(tenant.key): {
+                    "active": tenant.active,
+                    "queued": len(tenant.waiters),
+                    "bytes": tenant.bytes,
+                    "throttled_seconds": round(tenant.throttled_seconds, 2),
+                    "queued_seconds": round(tenant.queued_seconds, 2),
+                }
+                for tenant in tenants
+            },
+        }
+
+transfer_quotas = TransferQuotas()
@@ -0,0 +1,271 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+from telethon.errors import FloodError
+from app.core.config import settings
+from app.core.errors import ExternalServiceError
+from app.core.logging import logger
+import asyncio
+import heapq
+import itertools
+import time
+
+T = TypeVar("T")
+
+class Priority(IntEnum):
+    """Lower values are served first when callers queue for a slot"""
+    INTERACTIVE = 0  # previews, thumbnails and lookups a user is waiting on
+    TRANSFER = 1     # uploads and downloads
+    BULK = 2         # deletes, prefetching and maintenance
+
+# (requests per second, burst) per Telethon method; anything else uses DEFAULT_RATE
+METHOD_RATES: Dict[str, Tuple[float, int]] = {
+    "get_messages": (20.0, 40),
+    "get_input_entity": (5.0, 10),
+    "send_file": (3.0, 6),
+    "forward_messages": (3.0, 6),
+    "delete_messages": (3.0, 6),
+    "upload_file": (5.0, 10),
+    "download_file": (10.0, 20),
+    "auth": (1.0, 3),
+}
+DEFAULT_RATE = (10.0, 20)
+
+class FloodWaitDeferred(Exception):
+    """Raised instead of sleeping through a FloodWait when the caller can retry elsewhere"""
+    def __init__(self, method: str, seconds: int):
+        self.method = method
+        self.seconds = seconds
+        super().__init__(f"{method} flood-waited for {seconds}s")
+
+class _Slot:
+    """The concurrency slot of a running call, as seen from code running inside it"""
+    def __init__(self, scheduler: "TelegramScheduler", priority: Priority):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.held = True
+
+_current_slot: ContextVar[Optional[_Slot]] = ContextVar("telegram_scheduler_slot", default=None)
+
+@asynccontextmanager
+async def slot_released():
+    """Give the slot of the surrounding scheduler call back while waiting on something other
+    than Telegram, such as a bandwidth quota in a progress callback, and queue for it again after"""
+    slot = _current_slot.get()
+    if slot is None or not slot.held:
+        yield
+        return
+    slot.held = False
+    slot.scheduler._release_slot()
+    try:
+        yield
+    finally:
+        await slot.scheduler._acquire_slot(slot.priority)
+        slot.held = True
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class MethodStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.flood_waits = 0
+        self.last_flood_seconds = 0
+        self.latency_ewma = 0.0
+
+class TelegramScheduler:
+    """
+    Central gate for Telegram RPCs.
+    Every call waits for its method's token bucket and for a concurrency slot, slots are
+    handed out by priority, and the concurrency limit adapts with AIMD: it grows by
+    about one per window of successful calls and halves on FloodWait or slow responses.
+    FloodWait errors block the method for the requested time and the call is retried.
+    Whole-file transfers hold their slot for minutes and slots are never preempted, so
+    `interactive_reserve` slots are kept for INTERACTIVE calls.
+    """
+
+    def __init__(
+        self,
+        name: str = "primary",
+        initial_limit: int = settings.TG_SCHEDULER_INITIAL_CONCURRENCY,
+        min_limit: int = 2,
+        max_limit: int = settings.TG_SCHEDULER_MAX_CONCURRENCY,
+        latency_target: float = settings.TG_SCHEDULER_LATENCY_TARGET,
+        max_flood_wait: int = settings.TG_MAX_FLOOD_WAIT,
+        interactive_reserve: int = settings.TG_SCHEDULER_INTERACTIVE_RESERVE,
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.max_flood_wait = max_flood_wait
+        self.interactive_reserve = interactive_reserve
+        self.inflight = 0
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.blocked_until: Dict[str, float] = {}
+        self.stats: Dict[str, MethodStats] = {}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    def _bucket(self, method: str) -> TokenBucket:
+        if method not in self.buckets:
+            self.buckets[method] = TokenBucket(*METHOD_RATES.get(method, DEFAULT_RATE))
+        return self.buckets[method]
+
+    def _stats(self, method: str) -> MethodStats:
+        if method not in self.stats:
+            self.stats[method] = MethodStats()
+        return self.stats[method]
+
+    @property
+    def load(self) -> float:
+        """Share of the concurrency limit in use, counting queued callers"""
+        return (self.inflight + len(self._waiters)) / self.limit
+
+    def flood_wait_remaining(self) -> float:
+        now = time.monotonic()
+        return max([until - now for until in self.blocked_until.values()] + [0])
+
+    def _can_start(self, priority: int) -> bool:
+        limit = int(self.limit)
+        if priority != Priority.INTERACTIVE:
+            # Other calls always keep at least one slot
+            limit = max(1, limit - self.interactive_reserve)
+        return self.inflight < limit
+
+    async def _acquire_slot(self, priority: Priority):
+        # Queued callers of the same or a higher priority go first
+        if self._can_start(priority) and (not self._waiters or self._waiters[0][0] > priority):
+            self.inflight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        entry = (int(priority), next(self._sequence), future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            elif future.done() and not future.cancelled():
+                self._release_slot()  # the slot was handed over just before cancellation
+            raise
+
+    def _release_slot(self):
+        self.inflight -= 1
+        # The heap is ordered by priority: once its head cannot start, nothing behind it can
+        while self._waiters and self._can_start(self._waiters[0][0]):
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.inflight += 1
+                future.set_result(None)
+
+    def _on_success(self, latency: float, measure_latency: bool):
+        if measure_latency and latency > self.latency_target:
+            self.limit = max(self.min_limit, self.limit * 0.75)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _on_flood(self, method: str, seconds: int):
+        self.limit = max(self.min_limit, self.limit / 2)
+        self.blocked_until[method] = max(self.blocked_until.get(method, 0), time.monotonic() + seconds)
+        stats = self._stats(method)
+        stats.flood_waits += 1
+        stats.last_flood_seconds = seconds
+
+    async def call(
+        self,
+        method: str,
+        func: Callable[[], Awaitable[T]],
+        priority: Priority = Priority.TRANSFER,
+        measure_latency: bool = True,
+        defer_flood: bool = False,
+    ) -> T:
+        """Run `func` (a zero-argument callable returning the RPC awaitable) under the scheduler.
+        Set measure_latency=False for whole-file transfers, whose duration is not an RPC latency,
+        and defer_flood=True to get FloodWaitDeferred instead of waiting out a FloodWait."""
+        stats = self._stats(method)
+        while True:
+            wait = self.blocked_until.get(method, 0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self._bucket(method).acquire()
+            await self._acquire_slot(priority)
+
+            slot = _Slot(self, priority)
+            token = _current_slot.set(slot)
+            start = time.monotonic()
+            try:
+                stats.calls += 1
+                result = await func()
+            except FloodError as e:
+                seconds = getattr(e, "seconds", None) or 1
+                self._on_flood(method, seconds)
+                logger.warning(
+                    f"Telegram flood wait on {method}",
+                    extra_fields={"session": self.name, "seconds": seconds, "limit": round(self.limit, 2)}
+                )
+                if defer_flood:
+                    raise FloodWaitDeferred(method, seconds)
+                if seconds > self.max_flood_wait:
+                    stats.errors += 1
+                    raise ExternalServiceError("Telegram", f"Rate limited by Telegram, retry in {seconds}s")
+                continue
+            except Exception:
+                stats.errors += 1
+                raise
+            else:
+                latency = time.monotonic() - start
+                if measure_latency:
+                    stats.latency_ewma = latency if not stats.latency_ewma else 0.8 * stats.latency_ewma + 0.2 * latency
+                self._on_success(latency, measure_latency)
+                return result
+            finally:
+                _current_slot.reset(token)
+                if slot.held:
+                    self._release_slot()
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        queued = {p.name.lower(): 0 for p in Priority}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                queued[Priority(priority).name.lower()] += 1
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "interactive_reserve": self.interactive_reserve,
+            "inflight": self.inflight,
+            "queued": queued,
+            "methods": {
+                method: {
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "flood_waits": stats.flood_waits,
+                    "last_flood_seconds": stats.last_flood_seconds,
+                    "blocked_for": round(max(0, self.blocked_until.get(method, 0) - now), 2),
+                    "latency_ms": round(stats.latency_ewma * 1000, 1),
+                    "tokens": round(self.buckets[method].tokens, 2) if method in self.buckets else None,
+                }
+                for method, stats in self.stats.items()
+            },
+        }
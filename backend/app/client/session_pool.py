@@ -0,0 +1,144 @@
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+from telethon import TelegramClient
+from app.client.document_cache import DocumentCache
+from app.client.scheduler import TelegramScheduler, Priority, FloodWaitDeferred
+from app.core.config import settings
+from app.core.errors import ExternalServiceError
+from app.core.logging import logger
+import time
+
+T = TypeVar("T")
+
+# Consecutive connection failures after which a session stops receiving work
+MAX_CONSECUTIVE_FAILURES = 3
+
+class PooledSession:
+    """One Telegram account (user or bot) with its own scheduler and document location cache.
+    Rate limits and document access hashes are per account, so neither can be shared."""
+
+    def __init__(self, name: str, client: TelegramClient, chat_ids: List[int], bot_token: str = None):
+        self.name = name
+        self.client = client
+        self.chat_ids = chat_ids
+        self.bot_token = bot_token
+        self.scheduler = TelegramScheduler(name)
+        self.document_cache = DocumentCache(self._fetch_messages, settings.DOCUMENT_CACHE_SIZE)
+        # `authorized` is None until the first check, then cached until an auth error or sign in
+        self.authorized: Optional[bool] = None
+        self.storage_peers: Dict[int, object] = {}
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_success: Optional[float] = None
+
+    def storage_chat(self, chat_id: int):
+        """A storage channel as a pre-resolved input peer when available"""
+        return self.storage_peers.get(chat_id) or chat_id
+
+    async def _fetch_messages(self, chat_id: int, message_ids):
+        return await self.scheduler.call(
+            "get_messages",
+            lambda: self.client.get_messages(self.storage_chat(chat_id), ids=message_ids),
+            Priority.INTERACTIVE
+        )
+
+    @property
+    def healthy(self) -> bool:
+        return bool(self.authorized) and self.client.is_connected() and self.failures < MAX_CONSECUTIVE_FAILURES
+
+    def record_success(self):
+        self.failures = 0
+        self.last_success = time.time()
+
+    def record_failure(self, error: Exception):
+        self.failures += 1
+        self.last_error = str(error)
+
+    def metrics(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "authorized": self.authorized,
+            "connected": self.client.is_connected(),
+            "bot": bool(self.bot_token),
+            "load": round(self.scheduler.load, 3),
+            "flood_wait_remaining": round(self.scheduler.flood_wait_remaining(), 2),
+            "consecutive_failures": self.failures,
+            "last_error": self.last_error,
+            "document_cache": {
+                "entries": len(self.document_cache.entries),
+                "hits": self.document_cache.hits,
+                "misses": self.document_cache.misses,
+            },
+            "scheduler": self.scheduler.metrics(),
+        }
+
+class SessionPool:
+    """
+    Spreads Telegram work over several sessions with write access to the storage channel.
+    Work goes to the healthy session with the lowest scheduler load; sessions that are
+    flood-waited are drained until the wait expires, and a FloodWait on one session moves
+    the call to another one when there is an alternative.
+    """
+
+    def __init__(self):
+        self.sessions: List[PooledSession] = []
+
+    def add(self, session: PooledSession):
+        self.sessions.append(session)
+
+    @property
+    def primary(self) -> PooledSession:
+        return self.sessions[0]
+
+    def acquire(self, exclude=()) -> PooledSession:
+        candidates = [s for s in self.sessions if s.healthy and s not in exclude]
+        if not candidates:
+            # Fall back to the primary session so callers get its real error (not authorized, ...)
+            if self.primary not in exclude:
+                return self.primary
+            raise ExternalServiceError("Telegram", "No Telegram session available")
+        ready = [s for s in candidates if s.scheduler.flood_wait_remaining() == 0]
+        if ready:
+            return min(ready, key=lambda s: s.scheduler.load)
+        return min(candidates, key=lambda s: s.scheduler.flood_wait_remaining())
+
+    async def run(
+        self,
+        method: str,
+        func: Callable[[PooledSession], Awaitable[T]],
+        priority: Priority = Priority.TRANSFER,
+        measure_latency: bool = True,
+        session: PooledSession = None,
+        move_on_flood: bool = False,
+    ) -> T:
+        """Run `func(session)` on the least loaded session, moving to another session on FloodWait.
+        Pass `session` to pin the call, e.g. to send a file uploaded through that session; a pinned
+        call waits out FloodWaits unless move_on_flood is set, in which case FloodWaitDeferred
+        is raised for the caller to pick another session."""
+        tried = []
+        while True:
+            current = session or self.acquire(exclude=tried)
+            can_move = any(s.healthy and s is not current and s not in tried for s in self.sessions)
+            try:
+                result = await current.scheduler.call(
+                    method,
+                    lambda: func(current),
+                    priority,
+                    measure_latency=measure_latency,
+                    defer_flood=can_move and (session is None or move_on_flood)
+                )
+                current.record_success()
+                return result
+            except FloodWaitDeferred as e:
+                logger.info(
+                    f"Moving {method} away from flood-waited session",
+                    extra_fields={"session": current.name, "seconds": e.seconds}
+                )
+                if session is not None:
+                    raise
+                tried.append(current)
+            except (ConnectionError, OSError) as e:
+                current.record_failure(e)
+                raise
+
+    def metrics(self) -> dict:
+        return {session.name: session.metrics() for session in self.sessions}
@@ -0,0 +1,13 @@
+from app.core.config import settings
+
+def build_transfers():
+    """Transfers run in this process unless a transfer daemon socket is configured.
+    Imports are deferred so API workers in daemon mode never open the Telegram sessions."""
+    if settings.TRANSFER_DAEMON_SOCKET:
+        from app.client.ipc import DaemonTransfers
+        return DaemonTransfers(settings.TRANSFER_DAEMON_SOCKET)
+    from app.client.local_transfers import LocalTransfers
+    return LocalTransfers()
+
+# Global transfer backend used by the API
+transfers = build_transfers()
@@ -20,6 +20,26 @@ class Settings:
     TG_API_ID = int(os.getenv("API_ID")) if os.getenv("API_ID") else None
     TG_API_HASH = os.getenv("API_HASH")
     TG_CHAT_ID = int(os.getenv("CHAT_ID")) if os.getenv("CHAT_ID") else None
+    # Storage channels files are sharded across; CHAT_ID stays the default for existing files
+    TG_CHAT_IDS = [int(c) for c in os.getenv("CHAT_IDS", "").split(",") if c.strip()] or ([TG_CHAT_ID] if TG_CHAT_ID else [])
+    TG_PLACEMENT_POLICY = os.getenv("TG_PLACEMENT_POLICY", "round_robin")
+    # Copies kept of every upload (in distinct channels) and hedged reads across them
+    TG_REPLICATION_FACTOR = int(os.getenv("TG_REPLICATION_FACTOR", 1))
+    TG_HEDGE_PERCENTILE = float(os.getenv("TG_HEDGE_PERCENTILE", 0.95))
+    TG_HEDGE_DEFAULT_DELAY = float(os.getenv("TG_HEDGE_DEFAULT_DELAY", 1.0))
+    TG_KEEPALIVE_SECONDS = int(os.getenv("TG_KEEPALIVE_SECONDS", 60))
+    
+    # Extra sessions with write access to the storage channel, comma separated
+    TG_EXTRA_SESSIONS = [s.strip() for s in os.getenv("TG_EXTRA_SESSIONS", "").split(",") if s.strip()]
+    TG_BOT_TOKENS = [t.strip() for t in os.getenv("TG_BOT_TOKENS", "").split(",") if t.strip()]
+    
+    # Telegram request scheduler
+    TG_SCHEDULER_INITIAL_CONCURRENCY = int(os.getenv("TG_SCHEDULER_INITIAL_CONCURRENCY", 8))
+    TG_SCHEDULER_MAX_CONCURRENCY = int(os.getenv("TG_SCHEDULER_MAX_CONCURRENCY", 32))
+    TG_SCHEDULER_LATENCY_TARGET = float(os.getenv("TG_SCHEDULER_LATENCY_TARGET", 2.0))
+    # Slots of each session only INTERACTIVE calls may take, so long transfers cannot starve them
+    TG_SCHEDULER_INTERACTIVE_RESERVE = int(os.getenv("TG_SCHEDULER_INTERACTIVE_RESERVE", 2))
+    TG_MAX_FLOOD_WAIT = int(os.getenv("TG_MAX_FLOOD_WAIT", 60))
     
     # Security
     SECRET_KEY = os.getenv("SECRET_KEY", "supersecurepassword")
@@ -32,6 +52,33 @@ class Settings:
     # File Configuration
     MAX_FILE_SIZE = os.getenv("MAX_FILE_SIZE", "100MB")
     
+    # Thumbnails
+    THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", 320))
+    THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv("THUMBNAIL_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    
+    # Folder archives: members fetched at once, bytes per ranged read, chunks buffered per member
+    ARCHIVE_READ_AHEAD = int(os.getenv("ARCHIVE_READ_AHEAD", 3))
+    ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", 1024 * 1024))
+    ARCHIVE_BUFFERED_CHUNKS = int(os.getenv("ARCHIVE_BUFFERED_CHUNKS", 4))
+
+    # Stored ZIP files: parsed central directories kept in memory, and the largest directory read
+    ARCHIVE_INDEX_CACHE_SIZE = int(os.getenv("ARCHIVE_INDEX_CACHE_SIZE", 64))
+    ARCHIVE_INDEX_MAX_BYTES = int(os.getenv("ARCHIVE_INDEX_MAX_BYTES", 16 * 1024 * 1024))
+    
+    # Prefetching of the files of an opened folder, at BULK priority: bytes read per file,
+    # files and bytes per folder visit, concurrent fetches, and the chunk cache they fill
+    PREFETCH_HEAD_BYTES = int(os.getenv("PREFETCH_HEAD_BYTES", 512 * 1024))
+    PREFETCH_MAX_FILES = int(os.getenv("PREFETCH_MAX_FILES", 12))
+    PREFETCH_BUDGET_BYTES = int(os.getenv("PREFETCH_BUDGET_BYTES", 4 * 1024 * 1024))
+    PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", 2))
+    CHUNK_CACHE_MAX_BYTES = int(os.getenv("CHUNK_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+    # Text previews of larger files come in pages of at most this many bytes
+    PREVIEW_TEXT_BYTES = int(os.getenv("PREVIEW_TEXT_BYTES", 256 * 1024))
+    
+    # Resolved Telegram document locations kept in memory
+    DOCUMENT_CACHE_SIZE = int(os.getenv("DOCUMENT_CACHE_SIZE", 10000))
+    
     # Database path - use different defaults for dev vs production
     _default_db_path = "./data" if DEV else "/app/data"
     DB_PATH = os.getenv("DB_PATH", _default_db_path)
@@ -39,6 +86,57 @@ class Settings:
     # Session Configuration  
     SESSION_EXPIRE_HOURS = int(os.getenv("SESSION_EXPIRE_HOURS", 24))
     SHARE_TOKEN_EXPIRE_MINUTES = int(os.getenv("SHARE_TOKEN_EXPIRE_MINUTES", 60))
+    # Validated share links kept in memory; revocations reach every worker through the event bus
+    SHARE_CACHE_TTL = float(os.getenv("SHARE_CACHE_TTL", 300))
+    SHARE_CACHE_SIZE = int(os.getenv("SHARE_CACHE_SIZE", 10000))
+    # Expired and revoked share links are deleted every interval (0 disables), in batches
+    SHARE_SWEEP_INTERVAL = float(os.getenv("SHARE_SWEEP_INTERVAL", 3600))
+    SHARE_SWEEP_BATCH_SIZE = int(os.getenv("SHARE_SWEEP_BATCH_SIZE", 500))
+    # Verified tokens and user principals kept in memory; user changes invalidate them at once
+    AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 60))
+    AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+    # bcrypt runs in a worker pool; logins beyond the queue limit are rejected with 429
+    AUTH_BCRYPT_ROUNDS = int(os.getenv("AUTH_BCRYPT_ROUNDS", 12))
+    AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+    AUTH_HASH_QUEUE_LIMIT = int(os.getenv("AUTH_HASH_QUEUE_LIMIT", 32))
+    # Login attempts per client IP, and failed ones per username, in each window (0 disables)
+    LOGIN_RATE_LIMIT_PER_IP = int(os.getenv("LOGIN_RATE_LIMIT_PER_IP", 30))
+    LOGIN_RATE_LIMIT_PER_USER = int(os.getenv("LOGIN_RATE_LIMIT_PER_USER", 10))
+    LOGIN_RATE_WINDOW = float(os.getenv("LOGIN_RATE_WINDOW", 60))
+
+    # Transfer progress is coalesced per operation and pushed at most this many times per second
+    PROGRESS_UPDATE_HZ = float(os.getenv("PROGRESS_UPDATE_HZ", 4))
+    # Finished operations stay queryable this long; at most PROGRESS_MAX_OPERATIONS are kept
+    PROGRESS_RETENTION_SECONDS = float(os.getenv("PROGRESS_RETENTION_SECONDS", 5))
+    PROGRESS_MAX_OPERATIONS = int(os.getenv("PROGRESS_MAX_OPERATIONS", 1000))
+
+    # Whole-file transfers running at once across all users (0 for no limit). Each user and each
+    # share link also has its own limit of concurrent transfers and of bytes per second (0 for none)
+    TRANSFER_SLOTS = int(os.getenv("TRANSFER_SLOTS", 8))
+    TRANSFER_USER_CONCURRENCY = int(os.getenv("TRANSFER_USER_CONCURRENCY", 3))
+    TRANSFER_USER_BANDWIDTH = float(os.getenv("TRANSFER_USER_BANDWIDTH", 0))
+    TRANSFER_SHARE_CONCURRENCY = int(os.getenv("TRANSFER_SHARE_CONCURRENCY", 2))
+    TRANSFER_SHARE_BANDWIDTH = float(os.getenv("TRANSFER_SHARE_BANDWIDTH", 0))
+    # Seconds of bandwidth a tenant may use in one burst
+    TRANSFER_BURST_SECONDS = float(os.getenv("TRANSFER_BURST_SECONDS", 2))
+    # Per-user limits replacing the defaults, as username=concurrency:bytes per second, comma separated
+    TRANSFER_QUOTA_OVERRIDES = dict(
+        o.strip().split("=", 1) for o in os.getenv("TRANSFER_QUOTA_OVERRIDES", "").split(",") if "=" in o
+    )
+
+    # Unix socket of the transfer daemon (python -m app.client.daemon); empty runs transfers in-process
+    TRANSFER_DAEMON_SOCKET = os.getenv("TRANSFER_DAEMON_SOCKET", "")
+
+    # Event bus between uvicorn workers: memory (single worker), sqlite (one host) or redis
+    EVENT_BUS = os.getenv("EVENT_BUS", "memory")
+    EVENT_BUS_URL = os.getenv("EVENT_BUS_URL", "")
+    # Number of uvicorn workers (uvicorn's --workers defaults to it); with more than one on
+    # the memory bus, caches look up what other workers could have changed
+    WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+
+    # WebSocket clients that fall this many frames behind, or block a send this long, are disconnected
+    WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", 64))
+    WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", 10))
     
     # CORS Origins
     ALLOWED_ORIGINS = [
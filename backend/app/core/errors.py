@@ -83,6 +83,16 @@ class ExternalServiceError(TgCloudError):
             details={"service": service}
         )
 
+class RateLimitError(TgCloudError):
+    """Request rejected by rate limiting or admission control"""
+    def __init__(self, message: str = "Too many requests", retry_after: int = 1):
+        super().__init__(
+            message=message,
+            code="RATE_LIMITED",
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            details={"retry_after": retry_after}
+        )
+
 def create_error_response(error: TgCloudError) -> JSONResponse:
     """Create standardized error response"""
     logger.error(f"TgCloudError: {error.code} - {error.message}", extra={
@@ -91,6 +101,10 @@ def create_error_response(error: TgCloudError) -> JSONResponse:
         "details": error.details
     })
     
+    headers = None
+    if "retry_after" in error.details:
+        headers = {"Retry-After": str(error.details["retry_after"])}
+
     return JSONResponse(
         status_code=error.status_code,
         content={
@@ -99,7 +113,8 @@ def create_error_response(error: TgCloudError) -> JSONResponse:
                 "code": error.code,
                 "details": error.details
             }
-        }
+        },
+        headers=headers
     )
 
 async def tgcloud_error_handler(request, exc: TgCloudError):
@@ -0,0 +1,243 @@
+"""
+Event bus carrying progress and catalog-change events between worker processes.
+
+Every event is handled in the publishing process right away and forwarded to the other
+workers through the configured backend, so a WebSocket connected to any worker receives
+the events of transfers running in any other one.
+"""
+from typing import Callable, List, Optional
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import metrics
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+EventHandler = Callable[[str, dict], None]
+
+class EventBus:
+    """In-process bus; the base class of the cross-process backends.
+    Handlers are synchronous and must not block: they run inside `publish`."""
+
+    name = "memory"
+
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex
+        self.handlers: List[EventHandler] = []
+        self.published = 0
+        self.received = 0
+
+    def subscribe(self, handler: EventHandler):
+        self.handlers.append(handler)
+
+    def dispatch(self, channel: str, event: dict):
+        for handler in self.handlers:
+            try:
+                handler(channel, event)
+            except Exception as e:
+                logger.error("Event handler failed", extra_fields={"channel": channel, "error": str(e)})
+
+    async def publish(self, channel: str, event: dict):
+        self.published += 1
+        self.dispatch(channel, event)
+        await self.forward(channel, event)
+
+    async def forward(self, channel: str, event: dict):
+        """Send an event to the other workers"""
+
+    def receive(self, origin: str, channel: str, event: dict):
+        """Dispatch an event arriving from the backend, skipping the ones this process published"""
+        if origin != self.node_id:
+            self.received += 1
+            self.dispatch(channel, event)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def metrics(self) -> dict:
+        return {"backend": self.name, "published": self.published, "received": self.received}
+
+class SQLiteEventBus(EventBus):
+    """
+    Workers on one host share an SQLite file: events are appended to a table and every
+    worker polls it for rows newer than the last one it has seen. Publishers prune old
+    rows every `prune_interval` seconds.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, poll_interval: float = 0.1, retention: float = 60, prune_interval: float = 10):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self.last_id = 0
+        self.next_prune = 0.0
+        self.task: Optional[asyncio.Task] = None
+        # One connection per bus, shared by the worker threads that poll and publish
+        self.connection: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """The bus's connection, opened and set up on first use; call with the lock held"""
+        if self.connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT, channel TEXT, payload TEXT, created_at REAL)"
+            )
+            self.connection = connection
+        return self.connection
+
+    def _insert(self, channel: str, event: dict):
+        now = time.time()
+        with self.lock, self._connect() as connection:
+            connection.execute(
+                "INSERT INTO events (origin, channel, payload, created_at) VALUES (?, ?, ?, ?)",
+                (self.node_id, channel, json.dumps(event), now)
+            )
+            if now >= self.next_prune:
+                connection.execute("DELETE FROM events WHERE created_at < ?", (now - self.retention,))
+                self.next_prune = now + self.prune_interval
+
+    def _read(self) -> list:
+        with self.lock:
+            return self._connect().execute(
+                "SELECT id, origin, channel, payload FROM events WHERE id > ? ORDER BY id", (self.last_id,)
+            ).fetchall()
+
+    def _latest_id(self) -> int:
+        with self.lock:
+            return self._connect().execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    def _close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    async def forward(self, channel: str, event: dict):
+        await asyncio.to_thread(self._insert, channel, event)
+
+    async def start(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.last_id = await asyncio.to_thread(self._latest_id)
+        self.task = asyncio.create_task(self._poll())
+
+    async def _poll(self):
+        while True:
+            try:
+                for row_id, origin, channel, payload in await asyncio.to_thread(self._read):
+                    self.last_id = row_id
+                    self.receive(origin, channel, json.loads(payload))
+            except sqlite3.Error as e:
+                logger.warning("Event bus poll failed", extra_fields={"error": str(e)})
+            await asyncio.sleep(self.poll_interval)
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        await asyncio.to_thread(self._close)
+
+class RedisEventBus(EventBus):
+    """Workers on any host exchange events through Redis (or a compatible server) pub/sub.
+    A lost connection is re-established with backoff; events sent meanwhile are missed."""
+
+    name = "redis"
+    prefix = "tgcloud:"
+    max_backoff = 30
+
+    def __init__(self, url: str):
+        super().__init__()
+        self.url = url
+        self.redis = None
+        self.task: Optional[asyncio.Task] = None
+        self.reconnects = 0
+
+    async def forward(self, channel: str, event: dict):
+        if self.redis is not None:
+            await self.redis.publish(self.prefix + channel, json.dumps({"origin": self.node_id, "event": event}))
+
+    async def start(self):
+        # Optional dependency, only needed for this backend
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(self.url)
+        self.task = asyncio.create_task(self._listen(await self._subscribe()))
+
+    async def _subscribe(self):
+        pubsub = self.redis.pubsub()
+        await pubsub.psubscribe(self.prefix + "*")
+        return pubsub
+
+    def _handle(self, message: dict):
+        if message.get("type") != "pmessage":
+            return
+        channel = message["channel"]
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        try:
+            body = json.loads(message["data"])
+            self.receive(body["origin"], channel[len(self.prefix):], body["event"])
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("Ignoring malformed event", extra_fields={"channel": channel, "error": str(e)})
+
+    async def _listen(self, pubsub):
+        """Receive events until stopped, subscribing again whenever the connection drops"""
+        delay = 0.5
+        while True:
+            try:
+                if pubsub is None:
+                    pubsub = await self._subscribe()
+                    self.reconnects += 1
+                    logger.info("Event bus reconnected", extra_fields={"backend": self.name})
+                    delay = 0.5
+                async for message in pubsub.listen():
+                    self._handle(message)
+                error = "connection closed"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            if pubsub is not None:
+                try:
+                    await pubsub.reset()
+                except Exception:
+                    pass
+                pubsub = None
+            logger.warning("Event bus connection lost", extra_fields={"backend": self.name, "error": error, "retry_in": delay})
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        if self.redis is not None:
+            await self.redis.close()
+
+    def metrics(self) -> dict:
+        return {**super().metrics(), "reconnects": self.reconnects}
+
+def build_event_bus() -> EventBus:
+    backend = settings.EVENT_BUS.lower()
+    if backend == "sqlite":
+        return SQLiteEventBus(settings.EVENT_BUS_URL or os.path.join(settings.DB_PATH, "events.db"))
+    if backend == "redis":
+        return RedisEventBus(settings.EVENT_BUS_URL or "redis://localhost:6379/0")
+    if backend != "memory":
+        logger.warning(f"Unknown event bus {settings.EVENT_BUS}, using in-process events")
+    return EventBus()
+
+# Global event bus instance
+event_bus = build_event_bus()
+metrics.register("event_bus", event_bus.metrics)
@@ -0,0 +1,47 @@
+"""
+HTTP validators for content and listings.
+
+File content is immutable per stored message (a new upload is a new message), so the
+channel and message id make a strong ETag, together with a digest of the file's names and
+type, which responses carry in their headers and a rename changes. Listings and stats change with the catalog,
+whose change-log cursor makes a weak ETag. Conditional requests get `304 Not Modified`
+before any Telegram work.
+"""
+from typing import Optional
+from fastapi import Request, Response
+import hashlib
+
+# Browsers and the reverse proxy may store responses but must revalidate them
+PRIVATE_REVALIDATE = "private, no-cache"
+PUBLIC_REVALIDATE = "public, no-cache"
+
+def content_etag(chat_id: int, message_id: int, variant: str = "", *names: Optional[str]) -> str:
+    """`names` are the catalog details served along with the content"""
+    version = ""
+    if names:
+        digest = hashlib.blake2b("\0".join(name or "" for name in names).encode(), digest_size=4).hexdigest()
+        version = "-" + digest
+    return f'"{chat_id}-{message_id}{version}{"-" + variant if variant else ""}"'
+
+def listing_etag(cursor: int, variant: str = "") -> str:
+    return f'W/"{cursor}{"-" + variant if variant else ""}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match uses the weak comparison (RFC 9110 13.1.2)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+def set_validators(response: Response, etag: str, cache_control: str = PRIVATE_REVALIDATE):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
+def not_modified(request: Request, etag: str, cache_control: str = PRIVATE_REVALIDATE) -> Optional[Response]:
+    """The 304 to send instead of the resource when the client's copy is current"""
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+    return None
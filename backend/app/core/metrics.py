@@ -0,0 +1,29 @@
+"""
+In-process metrics registry exported by the /metrics endpoint
+"""
+from typing import Callable, Dict, Any
+from app.core.logging import logger
+
+class MetricsRegistry:
+    """
+    Components register a collector returning a JSON-serialisable snapshot of their live state
+    """
+
+    def __init__(self):
+        self.collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def register(self, name: str, collector: Callable[[], Dict[str, Any]]):
+        self.collectors[name] = collector
+
+    def collect(self) -> Dict[str, Any]:
+        snapshot = {}
+        for name, collector in self.collectors.items():
+            try:
+                snapshot[name] = collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector {name} failed", extra_fields={"error": str(e)})
+                snapshot[name] = {"error": str(e)}
+        return snapshot
+
+# Global registry instance
+metrics = MetricsRegistry()
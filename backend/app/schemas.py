@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
 class FileBase(BaseModel):
     folder: str
@@ -38,10 +38,39 @@ class FileResponse(FileBase):
     id: int
     message_id: int
     uploaded_at: datetime
+    mime_type: Optional[str] = None
+    sha256: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    duration: Optional[float] = None
 
     class Config:
         from_attributes = True
 
+class ChangeResponse(BaseModel):
+    cursor: int
+    action: str
+    folder: str
+    filename: Optional[str] = None
+    details: Dict = {}
+    created_at: Optional[datetime] = None
+
+class ChangesResponse(BaseModel):
+    cursor: int
+    changes: List[ChangeResponse]
+    has_more: bool
+
+class ArchiveEntryResponse(BaseModel):
+    name: str
+    size: int
+    compressed_size: int
+    modified: datetime
+    is_dir: bool
+
+class ArchiveEntriesResponse(BaseModel):
+    filename: str
+    entries: List[ArchiveEntryResponse]
+
 class UserCreate(BaseModel):
     username: str
     password: str
@@ -73,4 +102,9 @@ class PasswordRequest(BaseModel):
 class SharedFolderResponse(BaseModel):
     foldername: str
     files: list[FileResponse]
-    created_at: datetime
\ No newline at end of file
+    created_at: datetime
+
+class RebalanceRequest(BaseModel):
+    source: Optional[int] = None
+    target: Optional[int] = None
+    max_moves: Optional[int] = None
@@ -0,0 +1,363 @@
+"""
+ZIP archives of folders streamed straight from Telegram, and a look inside stored ones.
+
+Members are read with ranged requests into small bounded queues: the next few members
+are fetched while an earlier one is being written out, and the archive is produced
+without temp files in constant memory. Entries use ZIP64 and data descriptors, so
+neither sizes nor offsets need to be known up front. Encrypted members are the
+exception: Fernet only decrypts whole files, so each is buffered (up to twice
+MAX_FILE_SIZE while it is decrypted) and fetched on its own, without read-ahead.
+
+Stored ZIP files (and the formats built on ZIP) are inspected the same way: only the
+tail and the central directory are read to list them, and only one member's bytes to
+extract it. Parsed directories are cached per stored message.
+"""
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from app.client.files_db import File
+from app.client.scheduler import Priority
+from app.client.transfers import transfers
+from app.core.config import settings
+from app.core.errors import NotFoundError, ValidationError
+from app.core.logging import logger
+from app.core.metrics import metrics
+from app.utils.encryption import decrypt_data
+import asyncio
+import bz2
+import struct
+import zipfile
+import zlib
+
+@dataclass
+class ArchiveMember:
+    """Detached description of a member; the request's DB session is gone once streaming starts"""
+    name: str
+    copies: List[Tuple[int, int]]
+    encrypted: bool
+    date_time: datetime
+
+def archive_members(files: List[File]) -> List[ArchiveMember]:
+    """Members named after the original file names, made unique within the archive"""
+    members = []
+    used = set()
+    for file in files:
+        name = file.original_name or file.filename
+        if name in used:
+            name = file.filename
+        base, counter = name, 1
+        while name in used:
+            counter += 1
+            stem, dot, extension = base.rpartition(".")
+            name = f"{stem} ({counter}).{extension}" if dot else f"{base} ({counter})"
+        used.add(name)
+        members.append(ArchiveMember(name, file.copies, bool(file.encrypted), file.uploaded_at or datetime.now()))
+    return members
+
+class _Sink:
+    """Write-only, unseekable target for ZipFile; its output is drained after every write"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+class MemberMissing(Exception):
+    pass
+
+async def _fetch_member(member: ArchiveMember, queue: asyncio.Queue, chunk_size: int, priority: Priority, tenant: Optional[str]):
+    """Put the member's chunks on `queue`, then None; an exception is put instead on failure"""
+    try:
+        offset = 0
+        # Fernet decrypts whole files only, so encrypted members (capped by MAX_FILE_SIZE) are buffered
+        encrypted = bytearray() if member.encrypted else None
+        while True:
+            data = await transfers.read_range(member.copies, offset, chunk_size, priority, tenant)
+            if data is None:
+                raise MemberMissing(member.name)
+            if data:
+                if encrypted is not None:
+                    encrypted += data
+                else:
+                    await queue.put(data)
+                offset += len(data)
+            if len(data) < chunk_size:
+                break
+        if encrypted is not None:
+            plain = await asyncio.to_thread(decrypt_data, bytes(encrypted))
+            del encrypted
+            for start in range(0, len(plain), chunk_size):
+                await queue.put(plain[start:start + chunk_size])
+        await queue.put(None)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await queue.put(e)
+
+async def stream_archive(
+    members: List[ArchiveMember],
+    read_ahead: int = settings.ARCHIVE_READ_AHEAD,
+    chunk_size: int = settings.ARCHIVE_CHUNK_SIZE,
+    buffered_chunks: int = settings.ARCHIVE_BUFFERED_CHUNKS,
+    priority: Priority = Priority.TRANSFER,
+    tenant: Optional[str] = None,
+) -> AsyncIterator[bytes]:
+    """Yield a ZIP64 archive of `members`. At most `read_ahead` members are fetched at once,
+    each holding at most `buffered_chunks` chunks, and an encrypted member only alone. Members that no longer exist are left out
+    and listed in a MISSING.txt entry; a failure in the middle of a member aborts the stream."""
+    # Like a whole-file download, the stream holds one of the tenant's transfer slots throughout
+    async with transfers.transfer_slot(tenant):
+        sink = _Sink()
+        archive = zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED)
+        pending = deque(members)
+        fetching: "deque[Tuple[ArchiveMember, asyncio.Queue, asyncio.Task]]" = deque()
+        missing = []
+
+        def fill():
+            while pending and len(fetching) < read_ahead:
+                # Encrypted members are buffered whole, so at most one is held at a time
+                if fetching and (pending[0].encrypted or any(member.encrypted for member, _, _ in fetching)):
+                    return
+                member = pending.popleft()
+                queue = asyncio.Queue(maxsize=buffered_chunks)
+                fetching.append((member, queue, asyncio.create_task(_fetch_member(member, queue, chunk_size, priority, tenant))))
+
+        try:
+            fill()
+            while fetching:
+                member, queue, task = fetching[0]
+                first = await queue.get()
+                if isinstance(first, Exception):
+                    if not isinstance(first, MemberMissing):
+                        logger.warning("Skipping archive member", extra_fields={"member": member.name, "error": str(first)})
+                    missing.append(member.name)
+                else:
+                    info = zipfile.ZipInfo(member.name, member.date_time.timetuple()[:6])
+                    info.compress_type = zipfile.ZIP_STORED
+                    with archive.open(info, "w", force_zip64=True) as entry:
+                        chunk = first
+                        while chunk is not None:
+                            if isinstance(chunk, Exception):
+                                raise chunk
+                            entry.write(chunk)
+                            yield sink.drain()
+                            chunk = await queue.get()
+                    if sink.chunks:
+                        yield sink.drain()
+                fetching.popleft()
+                await task
+                fill()
+
+            if missing:
+                archive.writestr("MISSING.txt", "Not available:\n" + "\n".join(missing) + "\n")
+            archive.close()
+            yield sink.drain()
+        finally:
+            for _, _, task in fetching:
+                task.cancel()
+            await asyncio.gather(*(task for _, _, task in fetching), return_exceptions=True)
+
+# The end of central directory record plus the longest possible archive comment
+ARCHIVE_TAIL_SIZE = 22 + 65535
+
+# Local file header: signature, versions, flags, method, time, date, CRC, sizes, name and extra lengths
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+ArchiveIndex = Dict[str, zipfile.ZipInfo]
+
+class _NeedRange(Exception):
+    def __init__(self, start: int, length: int):
+        self.start = start
+        self.length = length
+
+class _SparseFile:
+    """Seekable view of a stored document of which only some ranges have been fetched.
+    Reading anything else raises _NeedRange, so the caller can fetch it and parse again."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.position = 0
+        self.spans: Dict[int, bytes] = {}
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        base = {0: 0, 1: self.position, 2: self.size}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def read(self, n: int = -1) -> bytes:
+        if n is None or n < 0:
+            n = self.size - self.position
+        n = max(0, min(n, self.size - self.position))
+        for start, data in self.spans.items():
+            if start <= self.position and self.position + n <= start + len(data):
+                data = data[self.position - start:self.position - start + n]
+                self.position += n
+                return data
+        raise _NeedRange(self.position, n)
+
+async def _read_bytes(copies: List[Tuple[int, int]], offset: int, length: int, priority: Priority) -> bytes:
+    data = bytearray()
+    while len(data) < length:
+        chunk = await transfers.read_range(copies, offset + len(data), min(length - len(data), settings.ARCHIVE_CHUNK_SIZE), priority)
+        if chunk is None:
+            raise MemberMissing()
+        if not chunk:
+            break
+        data += chunk
+    return bytes(data)
+
+class ArchiveIndexCache:
+    """LRU cache of parsed central directories keyed by (channel, message id); a stored
+    message never changes, so entries are only ever evicted"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple[int, int], ArchiveIndex]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+
+    def get(self, key: Tuple[int, int]) -> Optional[ArchiveIndex]:
+        index = self.entries.get(key)
+        if index is not None:
+            self.entries.move_to_end(key)
+        return index
+
+    def put(self, key: Tuple[int, int], index: ArchiveIndex):
+        self.entries[key] = index
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def index(self, file: File, size: Optional[int], priority: Priority = Priority.INTERACTIVE) -> ArchiveIndex:
+        """The members of a stored ZIP file by name, parsed from its tail and central directory"""
+        key = file.copies[0]
+        index = self.get(key)
+        if index is not None:
+            self.hits += 1
+            return index
+        self.misses += 1
+        if not size:
+            raise ValidationError(f"Not a ZIP archive: {file.filename}", "filename")
+
+        sparse = _SparseFile(size)
+        start = max(0, size - ARCHIVE_TAIL_SIZE)
+        try:
+            sparse.spans[start] = await _read_bytes(file.copies, start, size - start, priority)
+            self.bytes_read += size - start
+            # zipfile finds the central directory in the tail and asks for it next
+            while True:
+                try:
+                    with zipfile.ZipFile(sparse) as archive:
+                        index = {info.filename: info for info in archive.infolist()}
+                    break
+                except _NeedRange as need:
+                    if need.start in sparse.spans or need.length > settings.ARCHIVE_INDEX_MAX_BYTES:
+                        raise ValidationError(f"The archive directory of {file.filename} is too large to list", "filename")
+                    sparse.spans[need.start] = await _read_bytes(file.copies, need.start, need.length, priority)
+                    self.bytes_read += need.length
+        except MemberMissing:
+            raise NotFoundError("File", file.filename)
+        except zipfile.BadZipFile:
+            raise ValidationError(f"Not a ZIP archive: {file.filename}", "filename")
+
+        self.put(key, index)
+        return index
+
+    def metrics(self) -> dict:
+        return {
+            "cached": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_read": self.bytes_read,
+        }
+
+def _decompressor(info: zipfile.ZipInfo):
+    if info.compress_type == zipfile.ZIP_STORED:
+        return None
+    if info.compress_type == zipfile.ZIP_DEFLATED:
+        return zlib.decompressobj(-15)
+    if info.compress_type == zipfile.ZIP_BZIP2:
+        return bz2.BZ2Decompressor()
+    raise ValidationError(f"Unsupported compression method {info.compress_type} for {info.filename}", "member")
+
+def _expand(decompressor, data: bytes, max_length: int) -> Iterator[bytes]:
+    """Decompressed output of `data` in pieces of at most `max_length` bytes, so a small
+    compressed chunk never turns into a large buffer"""
+    if decompressor is None:
+        yield data
+    elif isinstance(decompressor, bz2.BZ2Decompressor):
+        yield decompressor.decompress(data, max_length)
+        while not decompressor.needs_input and not decompressor.eof:
+            yield decompressor.decompress(b"", max_length)
+    else:
+        yield decompressor.decompress(data, max_length)
+        while decompressor.unconsumed_tail:
+            yield decompressor.decompress(decompressor.unconsumed_tail, max_length)
+
+async def member_data_offset(copies: List[Tuple[int, int]], info: zipfile.ZipInfo, priority: Priority = Priority.INTERACTIVE) -> int:
+    """Where the member's data starts, after checking it can be extracted"""
+    if info.is_dir():
+        raise ValidationError(f"{info.filename} is a directory", "member")
+    if info.flag_bits & 0x1:
+        raise ValidationError(f"{info.filename} is password protected", "member")
+    _decompressor(info)
+    try:
+        header = await _read_bytes(copies, info.header_offset, LOCAL_HEADER.size, priority)
+    except MemberMissing:
+        raise NotFoundError("File")
+    if len(header) < LOCAL_HEADER.size or header[:4] != LOCAL_HEADER_SIGNATURE:
+        raise ValidationError(f"Corrupt archive entry: {info.filename}", "member")
+    fields = LOCAL_HEADER.unpack(header)
+    return info.header_offset + LOCAL_HEADER.size + fields[10] + fields[11]
+
+async def stream_member(
+    copies: List[Tuple[int, int]],
+    info: zipfile.ZipInfo,
+    offset: int,
+    chunk_size: int = settings.ARCHIVE_CHUNK_SIZE,
+    priority: Priority = Priority.TRANSFER,
+    tenant: Optional[str] = None,
+) -> AsyncIterator[bytes]:
+    """Yield the uncompressed content of one member whose data starts at `offset`; a CRC
+    mismatch or a truncated document aborts the stream"""
+    async with transfers.transfer_slot(tenant):
+        decompressor = _decompressor(info)
+        crc = 0
+        remaining = info.compress_size
+        while remaining > 0:
+            data = await transfers.read_range(copies, offset, min(chunk_size, remaining), priority, tenant)
+            if not data:
+                raise zipfile.BadZipFile(f"{info.filename} is truncated")
+            offset += len(data)
+            remaining -= len(data)
+            for piece in _expand(decompressor, data, chunk_size):
+                if piece:
+                    crc = zlib.crc32(piece, crc)
+                    yield piece
+        if decompressor is not None and not isinstance(decompressor, bz2.BZ2Decompressor):
+            tail = decompressor.flush()
+            if tail:
+                crc = zlib.crc32(tail, crc)
+                yield tail
+        if crc != info.CRC:
+            logger.warning("Archive member failed its CRC check", extra_fields={"member": info.filename})
+            raise zipfile.BadZipFile(f"Bad CRC for {info.filename}")
+
+archive_index_cache = ArchiveIndexCache(settings.ARCHIVE_INDEX_CACHE_SIZE)
+metrics.register("archive_index", archive_index_cache.metrics)
@@ -0,0 +1,61 @@
+from typing import List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.client.files_db import Change, SessionLocal
+from app.core.events import event_bus
+import asyncio
+
+class ChangeFeed:
+    """
+    Delta sync over the catalog change log.
+    Committed changes are published on the event bus, which pushes them to WebSocket
+    clients and wakes long-polling `GET /changes` requests in every worker.
+    """
+
+    def __init__(self):
+        # Replaced on every notification, so a waiter only wakes for changes after it looked
+        self.changed = asyncio.Event()
+
+    def handle_event(self, channel: str, event: dict):
+        if channel != "catalog":
+            return
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def publish(self, change: Optional[Change]):
+        """Announce a committed change"""
+        if change is not None:
+            await event_bus.publish("catalog", change.to_dict())
+
+    async def publish_recorded(self, db: Session, change_ids: List[int]):
+        """Announce changes the transfer layer committed, possibly from the daemon's connection"""
+        if change_ids:
+            for change in db.query(Change).filter(Change.id.in_(change_ids)).order_by(Change.id):
+                await self.publish(change)
+
+    def current_cursor(self, db: Session) -> int:
+        return db.query(func.max(Change.id)).scalar() or 0
+
+    def list_changes(self, db: Session, since: int, limit: int) -> Tuple[List[Change], bool]:
+        changes = db.query(Change).filter(Change.id > since).order_by(Change.id).limit(limit + 1).all()
+        return changes[:limit], len(changes) > limit
+
+    async def wait_for_changes(self, db: Session, since: int, limit: int, timeout: float) -> Tuple[List[Change], bool]:
+        """Return changes after `since`, waiting up to `timeout` seconds for the first one.
+        `db` is closed before waiting; changes that arrive later are read with a new session."""
+        changed = self.changed
+        changes, has_more = self.list_changes(db, since, limit)
+        if changes or timeout <= 0:
+            return changes, has_more
+        # Give the pooled connection back while waiting, or a few long-polls exhaust the pool
+        db.close()
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return [], False
+        # The notification may come from another worker's connection: read the committed rows
+        with SessionLocal() as fresh:
+            return self.list_changes(fresh, since, limit)
+
+change_feed = ChangeFeed()
+event_bus.subscribe(change_feed.handle_event)
@@ -1,11 +1,12 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from fastapi import HTTPException
-from app.auth.jwt_auth import create_access_token, decode_access_token
 from datetime import datetime, timedelta
 from app.client.files_db import File, Folder, User, ShareToken
 from app.core.errors import ValidationError
+from app.services.share_service import share_cache
 import re
+import time
 
 INVALID_CHARS = re.compile(r'[\\/:"*?<>|]')
 
@@ -40,14 +41,8 @@ def get_user(username: str, db: Session):
     return db.query(User).filter_by(username=username).first()
 
 def get_used_space_in_folder(db: Session, foldername: str):
-    result = db.query(Folder.message_ids).filter_by(name=foldername).first()
-    if not result or not result[0]:
-        return 0
-    message_ids = [mid for mid in result[0].strip(",").split(",") if mid]
-    if not message_ids:
-        return 0
-    space_used = db.query(func.sum(File.size)).filter(File.message_id.in_(message_ids)).scalar() or 0
-    return space_used
+    # Sum by folder rather than by message id, which is only unique within one storage channel
+    return db.query(func.sum(File.size)).filter_by(folder=foldername).scalar() or 0
 
 def get_all_folders_used_space(db: Session):
     folders = db.query(Folder).all()
@@ -60,19 +55,36 @@ def get_all_folders_used_space(db: Session):
 def get_used_space(db: Session):
     return db.query(func.sum(File.size)).scalar() or 0
 
-def validate_share_token(db: Session, token: str, expected_type: str):
-    db_token = db.query(ShareToken).filter_by(token=token).first()
-    if not db_token or db_token.revoked:
+def validate_share_token(db: Session, token: str, expected_type: str) -> dict:
+    """Claims of a valid share token; popular links are answered from the share cache"""
+    if share_cache.is_revoked(token):
         raise HTTPException(status_code=401, detail="Share token revoked or not found")
-    
-    if db_token.expires_at < datetime.now():
-        raise HTTPException(status_code=401, detail="Share token expired")
-    
-    payload = decode_access_token(token)
+
+    cached = share_cache.get(token)
+    if cached:
+        payload, expires = cached
+        if expires < time.time():
+            raise HTTPException(status_code=401, detail="Share token expired")
+        # Another worker may have revoked the link without this one hearing about it
+        if not share_cache.sees_all_revocations:
+            row = db.query(ShareToken.revoked).filter_by(token=token).first()
+            if row is None or row.revoked:
+                raise HTTPException(status_code=401, detail="Share token revoked or not found")
+    else:
+        db_token = db.query(ShareToken).filter_by(token=token).first()
+        if not db_token or db_token.revoked:
+            raise HTTPException(status_code=401, detail="Share token revoked or not found")
+
+        if db_token.expires_at < datetime.now():
+            raise HTTPException(status_code=401, detail="Share token expired")
+
+        payload = db_token.claims
+        share_cache.put(token, payload, db_token.expires_at)
+
     if payload.get("type") != expected_type:
         raise HTTPException(status_code=400, detail="Invalid share token")
     
-    return payload, db_token
+    return payload
 
 def get_share_token(token: str, owner: str, db: Session):
     return db.query(ShareToken).filter_by(token=token, owner=owner).first()
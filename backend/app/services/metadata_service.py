@@ -0,0 +1,104 @@
+from typing import Optional
+from PIL import Image
+import hashlib
+import mimetypes
+import struct
+import wave
+
+MP4_CONTAINER_BOXES = {b"moov"}
+MP4_EXTENSIONS = (".mp4", ".m4v", ".m4a", ".mov", ".3gp")
+
+class MetadataExtractor:
+    """Collects catalog metadata for an upload while its bytes stream to disk.
+    Feed every chunk to update(), then call finalize() once the file is complete."""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def update(self, chunk: bytes):
+        self.hasher.update(chunk)
+        self.size += len(chunk)
+
+    def finalize(self, path: str) -> dict:
+        mime_type, _ = mimetypes.guess_type(self.filename)
+        metadata = {
+            "mime_type": mime_type or "application/octet-stream",
+            "sha256": self.hasher.hexdigest(),
+            "width": None,
+            "height": None,
+            "duration": None,
+        }
+
+        image_info = read_image_info(path)
+        if image_info:
+            metadata["mime_type"], metadata["width"], metadata["height"] = image_info
+        elif metadata["mime_type"] in ("audio/x-wav", "audio/wav"):
+            metadata["duration"] = read_wav_duration(path)
+        elif self.filename.lower().endswith(MP4_EXTENSIONS):
+            metadata["duration"] = read_mp4_duration(path)
+
+        return metadata
+
+def read_image_info(path: str) -> Optional[tuple]:
+    """Return (mime_type, width, height) by reading only the image header"""
+    try:
+        with Image.open(path) as image:
+            mime_type = Image.MIME.get(image.format)
+            if not mime_type:
+                return None
+            return mime_type, image.width, image.height
+    except Exception:
+        return None
+
+def read_wav_duration(path: str) -> Optional[float]:
+    try:
+        with wave.open(path, "rb") as audio:
+            rate = audio.getframerate()
+            return audio.getnframes() / rate if rate else None
+    except Exception:
+        return None
+
+def read_mp4_duration(path: str) -> Optional[float]:
+    """Read the duration from the mvhd box, seeking past media data instead of reading it"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, 2)
+            end = f.tell()
+            f.seek(0)
+            return _find_mvhd_duration(f, end)
+    except (OSError, struct.error, IndexError, ValueError):
+        return None
+
+def _find_mvhd_duration(f, end: int) -> Optional[float]:
+    while f.tell() + 8 <= end:
+        start = f.tell()
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - start
+        if size < header:
+            return None
+
+        if box_type == b"mvhd":
+            version_and_flags = f.read(4)
+            if len(version_and_flags) < 4:
+                return None  # truncated file
+            version = version_and_flags[0]
+            if version == 1:
+                _, _, timescale, duration = struct.unpack(">QQIQ", f.read(28))
+            else:
+                _, _, timescale, duration = struct.unpack(">IIII", f.read(16))
+            return duration / timescale if timescale else None
+
+        if box_type in MP4_CONTAINER_BOXES:
+            found = _find_mvhd_duration(f, start + size)
+            if found is not None:
+                return found
+
+        f.seek(start + size)
+    return None
@@ -0,0 +1,200 @@
+"""
+Read-ahead for folder browsing and shared folders.
+
+Opening a folder usually leads to previews of several of its files. The prefetcher warms
+a byte-budgeted chunk cache with the head of the files most likely to be opened next, and
+the thumbnail cache with the thumbnails Telegram attached to images, using BULK priority
+so it never delays what a user is waiting on. Small previews are then served from memory.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from app.client.files_db import File
+from app.client.scheduler import Priority
+from app.client.transfers import transfers
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import metrics
+from app.services.thumbnail_service import thumbnail_cache, is_thumbnailable
+import asyncio
+import mimetypes
+
+# Cached reads are aligned to Telegram's largest download request
+CHUNK_SIZE = 512 * 1024
+
+# Types people preview in a row, most likely first
+PREVIEW_RANK = ("image/", "application/pdf", "text/", "video/", "audio/")
+
+ChunkKey = Tuple[int, int, int]
+
+class ChunkCache:
+    """LRU cache of document chunks keyed by (channel, message id, chunk index), bounded in bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: "OrderedDict[ChunkKey, bytes]" = OrderedDict()
+        self.inflight: Dict[ChunkKey, Tuple[asyncio.Task, Priority]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: ChunkKey) -> Optional[bytes]:
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+        return data
+
+    def put(self, key: ChunkKey, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self.entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    async def chunk(self, copies: List[Tuple[int, int]], index: int, priority: Priority, tenant: Optional[str] = None) -> Optional[bytes]:
+        """One chunk of a document, fetched at most once however many readers want it; the
+        reader starting the fetch is charged for it as `tenant`"""
+        chat, message_id = copies[0]
+        key = (chat, message_id, index)
+        data = self.get(key)
+        if data is not None:
+            self.hits += 1
+            return data
+        self.misses += 1
+        inflight = self.inflight.get(key)
+        # Join a running fetch unless it was queued at a lower priority than this reader's
+        if inflight is None or inflight[1] > priority:
+            task = asyncio.create_task(transfers.read_range(copies, index * CHUNK_SIZE, CHUNK_SIZE, priority, tenant))
+            self.inflight[key] = (task, priority)
+
+            def forget(done: asyncio.Task):
+                if key in self.inflight and self.inflight[key][0] is done:
+                    del self.inflight[key]
+
+            task.add_done_callback(forget)
+        else:
+            task = inflight[0]
+        data = await asyncio.shield(task)
+        if data is not None:
+            self.put(key, data)
+        return data
+
+    async def read(self, copies: List[Tuple[int, int]], offset: int, limit: int, priority: Priority = Priority.INTERACTIVE, tenant: Optional[str] = None) -> Optional[bytes]:
+        """Up to `limit` bytes at `offset` through the cache; None when the document is gone.
+        Meant for small reads: everything read stays cached."""
+        result = bytearray()
+        index, skip = divmod(offset, CHUNK_SIZE)
+        while len(result) < limit:
+            data = await self.chunk(copies, index, priority, tenant)
+            if data is None:
+                return None
+            result += data[skip:skip + limit - len(result)]
+            if len(data) < CHUNK_SIZE:
+                break
+            index, skip = index + 1, 0
+        return bytes(result)
+
+    def cached_bytes(self, copies: List[Tuple[int, int]], length: int) -> bool:
+        chat, message_id = copies[0]
+        return all((chat, message_id, index) in self.entries for index in range(max(1, -(-length // CHUNK_SIZE))))
+
+@dataclass
+class PrefetchTarget:
+    copies: List[Tuple[int, int]]
+    size: int
+    thumbnail: bool
+    tenant: Optional[str]
+
+def file_size(file: File) -> Optional[int]:
+    try:
+        return int(file.size)
+    except (TypeError, ValueError):
+        return None
+
+def preview_rank(file: File) -> int:
+    mime_type = file.mime_type or mimetypes.guess_type(file.original_name or file.filename)[0] or ""
+    for rank, prefix in enumerate(PREVIEW_RANK):
+        if mime_type.startswith(prefix):
+            return rank
+    return len(PREVIEW_RANK)
+
+class Prefetcher:
+    """Warms the caches for the files of a folder that was just opened, within a byte budget"""
+
+    def __init__(self, head_bytes: int, max_files: int, budget_bytes: int, concurrency: int):
+        self.head_bytes = head_bytes
+        self.max_files = max_files
+        self.budget_bytes = budget_bytes
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.tasks: Dict[Tuple[int, int], asyncio.Task] = {}
+        self.prefetched_bytes = 0
+        self.thumbnails = 0
+        self.failures = 0
+
+    def plan(self, files: List[File], tenant: Optional[str] = None) -> List[PrefetchTarget]:
+        """Previewable files first, in listing order, until the budget is spent"""
+        targets = []
+        budget = self.budget_bytes
+        for file in sorted(files, key=preview_rank):
+            if len(targets) >= self.max_files or budget <= 0:
+                break
+            # Encrypted documents hold ciphertext: their head cannot be previewed on its own
+            if file.encrypted or preview_rank(file) == len(PREVIEW_RANK):
+                continue
+            size = min(file_size(file) or self.head_bytes, self.head_bytes)
+            if size > budget or chunk_cache.cached_bytes(file.copies, size):
+                continue
+            budget -= size
+            thumbnail = is_thumbnailable(file.original_name or file.filename, file.mime_type)
+            targets.append(PrefetchTarget(file.copies, size, thumbnail, tenant))
+        return targets
+
+    def schedule(self, files: List[File], tenant: Optional[str] = None):
+        """Start prefetching in the background, charged to the tenant who opened the folder; returns at once"""
+        if self.max_files <= 0:
+            return
+        for target in self.plan(files, tenant):
+            key = target.copies[0]
+            if key not in self.tasks:
+                self.tasks[key] = asyncio.create_task(self._prefetch(target))
+                self.tasks[key].add_done_callback(lambda _, key=key: self.tasks.pop(key, None))
+
+    async def _prefetch(self, target: PrefetchTarget):
+        async with self.semaphore:
+            try:
+                if target.thumbnail and thumbnail_cache.get(target.copies[0]) is None:
+                    data = await transfers.download_thumbnail(target.copies, Priority.BULK)
+                    if data:
+                        thumbnail_cache.put(target.copies[0], data)
+                        self.thumbnails += 1
+                data = await chunk_cache.read(target.copies, 0, target.size, Priority.BULK, target.tenant)
+                self.prefetched_bytes += len(data or b"")
+            except Exception as e:
+                self.failures += 1
+                logger.debug("Prefetch failed", extra_fields={"copies": target.copies, "error": str(e)})
+
+    def metrics(self) -> dict:
+        return {
+            "cache_bytes": chunk_cache.size,
+            "cache_chunks": len(chunk_cache.entries),
+            "cache_hits": chunk_cache.hits,
+            "cache_misses": chunk_cache.misses,
+            "running": len(self.tasks),
+            "prefetched_bytes": self.prefetched_bytes,
+            "thumbnails": self.thumbnails,
+            "failures": self.failures,
+        }
+
+chunk_cache = ChunkCache(settings.CHUNK_CACHE_MAX_BYTES)
+prefetcher = Prefetcher(
+    settings.PREFETCH_HEAD_BYTES,
+    settings.PREFETCH_MAX_FILES,
+    settings.PREFETCH_BUDGET_BYTES,
+    settings.PREFETCH_CONCURRENCY,
+)
+metrics.register("prefetch", prefetcher.metrics)
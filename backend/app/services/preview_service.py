@@ -0,0 +1,57 @@
+"""
+Paged previews of text files.
+
+Logs and CSV exports can be hundreds of megabytes while the browser shows one screen of
+them. Text previews read a page at a byte offset through the chunk cache, cut it at a
+line (or at least a UTF-8 character) boundary, and tell the client where the next page
+starts.
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from app.client.scheduler import Priority
+from app.services.prefetch_service import chunk_cache
+
+# Text formats that are not text/*
+TEXT_MIME_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/xml",
+    "application/javascript",
+    "application/x-yaml",
+    "application/yaml",
+    "application/x-sh",
+    "application/sql",
+    "application/csv",
+}
+
+@dataclass
+class TextPage:
+    data: bytes
+    offset: int
+    next_offset: Optional[int]  # None on the last page
+
+def is_text(mime_type: Optional[str]) -> bool:
+    return bool(mime_type) and (mime_type.startswith("text/") or mime_type in TEXT_MIME_TYPES)
+
+def page_end(data: bytes) -> int:
+    """Length of `data` without a trailing partial line, or partial UTF-8 character if there is a single line"""
+    newline = data.rfind(b"\n")
+    if newline >= 0:
+        return newline + 1
+    # Step back over the continuation bytes of a character that is cut off
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 != 0x80:
+            lead_length = 2 if byte & 0xE0 == 0xC0 else 3 if byte & 0xF0 == 0xE0 else 4 if byte & 0xF8 == 0xF0 else 1
+            return len(data) - back if lead_length > back else len(data)
+    return len(data)
+
+async def read_text_page(copies: List[Tuple[int, int]], size: Optional[int], offset: int, limit: int, tenant: Optional[str] = None) -> Optional[TextPage]:
+    """The page of a text document starting at `offset`; None when the document is gone"""
+    data = await chunk_cache.read(copies, offset, limit, Priority.INTERACTIVE, tenant)
+    if data is None:
+        return None
+    last = len(data) < limit or (size is not None and offset + len(data) >= size)
+    if not last:
+        data = data[:page_end(data) or len(data)]
+    return TextPage(data, offset, None if last else offset + len(data))
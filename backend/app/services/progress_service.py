@@ -1,63 +1,241 @@
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple, Union
+from app.core.config import settings
+from app.core.events import event_bus
+from app.core.logging import logger
+from app.core.metrics import metrics
 import asyncio
+import itertools
 import json
+import time
 from datetime import datetime
 
+class ConnectionWriter:
+    """
+    Outbound queue of one WebSocket drained by its own writer task, so a slow client
+    never delays the transfer reporting progress or the user's other connections.
+    A frame sent with a key replaces the queued frame with the same key (older progress
+    of the same operation). A client whose queue overflows or whose send stalls for
+    longer than the timeout is disconnected.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        on_close: Callable[["ConnectionWriter", Optional[str]], None],
+        max_queue: int = settings.WS_SEND_QUEUE_SIZE,
+        send_timeout: float = settings.WS_SEND_TIMEOUT,
+    ):
+        self.websocket = websocket
+        self.on_close = on_close
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.queue: "OrderedDict[Hashable, Union[dict, str]]" = OrderedDict()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.replaced = 0
+        self._sequence = itertools.count()
+        self.task = asyncio.create_task(self._run())
+
+    def send(self, message: Union[dict, str], key: Optional[Hashable] = None) -> bool:
+        """Queue a frame without waiting; returns False once the connection is closed"""
+        if self.closed:
+            return False
+        if key is not None and key in self.queue:
+            del self.queue[key]
+            self.replaced += 1
+        elif len(self.queue) >= self.max_queue:
+            self.close("send queue overflow")
+            return False
+        self.queue[key if key is not None else ("frame", next(self._sequence))] = message
+        self.ready.set()
+        return True
+
+    async def _run(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while self.queue:
+                _, message = self.queue.popitem(last=False)
+                text = message if isinstance(message, str) else json.dumps(message)
+                try:
+                    await asyncio.wait_for(self.websocket.send_text(text), self.send_timeout)
+                except asyncio.TimeoutError:
+                    self.close("send timed out")
+                    return
+                except Exception:
+                    self.close(None)
+                    return
+
+    def close(self, reason: Optional[str]):
+        """Stop writing; with a reason the client is considered too slow and the socket is closed"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.on_close(self, reason)
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
+        if reason:
+            logger.warning("Disconnecting slow WebSocket client", extra_fields={"reason": reason})
+            asyncio.get_running_loop().create_task(self._close_socket(reason))
+
+    async def _close_socket(self, reason: str):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=1013, reason=reason), self.send_timeout)
+        except Exception:
+            pass
+
 class ProgressManager:
-    def __init__(self):
+    def __init__(
+        self,
+        update_hz: float = settings.PROGRESS_UPDATE_HZ,
+        retention: float = settings.PROGRESS_RETENTION_SECONDS,
+        max_operations: int = settings.PROGRESS_MAX_OPERATIONS,
+    ):
         self.progress_data: Dict[str, dict] = {}
-        self.connections: Dict[str, List[WebSocket]] = {}
+        self.retention = retention
+        self.max_operations = max_operations
+        # Finished operations in completion order with their expiry time; one TTL keeps it sorted
+        self.expiry: "OrderedDict[str, float]" = OrderedDict()
+        self.sweeper = None
+        self.connections: Dict[str, Dict[WebSocket, ConnectionWriter]] = {}
+        self.slow_disconnects = 0
+        self.flush_interval = 1 / update_hz
+        # Latest unsent state per operation: (user id, render function, render arguments)
+        self.pending: Dict[str, Tuple[str, Callable[..., dict], tuple]] = {}
+        self.flusher = None
     
     async def connect(self, websocket: WebSocket, user_id: str):
         await websocket.accept()
         if user_id not in self.connections:
-            self.connections[user_id] = []
-        self.connections[user_id].append(websocket)
-    
+            self.connections[user_id] = {}
+
+        def on_close(writer: ConnectionWriter, reason: Optional[str]):
+            if self.connections.get(user_id, {}).get(websocket) is writer:
+                self._remove(websocket, user_id)
+            if reason:
+                self.slow_disconnects += 1
+
+        self.connections[user_id][websocket] = ConnectionWriter(websocket, on_close)
+
+    def send(self, websocket: WebSocket, user_id: str, text: str):
+        """Queue a frame on one connection, e.g. a reply to the client"""
+        writer = self.connections.get(user_id, {}).get(websocket)
+        if writer:
+            writer.send(text)
+
+    def _remove(self, websocket: WebSocket, user_id: str) -> Optional[ConnectionWriter]:
+        writers = self.connections.get(user_id)
+        if writers is None:
+            return None
+        writer = writers.pop(websocket, None)
+        if not writers:
+            del self.connections[user_id]
+        return writer
+
     def disconnect(self, websocket: WebSocket, user_id: str):
-        if user_id in self.connections:
-            if websocket in self.connections[user_id]:
-                self.connections[user_id].remove(websocket)
-            if not self.connections[user_id]:
-                del self.connections[user_id]
+        writer = self._remove(websocket, user_id)
+        if writer:
+            writer.close(None)
     
     async def update_progress(self, operation_id: str, user_id: str, progress_info: dict):
-        self.progress_data[operation_id] = {
-            **progress_info,
-            'timestamp': datetime.now().isoformat()
-        }
-        
+        """Publish the state of an operation to every worker, which pass it on to their sockets"""
+        await event_bus.publish("progress", {
+            'operation_id': operation_id,
+            'user_id': user_id,
+            'data': {
+                **progress_info,
+                'timestamp': datetime.now().isoformat()
+            }
+        })
+
+    def handle_event(self, channel: str, event: dict):
+        if channel == "progress":
+            self._apply_progress(event['operation_id'], event['user_id'], event['data'])
+        elif channel == "catalog":
+            message = {'type': 'catalog_change', 'data': event}
+            for writers in list(self.connections.values()):
+                for writer in list(writers.values()):
+                    writer.send(message)
+
+    def _apply_progress(self, operation_id: str, user_id: str, data: dict):
+        self.progress_data[operation_id] = data
+        # Operations that never complete must not grow the table forever: drop the oldest
+        while len(self.progress_data) > self.max_operations:
+            oldest = next(iter(self.progress_data))
+            del self.progress_data[oldest]
+            self.expiry.pop(oldest, None)
+
+        if data.get('status') in ('completed', 'failed'):
+            self.expiry.pop(operation_id, None)
+            self.expiry[operation_id] = time.monotonic() + self.retention
+            if self.sweeper is None or self.sweeper.done():
+                self.sweeper = asyncio.get_running_loop().create_task(self._sweep_expired())
+
         if user_id in self.connections:
             message = {
                 'type': 'progress_update',
                 'operation_id': operation_id,
-                'data': self.progress_data[operation_id]
+                'data': data
             }
-            
-            disconnected = []
-            for websocket in self.connections[user_id]:
-                try:
-                    await websocket.send_text(json.dumps(message))
-                except:
-                    disconnected.append(websocket)
-            
-            for ws in disconnected:
-                self.disconnect(ws, user_id)
+
+            # Each connection has its own writer, so this never waits for a socket
+            for writer in list(self.connections[user_id].values()):
+                writer.send(message, key=('progress', operation_id))
     
+    def report(self, operation_id: str, user_id: str, render: Callable[..., dict], *args):
+        """Record the latest state of a running transfer without waiting for any socket.
+        Meant for transfer progress callbacks: `render(*args)` builds the progress info
+        only when the state is flushed, and intermediate states are dropped."""
+        self.pending[operation_id] = (user_id, render, args)
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.get_running_loop().create_task(self._flush_pending())
+
+    async def _flush_pending(self):
+        while self.pending:
+            await asyncio.sleep(self.flush_interval)
+            pending, self.pending = self.pending, {}
+            for operation_id, (user_id, render, args) in pending.items():
+                if self.progress_data.get(operation_id, {}).get('status') in ('completed', 'failed'):
+                    continue
+                await self.update_progress(operation_id, user_id, render(*args))
+
     async def complete_operation(self, operation_id: str, user_id: str, success: bool = True):
+        # A queued intermediate state must not overwrite the final one
+        self.pending.pop(operation_id, None)
         await self.update_progress(operation_id, user_id, {
             'progress': 100,
             'status': 'completed' if success else 'failed',
             'speed': '0 B/s',
             'eta': '0s'
         })
-        
-        await asyncio.sleep(5)
-        if operation_id in self.progress_data:
-            del self.progress_data[operation_id]
+
+    async def _sweep_expired(self):
+        """Forget finished operations once their retention has passed"""
+        while self.expiry:
+            deadline = next(iter(self.expiry.values()))
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+            now = time.monotonic()
+            while self.expiry and next(iter(self.expiry.values())) <= now:
+                operation_id, _ = self.expiry.popitem(last=False)
+                self.progress_data.pop(operation_id, None)
     
     def get_progress(self, operation_id: str) -> dict:
         return self.progress_data.get(operation_id, {})
 
+    def metrics(self) -> dict:
+        writers = [writer for user in self.connections.values() for writer in user.values()]
+        return {
+            "connections": len(writers),
+            "queued_frames": sum(len(writer.queue) for writer in writers),
+            "replaced_frames": sum(writer.replaced for writer in writers),
+            "slow_disconnects": self.slow_disconnects,
+            "pending_operations": len(self.pending),
+            "tracked_operations": len(self.progress_data),
+        }
+
 progress_manager = ProgressManager()
+event_bus.subscribe(progress_manager.handle_event)
+metrics.register("websockets", progress_manager.metrics)
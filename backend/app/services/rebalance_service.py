@@ -0,0 +1,109 @@
+from typing import List, Optional, Tuple
+from sqlalchemy import Integer, cast, or_
+from sqlalchemy.orm import Session
+from app.client.client import copy_message_to_channel, delete_stored_messages
+from app.client.files_db import SessionLocal, File, Folder, record_change
+from app.client.placement import channel_usage
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import metrics
+from app.services.change_service import change_feed
+
+rebalance_state = {"running": False, "planned": 0, "moved": 0, "failed": 0, "last_error": None}
+metrics.register("rebalance", lambda: dict(rebalance_state))
+
+def _files_in_channel(db: Session, chat: int):
+    query = db.query(File)
+    if chat == settings.TG_CHAT_ID:
+        query = query.filter(or_(File.chat_id == chat, File.chat_id.is_(None)))
+    else:
+        query = query.filter(File.chat_id == chat)
+    return query.order_by(cast(File.size, Integer).desc())
+
+def plan_rebalance(db: Session, source: Optional[int] = None, target: Optional[int] = None, max_moves: Optional[int] = None) -> List[Tuple[int, int]]:
+    """Return (file id, target channel) moves.
+    With a source channel every file in it is moved (to `target` or the emptiest channel);
+    otherwise files move from channels above the mean size until the channels are even."""
+    channels = list(settings.TG_CHAT_IDS)
+    usage = {chat: entry["bytes"] for chat, entry in channel_usage(db).items() if chat in channels}
+    moves = []
+
+    if source is not None:
+        destinations = [target] if target is not None else [c for c in channels if c != source]
+        for file in _files_in_channel(db, source):
+            destination = min(destinations, key=lambda chat: usage.get(chat, 0))
+            usage[destination] = usage.get(destination, 0) + int(file.size or 0)
+            moves.append((file.id, destination))
+        return moves[:max_moves] if max_moves else moves
+
+    if len(channels) < 2:
+        return moves
+    mean = sum(usage.values()) / len(channels)
+    for chat in sorted(channels, key=lambda c: usage.get(c, 0), reverse=True):
+        if usage.get(chat, 0) <= mean:
+            break
+        for file in _files_in_channel(db, chat):
+            size = int(file.size or 0)
+            destination = min(channels, key=lambda c: usage.get(c, 0))
+            # Only move when it narrows the gap between the two channels
+            if usage[chat] <= mean or usage[chat] - usage.get(destination, 0) <= size:
+                continue
+            usage[chat] -= size
+            usage[destination] = usage.get(destination, 0) + size
+            moves.append((file.id, destination))
+            if max_moves and len(moves) >= max_moves:
+                return moves
+    return moves
+
+async def _migrate_file(db: Session, file_id: int, target: int) -> bool:
+    file = db.query(File).filter_by(id=file_id).first()
+    # Skip files whose primary copy or a replica already lives in the target channel
+    if not file or any(chat == target for chat, _ in file.copies):
+        return False
+
+    source, old_message_id = file.storage_chat_id, file.message_id
+    message = await copy_message_to_channel(source, old_message_id, target)
+    if message is None:
+        return False
+
+    # The row may have been deleted while the copy was in flight
+    db.expire_all()
+    file = db.query(File).filter_by(id=file_id).first()
+    if not file:
+        await delete_stored_messages(target, [message.id])
+        return False
+
+    file.chat_id = target
+    file.message_id = message.id
+    folder = db.query(Folder).filter_by(name=file.folder).first()
+    if folder and folder.message_ids:
+        folder.message_ids = ",".join(
+            str(message.id) if mid == str(old_message_id) else mid
+            for mid in folder.message_ids.split(",") if mid
+        )
+    # Listings carry the storage location, so the move must advance the change cursor
+    change = record_change(db, "file_migrated", file.folder, file.filename, chat_id=target)
+    db.commit()
+    await change_feed.publish(change)
+
+    await delete_stored_messages(source, [old_message_id])
+    return True
+
+async def run_rebalance(moves: List[Tuple[int, int]]):
+    """Migrate files between channels one at a time with bulk priority"""
+    rebalance_state.update(running=True, planned=len(moves), moved=0, failed=0, last_error=None)
+    db = SessionLocal()
+    try:
+        for file_id, target in moves:
+            try:
+                if await _migrate_file(db, file_id, target):
+                    rebalance_state["moved"] += 1
+            except Exception as e:
+                db.rollback()
+                rebalance_state["failed"] += 1
+                rebalance_state["last_error"] = str(e)
+                logger.error("Could not migrate file", extra_fields={"file_id": file_id, "target": target, "error": str(e)})
+    finally:
+        db.close()
+        rebalance_state["running"] = False
+        logger.info("Channel rebalance finished", extra_fields=dict(rebalance_state))
@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from app.client.files_db import SessionLocal, ShareToken
+from app.core.config import settings
+from app.core.events import event_bus
+from app.core.logging import logger
+from app.core.metrics import metrics
+import asyncio
+import hashlib
+import time
+
+def token_key(token: str) -> int:
+    """64-bit digest of a share token; the caches never hold the long token strings"""
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "big")
+
+class ShareTokenCache:
+    """
+    Validated share tokens, so popular links are served without a DB lookup or JWT decode.
+    Revocations go into a compact set of token digests, each kept only until the token
+    would have expired anyway, and reach every worker through the event bus. Validated
+    entries are re-checked against the database after `ttl` seconds as a safety net.
+
+    The in-process (memory) event bus does not reach other workers, so when several
+    workers share it (WEB_CONCURRENCY > 1) cached links have their revoked flag looked up
+    on every use.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # digest -> (claims, token expiry timestamp, cached until)
+        self.validated: "OrderedDict[int, Tuple[dict, float, float]]" = OrderedDict()
+        # digest -> token expiry timestamp
+        self.revoked: Dict[int, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Tuple[dict, float]]:
+        """Cached (claims, expiry) of a validated token that has not been revoked"""
+        key = token_key(token)
+        entry = self.validated.get(key)
+        if entry is None or entry[2] <= time.monotonic():
+            if entry is not None:
+                del self.validated[key]
+            self.misses += 1
+            return None
+        self.validated.move_to_end(key)
+        self.hits += 1
+        return entry[0], entry[1]
+
+    def put(self, token: str, claims: dict, expires_at: datetime):
+        key = token_key(token)
+        if key in self.revoked:
+            return
+        self.validated[key] = (claims, expires_at.timestamp(), time.monotonic() + self.ttl)
+        self.validated.move_to_end(key)
+        while len(self.validated) > self.max_entries:
+            self.validated.popitem(last=False)
+
+    def is_revoked(self, token: str) -> bool:
+        return token_key(token) in self.revoked
+
+    @property
+    def sees_all_revocations(self) -> bool:
+        """Whether revocations made by any worker reach this cache"""
+        return event_bus.name != "memory" or settings.WEB_CONCURRENCY <= 1
+
+    def _revoke(self, key: int, expires: float):
+        self.validated.pop(key, None)
+        now = time.time()
+        # Expired tokens are rejected by their expiry, so their revocations can go
+        for stale in [k for k, e in self.revoked.items() if e <= now]:
+            del self.revoked[stale]
+        if expires > now:
+            self.revoked[key] = expires
+
+    async def revoke(self, token: str, expires_at: datetime):
+        """Reject a token from now on, in this and every other worker"""
+        await event_bus.publish("shares", {"revoked": token_key(token), "expires": expires_at.timestamp()})
+
+    def handle_event(self, channel: str, event: dict):
+        if channel == "shares" and "revoked" in event:
+            self._revoke(event["revoked"], event["expires"])
+
+    def metrics(self) -> dict:
+        return {
+            "validated": len(self.validated),
+            "revoked": len(self.revoked),
+            "hits": self.hits,
+            "misses": self.misses,
+            "swept": share_sweeper.deleted,
+        }
+
+class ShareTokenSweeper:
+    """Deletes expired and revoked share links in small batches, keeping the table and its
+    index small without holding the SQLite write lock for long"""
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.deleted = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def _delete_batch(self, condition) -> int:
+        db = SessionLocal()
+        try:
+            ids = [row.id for row in db.query(ShareToken.id).filter(condition).limit(self.batch_size)]
+            if ids:
+                db.query(ShareToken).filter(ShareToken.id.in_(ids)).delete(synchronize_session=False)
+                db.commit()
+            return len(ids)
+        finally:
+            db.close()
+
+    async def sweep(self) -> int:
+        deleted = 0
+        # Two passes rather than one OR, which SQLite answers with a full table scan: expired
+        # rows come straight off the expires_at index, and revoked ones off the revoked index
+        for condition in (ShareToken.expires_at < datetime.now(), ShareToken.revoked.is_(True)):
+            while True:
+                count = await asyncio.to_thread(self._delete_batch, condition)
+                deleted += count
+                if count < self.batch_size:
+                    break
+                await asyncio.sleep(0.1)  # let other writers in between batches
+        self.deleted += deleted
+        return deleted
+
+    async def _run(self):
+        while True:
+            try:
+                deleted = await self.sweep()
+                if deleted:
+                    logger.info("Swept share links", extra_fields={"deleted": deleted})
+            except Exception as e:
+                logger.warning("Share link sweep failed", extra_fields={"error": str(e)})
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self.interval > 0:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+
+share_cache = ShareTokenCache(settings.SHARE_CACHE_TTL, settings.SHARE_CACHE_SIZE)
+event_bus.subscribe(share_cache.handle_event)
+metrics.register("share_cache", share_cache.metrics)
+share_sweeper = ShareTokenSweeper(settings.SHARE_SWEEP_INTERVAL, settings.SHARE_SWEEP_BATCH_SIZE)
@@ -0,0 +1,112 @@
+from collections import OrderedDict
+from typing import BinaryIO, Dict, Optional, Tuple, Union
+from PIL import Image, ImageOps
+import asyncio
+import io
+import mimetypes
+from app.client.transfers import transfers
+from app.client.files_db import File
+from app.client.scheduler import Priority
+from app.core.config import settings
+from app.utils.encryption import decrypt_data
+
+THUMBNAIL_MEDIA_TYPE = "image/jpeg"
+
+class ThumbnailCache:
+    """LRU cache of rendered thumbnails bounded by total size in bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: "OrderedDict[Tuple[int, int], bytes]" = OrderedDict()
+
+    def get(self, key: Tuple[int, int]) -> Optional[bytes]:
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+        return data
+
+    def put(self, key: Tuple[int, int], data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        self.discard(key)
+        self.entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def discard(self, key: Tuple[int, int]):
+        data = self.entries.pop(key, None)
+        if data is not None:
+            self.size -= len(data)
+
+thumbnail_cache = ThumbnailCache(settings.THUMBNAIL_CACHE_MAX_BYTES)
+_pending: Dict[Tuple[int, int], asyncio.Future] = {}
+
+def is_thumbnailable(filename: str, mime_type: Optional[str] = None) -> bool:
+    if not mime_type:
+        mime_type, _ = mimetypes.guess_type(filename)
+    return bool(mime_type and mime_type.startswith("image/"))
+
+def render_thumbnail(source: Union[str, BinaryIO], size: int = settings.THUMBNAIL_SIZE) -> bytes:
+    """Downscale an image (a path or a file object) to a JPEG that fits in a size x size box"""
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=80, optimize=True)
+        return buffer.getvalue()
+
+async def _fetch_thumbnail(file_db: File, tenant: Optional[str]) -> Optional[bytes]:
+    # Encrypted documents hold ciphertext, so Telegram never has a usable thumbnail for them
+    if not file_db.encrypted:
+        data = await transfers.download_thumbnail(file_db.copies)
+        if data:
+            return data
+
+    # Read into memory rather than through the shared downloads directory, where the file
+    # may be in the middle of being served by a concurrent download
+    data = bytearray()
+    while True:
+        chunk = await transfers.read_range(file_db.copies, len(data), settings.ARCHIVE_CHUNK_SIZE, Priority.INTERACTIVE, tenant)
+        if chunk is None:
+            return None
+        data += chunk
+        if len(chunk) < settings.ARCHIVE_CHUNK_SIZE:
+            break
+    if file_db.encrypted:
+        data = await asyncio.to_thread(decrypt_data, bytes(data))
+    return await asyncio.to_thread(render_thumbnail, io.BytesIO(data))
+
+async def get_thumbnail(file_db: File, tenant: Optional[str] = None) -> Optional[bytes]:
+    """Return a cached thumbnail, fetching it from Telegram or rendering it at most once;
+    `tenant` is charged for reading a whole file to render it"""
+    key = (file_db.storage_chat_id, file_db.message_id)
+    data = thumbnail_cache.get(key)
+    if data is not None:
+        return data
+
+    # Concurrent requests for the same image share a single fetch
+    if key in _pending:
+        return await asyncio.shield(_pending[key])
+
+    future = asyncio.get_running_loop().create_future()
+    _pending[key] = future
+    try:
+        data = await _fetch_thumbnail(file_db, tenant)
+        if data:
+            thumbnail_cache.put(key, data)
+        future.set_result(data)
+        return data
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        del _pending[key]
+        if not future.done():
+            future.cancel()
+        elif not future.cancelled():
+            future.exception()  # mark retrieved so unawaited failures are not logged
@@ -34,4 +34,11 @@ def decrypt_file(file_path):
     decrypted_data = fernet.decrypt(encrypted_data)
     with open(file_path, "wb") as file:
         file.write(decrypted_data)
-    return file_path
\ No newline at end of file
+    return file_path
+
+def decrypt_data(encrypted_data: bytes) -> bytes:
+    if not os.path.exists(KEY_PATH):
+        raise FileNotFoundError("Encryption key not found. Cannot decrypt the file.")
+    with open(KEY_PATH, "rb") as key_file:
+        key = key_file.read()
+    return Fernet(key).decrypt(encrypted_data)
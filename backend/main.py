@@ -7,9 +7,12 @@ from app.api.endpoints import router as api_router
 from app.api.websocket import router as websocket_router
 from app.core.config import settings
 from app.client.files_db import init_db as init_tg_db
-from app.client.client import telegram_client
+from app.client.transfers import transfers
 from app.core.errors import exception_handlers
 from app.core.logging import logger, setup_logging
+from app.core.metrics import metrics
+from app.core.events import event_bus
+from app.services.share_service import share_sweeper
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -20,10 +23,25 @@ async def lifespan(app: FastAPI):
     # Initialize database
     init_tg_db()
     logger.info("Database initialized successfully")
+
+    await event_bus.start()
+    logger.info("Event bus started", extra_fields={"backend": event_bus.name})
+
+    # In-process transfers connect to Telegram in the background; daemon transfers check the socket
+    await transfers.start()
+    logger.info(
+        "Transfers ready",
+        extra_fields={"mode": transfers.name, "crypto_backend": transfers.crypto_backend}
+    )
     
+    await share_sweeper.start()
+
     yield
     
     logger.info("Shutting down TgCloud application")
+    await share_sweeper.stop()
+    await transfers.stop()
+    await event_bus.stop()
 
 if settings.DEV:
     app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
@@ -79,8 +97,18 @@ async def health_check():
         "status": "healthy",
         "service": "TgCloud Backend",
         "version": "1.0.0",
+        "crypto_backend": transfers.crypto_backend,
         "timestamp": "2025-07-26T00:00:00Z"
     }
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Live state of internal components (Telegram scheduler, caches, ...)"""
+    snapshot = metrics.collect()
+    # Components living with the Telegram sessions report from the transfer daemon, if there is one
+    for name, value in (await transfers.metrics()).items():
+        snapshot.setdefault(name, value)
+    return snapshot
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
 app.include_router(websocket_router)
\ No newline at end of file
@@ -0,0 +1,14 @@
+"""
+Unit tests run against the modules directly, without Telegram or a running server
+(tests.py is the live-server suite). The catalog database is created in a temporary
+directory because its path is relative to the working directory. The Telegram clients are
+constructed on import but never connect, so placeholder credentials do.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="tgcloud-tests-"))
+for name, value in (("API_ID", "1"), ("API_HASH", "test"), ("CHAT_ID", "-100")):
+    os.environ.setdefault(name, value)
@@ -0,0 +1,133 @@
+import asyncio
+import io
+import zipfile
+from datetime import datetime
+from types import SimpleNamespace
+from cryptography.fernet import Fernet
+import pytest
+from app.client.transfers import transfers
+from app.services import archive_service
+from app.services.archive_service import ArchiveIndexCache, ArchiveMember, member_data_offset, stream_archive, stream_member
+from app.utils.encryption import get_or_create_key
+
+class FakeStorage:
+    """Stored documents by (channel, message id), served through read_range"""
+
+    def __init__(self):
+        self.documents = {}
+        self.reads = []
+
+    async def read_range(self, copies, offset, limit, priority=None, tenant=None):
+        await asyncio.sleep(0)
+        data = self.documents.get(tuple(copies[0]))
+        if data is None:
+            return None
+        self.reads.append((tuple(copies[0]), offset, limit))
+        return data[offset:offset + limit]
+
+@pytest.fixture
+def storage(monkeypatch):
+    fake = FakeStorage()
+    monkeypatch.setattr(transfers, "read_range", fake.read_range)
+    return fake
+
+def collect(iterator) -> bytes:
+    async def run():
+        return b"".join([chunk async for chunk in iterator])
+    return asyncio.run(run())
+
+def member(name, key, encrypted=False):
+    return ArchiveMember(name, [key], encrypted, datetime(2024, 5, 1, 12, 0, 0))
+
+def test_stream_archive_round_trip(storage):
+    storage.documents[(1, 1)] = b"a" * 5000
+    storage.documents[(1, 2)] = b""
+    storage.documents[(1, 3)] = bytes(range(256)) * 40
+    members = [member("a.txt", (1, 1)), member("empty", (1, 2)), member("gone.bin", (1, 9)), member("c.bin", (1, 3))]
+
+    data = collect(stream_archive(members, read_ahead=2, chunk_size=1024, buffered_chunks=2))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.namelist() == ["a.txt", "empty", "c.bin", "MISSING.txt"]
+        assert archive.read("a.txt") == b"a" * 5000
+        assert archive.read("empty") == b""
+        assert archive.read("c.bin") == bytes(range(256)) * 40
+        assert archive.read("MISSING.txt") == b"Not available:\ngone.bin\n"
+        assert archive.testzip() is None
+    # Every entry is written as ZIP64 with a data descriptor, since sizes are not known up front
+    fields = archive_service.LOCAL_HEADER.unpack_from(data)
+    extra = data[archive_service.LOCAL_HEADER.size + fields[10]:][:fields[11]]
+    assert fields[3] & 0x8 and extra[:2] == b"\x01\x00"
+
+def test_encrypted_members_are_fetched_alone(storage):
+    fernet = Fernet(get_or_create_key())
+    storage.documents[(1, 1)] = b"1" * 4000
+    storage.documents[(1, 2)] = fernet.encrypt(b"secret" * 1000)
+    storage.documents[(1, 3)] = b"3" * 4000
+    members = [member("one", (1, 1)), member("secret", (1, 2), encrypted=True), member("three", (1, 3))]
+
+    data = collect(stream_archive(members, read_ahead=3, chunk_size=1024, buffered_chunks=1))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.read("secret") == b"secret" * 1000
+        assert archive.read("three") == b"3" * 4000
+
+    order = [key for key, _, _ in storage.reads]
+    first, last = order.index((1, 2)), len(order) - 1 - order[::-1].index((1, 2))
+    assert set(order[first:last + 1]) == {(1, 2)}
+    assert (1, 1) not in order[first:] and (1, 3) not in order[:last]
+
+def stored_zip() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("stored.txt", b"plain " * 100, compress_type=zipfile.ZIP_STORED)
+        archive.writestr("docs/deflated.txt", b"deflate me " * 20000, compress_type=zipfile.ZIP_DEFLATED)
+        archive.writestr("bzip2.bin", bytes(range(256)) * 300, compress_type=zipfile.ZIP_BZIP2)
+        archive.writestr("docs/", b"")
+        for i in range(50):
+            archive.writestr(f"padding/{i}.bin", bytes([i]) * 20000, compress_type=zipfile.ZIP_STORED)
+    return buffer.getvalue()
+
+def test_index_reads_only_the_tail_and_is_cached(storage):
+    data = stored_zip()
+    storage.documents[(2, 1)] = data
+    file = SimpleNamespace(copies=[(2, 1)], filename="archive.zip")
+    cache = ArchiveIndexCache(4)
+
+    index = asyncio.run(cache.index(file, len(data)))
+    assert {"stored.txt", "docs/deflated.txt", "bzip2.bin", "docs/", "padding/49.bin"} <= set(index)
+    assert cache.bytes_read < len(data) // 4
+    reads = len(storage.reads)
+    assert asyncio.run(cache.index(file, len(data))) is index
+    assert len(storage.reads) == reads
+    assert cache.metrics()["hits"] == 1 and cache.metrics()["misses"] == 1
+
+def test_index_rejects_other_files(storage):
+    storage.documents[(2, 2)] = b"not a zip file at all" * 100
+    file = SimpleNamespace(copies=[(2, 2)], filename="notes.txt")
+    with pytest.raises(archive_service.ValidationError):
+        asyncio.run(ArchiveIndexCache(4).index(file, 2100))
+
+@pytest.mark.parametrize("name", ["stored.txt", "docs/deflated.txt", "bzip2.bin"])
+def test_stream_member_extracts_each_method(storage, name):
+    data = stored_zip()
+    storage.documents[(2, 1)] = data
+    info = zipfile.ZipFile(io.BytesIO(data)).getinfo(name)
+
+    offset = asyncio.run(member_data_offset([(2, 1)], info))
+    content = collect(stream_member([(2, 1)], info, offset, chunk_size=4096))
+    assert content == zipfile.ZipFile(io.BytesIO(data)).read(name)
+    # Only the member's own bytes are read, besides its local header
+    assert all(read_offset >= info.header_offset for _, read_offset, _ in storage.reads)
+
+def test_stream_member_checks_crc_and_directories(storage):
+    data = bytearray(stored_zip())
+    info = zipfile.ZipFile(io.BytesIO(bytes(data))).getinfo("stored.txt")
+    storage.documents[(2, 1)] = bytes(data)
+    offset = asyncio.run(member_data_offset([(2, 1)], info))
+    data[offset + 10] ^= 0xFF
+    storage.documents[(2, 1)] = bytes(data)
+    with pytest.raises(zipfile.BadZipFile):
+        collect(stream_member([(2, 1)], info, offset))
+
+    directory = zipfile.ZipFile(io.BytesIO(bytes(data))).getinfo("docs/")
+    with pytest.raises(archive_service.ValidationError):
+        asyncio.run(member_data_offset([(2, 1)], directory))
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+import pytest
+from passlib.hash import bcrypt
+from app.auth import jwt_auth
+from app.auth.jwt_auth import authenticate_user
+from app.auth.passwords import PasswordHasher, RateLimiter, pwd_context
+from app.client.files_db import SessionLocal, User, init_db
+from app.core.errors import RateLimitError
+
+init_db()
+
+def test_rate_limiter_window():
+    limiter = RateLimiter(limit=2, window=0.2)
+    limiter.check("a")
+    limiter.hit("a")
+    limiter.hit("a")
+    with pytest.raises(RateLimitError) as limited:
+        limiter.check("a")
+    assert limited.value.details["retry_after"] >= 1
+    limiter.check("b")
+    time.sleep(0.25)
+    limiter.check("a")  # a new window
+
+def test_rate_limiter_clear_and_disabled():
+    limiter = RateLimiter(limit=1, window=60)
+    limiter.hit("a")
+    limiter.clear("a")
+    limiter.check("a")
+    unlimited = RateLimiter(limit=0, window=60)
+    for _ in range(100):
+        unlimited.hit("a")
+    unlimited.check("a")
+
+def test_hasher_rejects_beyond_its_queue_limit():
+    hasher = PasswordHasher(workers=1, queue_limit=2)
+    release = threading.Event()
+
+    async def scenario():
+        busy = [asyncio.create_task(hasher.run(release.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(RateLimitError):
+            await hasher.run(lambda: None)
+        release.set()
+        await asyncio.gather(*busy)
+        await hasher.run(lambda: None)
+
+    asyncio.run(scenario())
+    assert hasher.rejected == 1 and hasher.pending == 0
+
+@pytest.fixture
+def limiters(monkeypatch):
+    ip, user = RateLimiter(limit=100, window=60), RateLimiter(limit=3, window=60)
+    monkeypatch.setattr(jwt_auth, "ip_limiter", ip)
+    monkeypatch.setattr(jwt_auth, "user_limiter", user)
+    return ip, user
+
+def add_user(username: str, password: str, hashed: str = None):
+    with SessionLocal() as db:
+        db.add(User(username=username, hashed_password=hashed or bcrypt.using(rounds=4).hash(password)))
+        db.commit()
+
+def login(username: str, password: str, ip: str = "10.0.0.1"):
+    with SessionLocal() as db:
+        user = asyncio.run(authenticate_user(db, username, password, ip))
+        return user.username if user else None
+
+def test_only_failed_logins_count_against_the_username(limiters):
+    _, user_limiter = limiters
+    add_user("carol", "right")
+    for _ in range(5):
+        assert login("carol", "right") == "carol"
+    assert user_limiter.counts.get("carol") is None
+
+    for i in range(3):
+        assert login("carol", "wrong", f"10.0.1.{i}") is None
+    with pytest.raises(RateLimitError):
+        login("carol", "right", "10.0.2.1")
+
+def test_successful_login_resets_failures(limiters):
+    _, user_limiter = limiters
+    add_user("dave", "right")
+    login("dave", "wrong")
+    login("dave", "wrong")
+    assert login("dave", "right") == "dave"
+    assert "dave" not in user_limiter.counts
+    login("dave", "wrong")
+    login("dave", "wrong")
+    assert login("dave", "right") == "dave"
+
+def test_ip_limit_counts_every_attempt(limiters, monkeypatch):
+    monkeypatch.setattr(jwt_auth, "ip_limiter", RateLimiter(limit=2, window=60))
+    add_user("erin", "right")
+    login("erin", "right", "10.9.9.9")
+    login("erin", "right", "10.9.9.9")
+    with pytest.raises(RateLimitError):
+        login("erin", "right", "10.9.9.9")
+
+def test_outdated_hash_is_replaced_on_login(limiters):
+    add_user("frank", "right")
+    with SessionLocal() as db:
+        old = db.query(User).filter_by(username="frank").one().hashed_password
+    assert pwd_context.needs_update(old)
+
+    assert login("frank", "right") == "frank"
+    with SessionLocal() as db:
+        new = db.query(User).filter_by(username="frank").one().hashed_password
+    assert new != old and not pwd_context.needs_update(new) and pwd_context.verify("right", new)
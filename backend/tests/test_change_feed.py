@@ -0,0 +1,104 @@
+import asyncio
+from app.client.files_db import Change, File, SessionLocal, engine, init_db, record_change
+from app.core.events import event_bus
+from app.services import rebalance_service
+from app.services.change_service import ChangeFeed, change_feed
+
+init_db()
+
+def add_change(filename: str) -> int:
+    with SessionLocal() as db:
+        change = record_change(db, "file_uploaded", "feed", filename)
+        db.commit()
+        return change.id
+
+def test_cursor_and_listing():
+    feed = ChangeFeed()
+    with SessionLocal() as db:
+        start = feed.current_cursor(db)
+    first, second, third = (add_change(name) for name in ("a", "b", "c"))
+    with SessionLocal() as db:
+        assert feed.current_cursor(db) == third
+        changes, has_more = feed.list_changes(db, start, 2)
+        assert [c.id for c in changes] == [first, second] and has_more
+        changes, has_more = feed.list_changes(db, second, 2)
+        assert [c.id for c in changes] == [third] and not has_more
+
+def test_wait_returns_at_once_when_behind():
+    feed = ChangeFeed()
+    cursor = add_change("behind") - 1
+    with SessionLocal() as db:
+        changes, _ = asyncio.run(feed.wait_for_changes(db, cursor, 10, timeout=5))
+    assert [c.filename for c in changes] == ["behind"]
+
+def test_long_poll_wakes_on_event_without_holding_a_connection():
+    feed = ChangeFeed()
+
+    async def scenario():
+        with SessionLocal() as db:
+            cursor = feed.current_cursor(db)
+            waiter = asyncio.create_task(feed.wait_for_changes(db, cursor, 10, timeout=5))
+            await asyncio.sleep(0.05)
+            assert not waiter.done()
+            assert engine.pool.checkedout() == 0
+            add_change("late")
+            feed.handle_event("catalog", {})
+            return await waiter
+
+    changes, has_more = asyncio.run(scenario())
+    assert [c.filename for c in changes] == ["late"] and not has_more
+
+def test_long_poll_times_out_empty():
+    feed = ChangeFeed()
+    with SessionLocal() as db:
+        cursor = feed.current_cursor(db)
+        assert asyncio.run(feed.wait_for_changes(db, cursor, 10, timeout=0.05)) == ([], False)
+
+def capture_catalog_events():
+    published = []
+    event_bus.subscribe(lambda channel, event: published.append(event) if channel == "catalog" else None)
+    return published
+
+def test_publish_recorded_announces_exactly_the_given_changes():
+    published = capture_catalog_events()
+    mine = add_change("same-name")
+    add_change("same-name")  # another request's change of the same file
+    with SessionLocal() as db:
+        asyncio.run(change_feed.publish_recorded(db, [mine]))
+        asyncio.run(change_feed.publish_recorded(db, []))
+    event_bus.handlers.pop()
+    assert [event["cursor"] for event in published] == [mine]
+
+def test_rebalance_publishes_the_migration(monkeypatch):
+    class Message:
+        id = 900
+
+    async def copy(source, message_id, target):
+        return Message()
+
+    async def delete(chat, message_ids):
+        pass
+
+    monkeypatch.setattr(rebalance_service, "copy_message_to_channel", copy)
+    monkeypatch.setattr(rebalance_service, "delete_stored_messages", delete)
+    with SessionLocal() as db:
+        file = File(folder="feed", filename="moved.bin", message_id=5, chat_id=-101, size="1", encrypted=False)
+        db.add(file)
+        db.commit()
+        file_id = file.id
+
+    published = capture_catalog_events()
+
+    async def scenario():
+        with SessionLocal() as db:
+            feed_cursor = change_feed.current_cursor(db)
+            waiter = asyncio.create_task(change_feed.wait_for_changes(db, feed_cursor, 10, timeout=5))
+            await asyncio.sleep(0.01)
+            with SessionLocal() as other:
+                assert await rebalance_service._migrate_file(other, file_id, -102)
+            return await asyncio.wait_for(waiter, 1)
+
+    changes, _ = asyncio.run(scenario())
+    event_bus.handlers.pop()
+    assert [(c.action, c.filename) for c in changes] == [("file_migrated", "moved.bin")]
+    assert [event["action"] for event in published] == ["file_migrated"]
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from app.core.events import SQLiteEventBus, RedisEventBus
+
+def test_sqlite_bus_forwards_between_workers_on_one_connection():
+    path = os.path.join(tempfile.mkdtemp(), "events.db")
+    first, second = SQLiteEventBus(path, poll_interval=0.01), SQLiteEventBus(path, poll_interval=0.01)
+    received = []
+    second.subscribe(lambda channel, event: received.append((channel, event)))
+
+    async def scenario():
+        await first.start()
+        await second.start()
+        connection = second.connection
+        for i in range(3):
+            await first.publish("catalog", {"n": i})
+        await asyncio.sleep(0.1)
+        assert second.connection is connection
+        await first.stop()
+        await second.stop()
+
+    asyncio.run(scenario())
+    assert received == [("catalog", {"n": 0}), ("catalog", {"n": 1}), ("catalog", {"n": 2})]
+    assert first.connection is None and second.connection is None
+
+def test_sqlite_bus_prunes_on_insert_at_a_low_rate():
+    path = os.path.join(tempfile.mkdtemp(), "events.db")
+    bus = SQLiteEventBus(path, retention=60, prune_interval=10)
+    bus._insert("catalog", {"n": 0})
+    with sqlite3.connect(path) as connection:
+        connection.execute("UPDATE events SET created_at = ?", (time.time() - 120,))
+    bus._insert("catalog", {"n": 1})
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 2
+    bus.next_prune = 0
+    bus._insert("catalog", {"n": 2})
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 2
+    bus._close()
+
+class FakePubSub:
+    def __init__(self, messages, error=None):
+        self.messages = messages
+        self.error = error
+        self.subscribed = None
+
+    async def psubscribe(self, pattern):
+        self.subscribed = pattern
+
+    async def listen(self):
+        for message in self.messages:
+            yield message
+        if self.error:
+            raise self.error
+        await asyncio.Event().wait()
+
+    async def reset(self):
+        pass
+
+class FakeRedis:
+    def __init__(self, *pubsubs):
+        self.pubsubs = list(pubsubs)
+
+    def pubsub(self):
+        return self.pubsubs.pop(0)
+
+def pmessage(origin, channel, event):
+    return {"type": "pmessage", "channel": f"tgcloud:{channel}".encode(), "data": json.dumps({"origin": origin, "event": event})}
+
+def test_redis_listener_resubscribes_after_a_dropped_connection():
+    bus = RedisEventBus("redis://unused")
+    received = []
+    bus.subscribe(lambda channel, event: received.append((channel, event)))
+    replacement = FakePubSub([{"type": "psubscribe"}, pmessage("other", "shares", {"revoked": 2})])
+    bus.redis = FakeRedis(replacement)
+    dropped = FakePubSub(
+        [pmessage("other", "shares", {"revoked": 1}), {"type": "pmessage", "channel": b"tgcloud:x", "data": "{"}],
+        ConnectionError("Connection reset by peer"),
+    )
+
+    async def scenario():
+        task = asyncio.create_task(bus._listen(dropped))
+        for _ in range(200):
+            if len(received) == 2:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert received == [("shares", {"revoked": 1}), ("shares", {"revoked": 2})]
+    assert replacement.subscribed == "tgcloud:*"
+    assert bus.metrics()["reconnects"] == 1
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import tempfile
+import pytest
+from app.client import client
+from app.client.hedging import LatencyTracker
+from app.client.scheduler import Priority
+from app.core.config import settings
+
+COPIES = [(-101, 1), (-102, 2)]
+
+class Unavailable(Exception):
+    pass
+
+@pytest.fixture
+def tracker(monkeypatch):
+    tracker = LatencyTracker()
+    monkeypatch.setattr(client, "first_byte_latency", tracker)
+    monkeypatch.setattr(settings, "TG_HEDGE_DEFAULT_DELAY", 0.05)
+    return tracker
+
+def stub_downloads(monkeypatch, behaviours):
+    """`behaviours` maps a channel to an async function(file, progress_callback) standing in for its download"""
+    calls, cancelled = [], []
+
+    async def download_document(chat, message_id, file, part_size_kb=None, progress_callback=None, thumb=False, priority=None):
+        calls.append(chat)
+        try:
+            return await behaviours[chat](file, progress_callback)
+        except asyncio.CancelledError:
+            cancelled.append(chat)
+            raise
+
+    monkeypatch.setattr(client, "download_document", download_document)
+    return calls, cancelled
+
+def writes(content: bytes, delay: float = 0):
+    async def behaviour(file, progress_callback):
+        if file is not bytes:
+            open(file, "wb").close()  # the transfer creates its target at once
+        await asyncio.sleep(delay)
+        if progress_callback:
+            progress_callback(len(content), len(content))
+        if file is bytes:
+            return content
+        with open(file, "wb") as f:
+            f.write(content)
+        return True
+    return behaviour
+
+def hangs():
+    return writes(b"never", delay=60)
+
+def fails(message: str):
+    async def behaviour(file, progress_callback):
+        raise Unavailable(message)
+    return behaviour
+
+def gone():
+    async def behaviour(file, progress_callback):
+        return False
+    return behaviour
+
+def target() -> str:
+    return os.path.join(tempfile.mkdtemp(), "document")
+
+def side_files(path: str):
+    return [name for name in os.listdir(os.path.dirname(path)) if name != "document"]
+
+@pytest.mark.parametrize("priority", [Priority.TRANSFER, Priority.BULK])
+def test_sequential_reads_move_past_a_failing_copy(monkeypatch, priority):
+    calls, _ = stub_downloads(monkeypatch, {-101: fails("channel unavailable"), -102: writes(b"replica")})
+    path = target()
+    assert asyncio.run(client.download_copies(COPIES, path, priority=priority)) is True
+    assert calls == [-101, -102] and open(path, "rb").read() == b"replica"
+
+def test_sequential_reads_raise_the_last_error_when_every_copy_fails(monkeypatch):
+    stub_downloads(monkeypatch, {-101: fails("first"), -102: fails("second")})
+    with pytest.raises(Unavailable, match="second"):
+        asyncio.run(client.download_copies(COPIES, target()))
+
+    stub_downloads(monkeypatch, {-101: fails("first"), -102: gone()})
+    with pytest.raises(Unavailable, match="first"):
+        asyncio.run(client.download_copies(COPIES, target()))
+
+    stub_downloads(monkeypatch, {-101: gone(), -102: gone()})
+    assert asyncio.run(client.download_copies(COPIES, target())) is False
+
+def test_ranged_reads_move_past_a_failing_copy(monkeypatch):
+    async def read_range(chat, message_id, offset, limit, priority):
+        if chat == -101:
+            raise Unavailable("DC down")
+        return b"data"[offset:offset + limit]
+
+    monkeypatch.setattr(client, "_read_range", read_range)
+    assert asyncio.run(client.read_document_range(COPIES, 1, 2)) == b"at"
+    with pytest.raises(Unavailable):
+        asyncio.run(client.read_document_range(COPIES[:1], 0, 2))
+
+def test_fast_primary_is_not_hedged(monkeypatch, tracker):
+    calls, _ = stub_downloads(monkeypatch, {-101: writes(b"primary"), -102: writes(b"replica")})
+    assert asyncio.run(client.download_copies(COPIES, bytes, priority=Priority.INTERACTIVE)) == b"primary"
+    assert calls == [-101] and tracker.hedged == 0 and len(tracker.samples) == 1
+
+def test_slow_primary_is_hedged_and_the_loser_cancelled(monkeypatch, tracker):
+    calls, cancelled = stub_downloads(monkeypatch, {-101: hangs(), -102: writes(b"replica")})
+    path = target()
+    progress = []
+    result = asyncio.run(client.download_copies(COPIES, path, progress_callback=lambda c, t: progress.append(c), priority=Priority.INTERACTIVE))
+    assert result is True and open(path, "rb").read() == b"replica"
+    assert calls == [-101, -102] and cancelled == [-101]
+    assert tracker.hedged == 1 and tracker.hedge_wins == 1
+    assert progress == [7] and side_files(path) == []
+
+def test_primary_winning_after_the_hedge_removes_the_side_file(monkeypatch, tracker):
+    calls, cancelled = stub_downloads(monkeypatch, {-101: writes(b"primary", delay=0.1), -102: hangs()})
+    path = target()
+    assert asyncio.run(client.download_copies(COPIES, path, priority=Priority.INTERACTIVE)) is True
+    assert open(path, "rb").read() == b"primary"
+    assert calls == [-101, -102] and cancelled == [-102]
+    assert tracker.hedged == 1 and tracker.hedge_wins == 0
+    assert side_files(path) == []
+
+def test_failed_primary_goes_straight_to_the_replica(monkeypatch, tracker):
+    calls, _ = stub_downloads(monkeypatch, {-101: fails("gone"), -102: writes(b"replica")})
+    assert asyncio.run(client.download_copies(COPIES, bytes, priority=Priority.INTERACTIVE)) == b"replica"
+    assert calls == [-101, -102] and tracker.hedged == 0
+
+def test_hedged_reads_fall_back_when_every_copy_fails(monkeypatch, tracker):
+    stub_downloads(monkeypatch, {-101: fails("first"), -102: fails("second")})
+    path = target()
+    with pytest.raises(Unavailable, match="second"):
+        asyncio.run(client.download_copies(COPIES, path, priority=Priority.INTERACTIVE))
+    assert side_files(path) == []
+
+    stub_downloads(monkeypatch, {-101: gone(), -102: gone()})
+    assert asyncio.run(client.download_copies(COPIES, bytes, priority=Priority.INTERACTIVE)) is False
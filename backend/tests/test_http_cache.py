@@ -0,0 +1,83 @@
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+from app.core.http_cache import content_etag, listing_etag, etag_matches, not_modified, set_validators, PUBLIC_REVALIDATE
+
+def request(if_none_match: str = None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+def test_etag_formats():
+    assert content_etag(-100, 42) == '"-100-42"'
+    assert content_etag(-100, 42, "thumb320") == '"-100-42-thumb320"'
+    assert listing_etag(7) == 'W/"7"'
+    named = content_etag(-100, 42, "", "a.txt", "report.txt", "text/plain")
+    assert named.startswith('"-100-42-') and named != content_etag(-100, 42)
+    assert listing_etag(7, "e1") == 'W/"7-e1"'
+
+def test_weak_comparison():
+    strong, weak = content_etag(1, 2), listing_etag(9)
+    assert etag_matches(request(strong), strong)
+    assert etag_matches(request("W/" + strong), strong)
+    assert etag_matches(request('"9"'), weak)
+    assert etag_matches(request(f'"other", {weak}'), weak)
+    assert etag_matches(request(" * "), weak)
+    assert not etag_matches(request(), strong)
+    assert not etag_matches(request('"1-3"'), strong)
+    assert not etag_matches(request('W/"9-e1"'), weak)
+
+def test_conditional_get_round_trip():
+    app = FastAPI()
+    etag = listing_etag(5, "e0")
+
+    @app.get("/listing")
+    def listing(request: Request, response: Response):
+        cached = not_modified(request, etag, PUBLIC_REVALIDATE)
+        if cached:
+            return cached
+        set_validators(response, etag, PUBLIC_REVALIDATE)
+        return {"files": []}
+
+    client = TestClient(app)
+    first = client.get("/listing")
+    assert first.status_code == 200 and first.json() == {"files": []}
+    assert first.headers["etag"] == etag and first.headers["cache-control"] == PUBLIC_REVALIDATE
+
+    again = client.get("/listing", headers={"If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304 and again.content == b""
+    assert again.headers["etag"] == etag and again.headers["cache-control"] == PUBLIC_REVALIDATE
+
+    stale = client.get("/listing", headers={"If-None-Match": listing_etag(4, "e0")})
+    assert stale.status_code == 200
+
+def test_renaming_a_file_changes_its_etag():
+    etag = content_etag(1, 2, "", "a.txt", "Report.txt", "text/plain")
+    assert etag == content_etag(1, 2, "", "a.txt", "Report.txt", "text/plain")
+    assert etag != content_etag(1, 2, "", "b.txt", "Report.txt", "text/plain")
+    assert etag != content_etag(1, 2, "", "a.txt", "Final.txt", "text/plain")
+    assert etag != content_etag(1, 2, "", "a.txt", "Report.txt", "text/csv")
+
+def test_download_answers_304_before_any_telegram_work(monkeypatch):
+    from app.api import endpoints
+    from app.auth.principal_cache import Principal
+    from app.client.files_db import File, SessionLocal, init_db
+    from app.client.transfers import transfers
+    from app.core.errors import exception_handlers
+
+    async def not_connected():
+        raise AssertionError("Telegram was needed")
+
+    monkeypatch.setattr(transfers, "ensure_ready", not_connected)
+    init_db()
+    with SessionLocal() as db:
+        file_db = File(folder="cache", filename="kept.bin", original_name="kept.bin", size="10", message_id=7, encrypted=False)
+        db.add(file_db)
+        db.commit()
+        etag = endpoints.file_etag(file_db)
+    app = FastAPI()
+    app.include_router(endpoints.router)
+    for exc, handler in exception_handlers:
+        app.add_exception_handler(exc, handler)
+    app.dependency_overrides[endpoints.get_current_user] = lambda: Principal(1, "alice", False, True)
+
+    response = TestClient(app).get("/folders/cache/files/kept.bin/download", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.headers["etag"] == etag
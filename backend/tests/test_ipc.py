@@ -0,0 +1,188 @@
+import asyncio
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from app.client.daemon import TransferDaemon
+from app.client.ipc import DaemonTransfers
+from app.client.files_db import File, SessionLocal, init_db
+from app.client.scheduler import Priority
+from app.core.errors import TgCloudError, NotFoundError
+import pytest
+
+init_db()
+
+class FakeTransfers:
+    crypto_backend = "fake"
+
+    def __init__(self):
+        self.calls = []
+
+    async def upload(self, file_location, folder, db, username, progress_callback=None, metadata=None):
+        self.calls.append(("upload", file_location, folder, username, metadata))
+        for current in (1, 2, 3):
+            progress_callback(current, 3)
+        return None
+
+    async def download(self, filename, folder, db, progress_callback=None, priority=Priority.TRANSFER, tenant=None):
+        self.calls.append(("download", filename, folder, priority, tenant))
+        progress_callback(5, 5)
+        return ("downloads/" + filename, "original.bin")
+
+    async def read_range(self, copies, offset, limit, priority=Priority.TRANSFER, tenant=None):
+        self.calls.append(("read_range", copies, offset, limit, priority, tenant))
+        return bytes(range(256))[offset:offset + limit]
+
+    async def delete_file(self, filename, folder, db):
+        raise NotFoundError("File", filename)
+
+    async def delete_folder(self, folder, db):
+        raise RuntimeError("boom")
+
+def run_with_daemon(scenario, fake=None):
+    path = os.path.join(tempfile.mkdtemp(), "daemon.sock")
+    fake = fake or FakeTransfers()
+    daemon = TransferDaemon(path, fake)
+
+    async def main():
+        server = await asyncio.start_unix_server(daemon.handle, path=path)
+        async with server:
+            return await scenario(DaemonTransfers(path))
+
+    return fake, asyncio.run(main())
+
+def test_progress_and_absolute_upload_path():
+    progress = []
+
+    async def scenario(transfers):
+        return await transfers.upload("uploads/a.txt", "docs", None, "alice", lambda c, t: progress.append((c, t)), {"k": 1})
+
+    fake, result = run_with_daemon(scenario)
+    assert result is None
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+    assert fake.calls == [("upload", os.path.abspath("uploads/a.txt"), "docs", "alice", {"k": 1})]
+
+class StoringTransfers(FakeTransfers):
+    async def upload(self, file_location, folder, db, username, progress_callback=None, metadata=None):
+        db_file = File(folder=folder, filename="stored.txt", message_id=1, size="3", encrypted=False)
+        db.add(db_file)
+        db.commit()
+        return db_file, 77
+
+    async def delete_file(self, filename, folder, db):
+        return 78
+
+def test_change_ids_cross_the_socket():
+    async def scenario(transfers):
+        with SessionLocal() as db:
+            db_file, change_id = await transfers.upload("uploads/b.txt", "docs", db, "alice")
+            return db_file.filename, change_id, await transfers.delete_file("stored.txt", "docs", db)
+
+    _, result = run_with_daemon(scenario, StoringTransfers())
+    assert result == ("stored.txt", 77, 78)
+
+def test_download_returns_absolute_path():
+    async def scenario(transfers):
+        return await transfers.download("a.txt", "docs", None, priority=Priority.INTERACTIVE, tenant="share:00")
+
+    fake, result = run_with_daemon(scenario)
+    assert result == (os.path.abspath("downloads/a.txt"), "original.bin")
+    assert fake.calls == [("download", "a.txt", "docs", Priority.INTERACTIVE, "share:00")]
+
+def test_read_range_bytes_round_trip():
+    async def scenario(transfers):
+        return await transfers.read_range([(1, 2)], 250, 10, tenant="user:a")
+
+    fake, data = run_with_daemon(scenario)
+    assert data == bytes(range(250, 256))
+    assert fake.calls == [("read_range", [(1, 2)], 250, 10, Priority.TRANSFER, "user:a")]
+
+def test_errors_cross_the_socket():
+    async def scenario(transfers):
+        with pytest.raises(TgCloudError) as not_found:
+            await transfers.delete_file("a.txt", "docs", None)
+        with pytest.raises(TgCloudError) as failed:
+            await transfers.delete_folder("docs", None)
+        with pytest.raises(TgCloudError) as unknown:
+            await transfers.call("nope")
+        return not_found.value, failed.value, unknown.value
+
+    _, (not_found, failed, unknown) = run_with_daemon(scenario)
+    assert not_found.status_code == 404 and not_found.code == NotFoundError("File", "a").code
+    assert failed.status_code == 502 and "boom" in failed.message
+    assert unknown.code == "TRANSFER_DAEMON_ERROR"
+
+def test_unreachable_daemon():
+    transfers = DaemonTransfers(os.path.join(tempfile.mkdtemp(), "missing.sock"))
+    with pytest.raises(TgCloudError):
+        asyncio.run(transfers.call("info"))
+    assert "error" in asyncio.run(transfers.metrics())["transfer_daemon"]
+
+class HangingTransfers(FakeTransfers):
+    def __init__(self, finish_anyway=False):
+        super().__init__()
+        self.finish_anyway = finish_anyway
+        self.started = asyncio.Event()
+        self.cancelled = False
+        self.path = os.path.join(tempfile.mkdtemp(), "a.txt")
+
+    async def download(self, filename, folder, db, progress_callback=None, priority=Priority.TRANSFER, tenant=None):
+        self.started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            if not self.finish_anyway:
+                raise
+        with open(self.path, "wb") as f:
+            f.write(b"done")
+        return (self.path, "a.txt")
+
+def cancel_download(fake):
+    async def scenario(transfers):
+        call = asyncio.create_task(transfers.download("a.txt", "docs", None))
+        await fake.started.wait()
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        for _ in range(100):
+            if (await transfers.call("info"))["active"]["download"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        return fake.cancelled
+
+    return run_with_daemon(scenario, fake)[1]
+
+def test_client_hangup_cancels_the_operation():
+    fake = HangingTransfers()
+    assert cancel_download(fake)
+    assert not os.path.exists(fake.path)
+
+def test_client_hangup_discards_the_produced_file():
+    fake = HangingTransfers(finish_anyway=True)
+    assert cancel_download(fake)
+    assert not os.path.exists(fake.path)
+
+class SlotTransfers(FakeTransfers):
+    def __init__(self):
+        super().__init__()
+        self.released = asyncio.Event()
+
+    @asynccontextmanager
+    async def transfer_slot(self, tenant=None):
+        self.calls.append(("transfer_slot", tenant))
+        try:
+            yield
+        finally:
+            self.released.set()
+
+def test_transfer_slot_is_held_until_the_client_leaves():
+    async def scenario(transfers):
+        async with transfers.transfer_slot("share:00"):
+            await asyncio.sleep(0.05)
+            held = not fake.released.is_set()
+        await asyncio.wait_for(fake.released.wait(), 1)
+        return held
+
+    fake = SlotTransfers()
+    _, held = run_with_daemon(scenario, fake)
+    assert held and fake.calls == [("transfer_slot", "share:00")]
@@ -0,0 +1,20 @@
+import struct
+from app.services.metadata_service import read_mp4_duration
+
+def box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+def mp4(mvhd: bytes) -> bytes:
+    return box(b"ftyp", b"isom\0\0\0\0") + box(b"mdat", b"\0" * 100) + box(b"moov", box(b"mvhd", mvhd))
+
+def test_mp4_duration(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(mp4(b"\0\0\0\0" + struct.pack(">IIII", 0, 0, 1000, 12500)))
+    assert read_mp4_duration(str(path)) == 12.5
+
+def test_truncated_mp4_has_no_duration(tmp_path):
+    full = mp4(b"\0\0\0\0" + struct.pack(">IIII", 0, 0, 1000, 12500))
+    path = tmp_path / "video.mp4"
+    for cut in range(len(full) - 30, len(full)):
+        path.write_bytes(full[:cut])
+        assert read_mp4_duration(str(path)) is None
@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from app.services import preview_service
+from app.services.preview_service import is_text, page_end, read_text_page
+
+def test_is_text():
+    assert is_text("text/plain") and is_text("application/json")
+    assert not is_text("image/png") and not is_text(None)
+
+def test_page_end_cuts_at_the_last_line():
+    assert page_end(b"one\ntwo\nthr") == 8
+    assert page_end(b"one\n") == 4
+
+def test_page_end_keeps_utf8_characters_whole():
+    text = "aé€😀".encode()  # 1, 2, 3 and 4 byte characters
+    for cut in range(1, len(text) + 1):
+        end = page_end(text[:cut])
+        text[:end].decode()  # never a partial character
+        assert cut - end < 4
+    assert page_end(text) == len(text)
+
+@pytest.fixture
+def document(monkeypatch):
+    content = "".join(f"line {i} ünïcode\n" for i in range(200)).encode()
+
+    async def read(copies, offset, limit, priority=None, tenant=None):
+        return content[offset:offset + limit]
+
+    monkeypatch.setattr(preview_service.chunk_cache, "read", read)
+    return content
+
+def test_pages_follow_each_other_to_the_end(document):
+    pages, offset = [], 0
+    while offset is not None:
+        page = asyncio.run(read_text_page([(1, 1)], len(document), offset, 500))
+        assert page.offset == offset
+        pages.append(page.data)
+        offset = page.next_offset
+    assert b"".join(pages) == document
+    assert all(page.endswith(b"\n") for page in pages)
+    assert len(pages) > 1
+
+def test_last_page_has_no_next_offset(document):
+    page = asyncio.run(read_text_page([(1, 1)], len(document), len(document) - 10, 500))
+    assert page.next_offset is None and page.data == document[-10:]
+    # Without a known size, a short read ends the document
+    page = asyncio.run(read_text_page([(1, 1)], None, len(document) - 10, 500))
+    assert page.next_offset is None
+
+def test_offset_past_the_end_is_an_empty_last_page(document):
+    page = asyncio.run(read_text_page([(1, 1)], None, len(document) + 100, 500))
+    assert page.data == b"" and page.next_offset is None
+
+def test_missing_document(monkeypatch):
+    async def read(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(preview_service.chunk_cache, "read", read)
+    assert asyncio.run(read_text_page([(1, 1)], 100, 0, 50)) is None
+
+def test_offset_past_the_end_is_rejected_as_invalid(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.api import endpoints
+    from app.auth.principal_cache import Principal
+    from app.client.files_db import File, SessionLocal, init_db
+    from app.core.errors import exception_handlers
+
+    init_db()
+    with SessionLocal() as db:
+        db.add(File(folder="logs", filename="paged.log", original_name="paged.log", mime_type="text/plain", size="1000", message_id=1, encrypted=False))
+        db.commit()
+    app = FastAPI()
+    app.include_router(endpoints.router)
+    for exc, handler in exception_handlers:
+        app.add_exception_handler(exc, handler)
+    app.dependency_overrides[endpoints.get_current_user] = lambda: Principal(1, "alice", False, True)
+
+    response = TestClient(app).get("/folders/logs/files/paged.log/preview", params={"offset": 5000})
+    assert response.status_code == 422
+    assert "beyond the end" in response.text
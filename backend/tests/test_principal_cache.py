@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime
+import pytest
+from app.auth.principal_cache import Principal, principal_cache
+from app.client.files_db import SessionLocal, User, init_db
+from app.core.events import event_bus
+
+init_db()
+
+@pytest.fixture
+def cached_user():
+    username = f"user{datetime.now().timestamp()}"
+    with SessionLocal() as db:
+        user = User(username=username, hashed_password="hash", encryption_enabled=False, is_active=True)
+        db.add(user)
+        db.commit()
+        principal_cache.put(Principal.from_user(user))
+    assert principal_cache.get(username) is not None
+    return username
+
+@pytest.mark.parametrize("field, value", [
+    ("encryption_enabled", True),
+    ("hashed_password", "new hash"),
+    ("is_active", False),
+])
+def test_committed_change_drops_the_principal(cached_user, field, value):
+    with SessionLocal() as db:
+        user = db.query(User).filter_by(username=cached_user).one()
+        setattr(user, field, value)
+        db.commit()
+    assert principal_cache.get(cached_user) is None
+
+def test_other_changes_keep_the_principal(cached_user):
+    with SessionLocal() as db:
+        user = db.query(User).filter_by(username=cached_user).one()
+        user.created_at = datetime(2020, 1, 1)
+        db.commit()
+    assert principal_cache.get(cached_user) is not None
+
+def test_rollback_keeps_the_principal(cached_user):
+    with SessionLocal() as db:
+        user = db.query(User).filter_by(username=cached_user).one()
+        user.is_active = False
+        db.flush()
+        db.rollback()
+        # A later unrelated commit in the same session must not invalidate either
+        db.commit()
+    assert principal_cache.get(cached_user) is not None
+
+def test_invalidation_reaches_other_workers(cached_user):
+    published = []
+    event_bus.subscribe(lambda channel, event: published.append((channel, event)))
+
+    async def scenario():
+        with SessionLocal() as db:
+            db.query(User).filter_by(username=cached_user).one().encryption_enabled = True
+            db.commit()
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert ("auth", {"username": cached_user}) in published
+    event_bus.handlers.pop()
@@ -0,0 +1,211 @@
+import asyncio
+import io
+import time
+import zipfile
+from datetime import datetime
+import pytest
+from app.client import local_transfers
+from app.client.quotas import TransferQuotas, ByteBucket, user_tenant, share_tenant, tenant_label
+from app.client.scheduler import TelegramScheduler, Priority
+from app.services.archive_service import ArchiveMember, member_data_offset, stream_archive, stream_member
+from app.services.preview_service import read_text_page
+
+def quotas(**kwargs) -> TransferQuotas:
+    options = dict(slots=3, user_limits=(2, 0), share_limits=(1, 0), overrides={}, burst_seconds=0.5)
+    options.update(kwargs)
+    return TransferQuotas(**options)
+
+def test_tenant_keys():
+    assert user_tenant("alice") == "user:alice"
+    assert share_tenant(0xABC) == "share:0000000000000abc"
+
+def test_metrics_do_not_name_users():
+    assert "alice" not in tenant_label("user:alice")
+    assert tenant_label("user:alice") == tenant_label("user:alice") != tenant_label("user:bob")
+    assert tenant_label("share:0000000000000abc") == "share:0000000000000abc"
+
+def test_overrides_replace_the_user_defaults():
+    q = quotas(overrides={"vip": "6:1048576", "slow": "1:"})
+    assert q.limits("user:vip") == (6, 1048576.0)
+    assert q.limits("user:slow") == (1, 0.0)
+    assert q.limits("user:other") == (2, 0)
+    assert q.limits("share:00") == (1, 0)
+
+def test_slots_go_round_robin_between_tenants():
+    q = quotas()
+    order = []
+
+    async def job(key, name):
+        async with q.transfer(key):
+            order.append(name)
+            await asyncio.sleep(0.02)
+
+    async def scenario():
+        batch = [asyncio.create_task(job("user:a", f"a{i}")) for i in range(6)]
+        await asyncio.sleep(0)
+        others = [asyncio.create_task(job("user:b", f"b{i}")) for i in range(2)]
+        others += [asyncio.create_task(job("share:s", f"s{i}")) for i in range(2)]
+        await asyncio.sleep(0.005)
+        snapshot = q.metrics()
+        await asyncio.gather(*batch, *others)
+        return snapshot
+
+    snapshot = asyncio.run(scenario())
+    # a's batch only ever holds its own two slots; b and the link are served in between
+    assert snapshot["active"] == 3 and snapshot["tenants"][tenant_label("user:a")]["active"] == 2
+    assert order[:7] == ["a0", "a1", "b0", "s0", "a2", "b1", "s1"]
+    assert q.metrics()["tenants"] == {} and q.metrics()["transfers"] == 10
+
+def test_cancelled_waiter_gives_up_its_place():
+    q = quotas(slots=1)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def holder():
+            async with q.transfer("user:a"):
+                await release.wait()
+
+        async def waiter():
+            async with q.transfer("user:b"):
+                pass
+
+        held = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(waiter())
+        await asyncio.sleep(0.01)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        release.set()
+        await held
+
+    asyncio.run(scenario())
+    metrics = q.metrics()
+    assert metrics["active"] == 0 and metrics["queued"] == 0 and metrics["tenants"] == {}
+
+def test_bucket_allows_a_burst_then_paces():
+    bucket = ByteBucket(rate=1000, burst=500)
+    assert bucket.debit(500) == 0
+    assert bucket.debit(250) == pytest.approx(0.25, abs=0.01)
+
+def test_bandwidth_is_shaped_through_progress_callbacks():
+    q = quotas(share_limits=(1, 1_000_000), burst_seconds=0.25)
+    reported = []
+
+    async def scenario():
+        started = time.monotonic()
+        async with q.transfer("share:s", lambda current, total: reported.append(current)) as progress:
+            for part in range(1, 5):
+                await progress(part * 250_000, 1_000_000)
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(scenario())
+    assert reported == [250_000, 500_000, 750_000, 1_000_000]
+    assert 0.7 <= elapsed < 1.2
+    assert q.metrics()["throttled_seconds"] == pytest.approx(0.75, abs=0.05)
+    assert q.metrics()["bytes"] == 1_000_000
+
+def test_throttled_transfer_gives_its_scheduler_slot_back():
+    q = quotas(share_limits=(1, 100_000), burst_seconds=0)
+    scheduler = TelegramScheduler("test", initial_limit=1, min_limit=1, max_limit=1, interactive_reserve=0)
+
+    async def scenario():
+        async with q.transfer("share:s") as progress:
+            async def download():
+                await progress(50_000, 50_000)  # half a second of debt
+
+            transfer = asyncio.create_task(scheduler.call("download_file", download, measure_latency=False))
+            await asyncio.sleep(0.05)
+            assert scheduler.inflight == 0
+            started = time.monotonic()
+            await scheduler.call("get_messages", lambda: asyncio.sleep(0), Priority.INTERACTIVE)
+            waited = time.monotonic() - started
+            await transfer
+        return waited
+
+    assert asyncio.run(scenario()) < 0.1
+    assert scheduler.inflight == 0
+
+def test_ranged_reads_are_charged_without_a_slot():
+    q = quotas(user_limits=(1, 1_000_000), burst_seconds=0)
+
+    async def scenario():
+        started = time.monotonic()
+        await q.consume("user:a", 200_000)
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.19
+    assert q.metrics()["active"] == 0 and q.metrics()["bytes"] == 200_000
+
+@pytest.fixture
+def local_quotas(monkeypatch):
+    """Install quotas in the in-process transfers, over documents served from memory"""
+    documents = {}
+
+    async def read_document_range(copies, offset, limit, priority=Priority.TRANSFER):
+        await asyncio.sleep(0)
+        data = documents.get(tuple(copies[0]))
+        return None if data is None else data[offset:offset + limit]
+
+    def install(**kwargs):
+        q = quotas(**kwargs)
+        monkeypatch.setattr(local_transfers, "transfer_quotas", q)
+        return q
+
+    monkeypatch.setattr(local_transfers, "read_document_range", read_document_range)
+    return install, documents
+
+def test_preview_pages_are_charged_to_their_tenant(local_quotas):
+    install, documents = local_quotas
+    q = install(user_limits=(1, 100_000), burst_seconds=0.1)
+    documents[(31, 1)] = b"line\n" * 4000
+
+    page = asyncio.run(read_text_page([(31, 1)], 20_000, 0, 20_000, user_tenant("alice")))
+    assert len(page.data) == 20_000
+    # 10 KB of burst, then the other 10 KB at 100 KB/s
+    assert q.metrics()["bytes"] == 20_000
+    assert q.metrics()["throttled_seconds"] == pytest.approx(0.1, abs=0.02)
+
+def test_archive_streams_hold_a_slot_for_their_whole_duration(local_quotas):
+    install, documents = local_quotas
+    q = install(user_limits=(1, 0))
+    documents[(32, 1)] = b"a" * 5000
+    members = [ArchiveMember("a.txt", [(32, 1)], False, datetime(2024, 5, 1))]
+
+    async def collect(stream):
+        return b"".join([chunk async for chunk in stream])
+
+    async def scenario():
+        first = stream_archive(members, chunk_size=1024, tenant=user_tenant("alice"))
+        head = await first.__anext__()
+        second = asyncio.create_task(collect(stream_archive(members, chunk_size=1024, tenant=user_tenant("alice"))))
+        await asyncio.sleep(0.05)
+        waiting = (second.done(), q.metrics()["active"], q.metrics()["queued"])
+        first_data = head + await collect(first)
+        return waiting, first_data, await second
+
+    waiting, first_data, second_data = asyncio.run(scenario())
+    assert waiting == (False, 1, 1)
+    assert first_data == second_data
+    assert q.metrics()["tenants"] == {} and q.metrics()["transfers"] == 2
+
+def test_extracted_members_hold_a_slot_while_streaming(local_quotas):
+    install, documents = local_quotas
+    q = install(user_limits=(1, 0))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        archive.writestr("big.bin", bytes(range(256)) * 64)
+    documents[(33, 1)] = buffer.getvalue()
+    info = zipfile.ZipFile(buffer).getinfo("big.bin")
+
+    async def scenario():
+        offset = await member_data_offset([(33, 1)], info)
+        stream = stream_member([(33, 1)], info, offset, chunk_size=1024, tenant=share_tenant(7))
+        await stream.__anext__()
+        active = q.metrics()["tenants"][tenant_label(share_tenant(7))]["active"]
+        await stream.aclose()
+        return active
+
+    assert asyncio.run(scenario()) == 1
+    assert q.metrics()["tenants"] == {}
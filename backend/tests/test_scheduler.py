@@ -0,0 +1,115 @@
+import asyncio
+import pytest
+from telethon.errors import FloodError
+from app.client.scheduler import TelegramScheduler, Priority, FloodWaitDeferred
+from app.core.errors import ExternalServiceError
+
+class Flood(FloodError):
+    def __init__(self, seconds: float):
+        super().__init__(None, "FLOOD_WAIT")
+        self.seconds = seconds
+
+def scheduler(**kwargs) -> TelegramScheduler:
+    options = dict(initial_limit=4, min_limit=2, max_limit=8, latency_target=0.05, max_flood_wait=1, interactive_reserve=1)
+    options.update(kwargs)
+    return TelegramScheduler("test", **options)
+
+async def returns(value, delay: float = 0):
+    await asyncio.sleep(delay)
+    return value
+
+def test_limit_grows_additively_on_success():
+    s = scheduler()
+    asyncio.run(s.call("get_messages", lambda: returns(1)))
+    assert s.limit == pytest.approx(4.25)
+    for _ in range(40):
+        asyncio.run(s.call("get_messages", lambda: returns(1)))
+    assert s.limit == 8
+
+def test_slow_calls_shrink_the_limit_unless_unmeasured():
+    s = scheduler()
+    asyncio.run(s.call("get_messages", lambda: returns(1, 0.1)))
+    assert s.limit == pytest.approx(3.0)
+    # Whole-file transfers take long by nature and are not latency samples
+    asyncio.run(s.call("download_file", lambda: returns(1, 0.1), measure_latency=False))
+    assert s.limit == pytest.approx(3 + 1 / 3)
+
+def test_flood_wait_halves_the_limit_blocks_the_method_and_retries():
+    s = scheduler(initial_limit=8)
+    attempts = []
+
+    async def flaky():
+        attempts.append(asyncio.get_running_loop().time())
+        if len(attempts) == 1:
+            raise Flood(0.2)
+        return "ok"
+
+    assert asyncio.run(s.call("send_file", flaky)) == "ok"
+    assert attempts[1] - attempts[0] >= 0.2
+    assert s.stats["send_file"].flood_waits == 1
+    assert s.limit == pytest.approx(4 + 1 / 4)
+
+def test_flood_wait_is_deferred_or_given_up():
+    s = scheduler()
+
+    async def flood(seconds):
+        raise Flood(seconds)
+
+    with pytest.raises(FloodWaitDeferred):
+        asyncio.run(s.call("send_file", lambda: flood(0.1), defer_flood=True))
+    assert s.flood_wait_remaining() > 0
+    with pytest.raises(ExternalServiceError):
+        asyncio.run(s.call("forward_messages", lambda: flood(30)))
+    assert s.inflight == 0
+    assert s.limit == 2
+
+def test_slots_are_handed_out_by_priority():
+    s = scheduler(initial_limit=2, min_limit=2, interactive_reserve=0)
+    order = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def hold():
+            await release.wait()
+
+        async def job(name, priority):
+            await s.call("get_messages", lambda: returns(order.append(name)), priority, measure_latency=False)
+
+        holders = [asyncio.create_task(s.call("download_file", hold, measure_latency=False)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        waiters = [
+            asyncio.create_task(job("bulk", Priority.BULK)),
+            asyncio.create_task(job("transfer", Priority.TRANSFER)),
+            asyncio.create_task(job("interactive", Priority.INTERACTIVE)),
+        ]
+        await asyncio.sleep(0.01)
+        assert order == []
+        release.set()
+        await asyncio.gather(*holders, *waiters)
+
+    asyncio.run(scenario())
+    assert order == ["interactive", "transfer", "bulk"]
+
+def test_long_transfers_cannot_take_the_interactive_reserve():
+    s = scheduler(initial_limit=3, min_limit=3, interactive_reserve=1)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def hold():
+            await release.wait()
+
+        transfers = [asyncio.create_task(s.call("download_file", hold, measure_latency=False)) for _ in range(4)]
+        await asyncio.sleep(0.01)
+        assert s.inflight == 2
+        # The reserved slot serves a preview while two transfers run and two wait
+        result = await asyncio.wait_for(
+            s.call("get_messages", lambda: returns("preview"), Priority.INTERACTIVE), 1
+        )
+        release.set()
+        await asyncio.gather(*transfers)
+        return result
+
+    assert asyncio.run(scenario()) == "preview"
+    assert s.inflight == 0
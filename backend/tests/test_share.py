@@ -0,0 +1,105 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from app.client.files_db import SessionLocal, ShareToken, User, init_db, new_share_id
+from app.core.config import settings
+from app.core.events import event_bus
+from app.services.file_service import validate_share_token
+from app.services.share_service import ShareTokenCache, ShareTokenSweeper, share_cache, token_key
+
+init_db()
+
+def add_link(token: str = None, expires_in: timedelta = timedelta(hours=1), revoked: bool = False) -> str:
+    token = token or new_share_id()
+    with SessionLocal() as db:
+        if not db.query(User).filter_by(username="owner").first():
+            db.add(User(username="owner", hashed_password="x"))
+        db.add(ShareToken(
+            token=token, type="file", folder="docs", filename="a.txt", owner="owner",
+            expires_at=datetime.now() + expires_in, revoked=revoked,
+        ))
+        db.commit()
+    return token
+
+class NoDatabase:
+    def query(self, *args):
+        raise AssertionError("the database was queried")
+
+def test_cached_link_is_served_without_the_database():
+    token = add_link()
+    with SessionLocal() as db:
+        claims = validate_share_token(db, token, "file")
+    assert claims == {"type": "file", "folder": "docs", "owner": "owner", "filename": "a.txt"}
+    assert validate_share_token(NoDatabase(), token, "file") == claims
+
+def test_revoked_link_is_rejected_at_once():
+    token = add_link()
+    with SessionLocal() as db:
+        validate_share_token(db, token, "file")
+    asyncio.run(share_cache.revoke(token, datetime.now() + timedelta(hours=1)))
+    with pytest.raises(HTTPException) as rejected:
+        validate_share_token(NoDatabase(), token, "file")
+    assert rejected.value.status_code == 401
+
+def test_memory_bus_with_several_workers_checks_the_revoked_flag(monkeypatch):
+    monkeypatch.setattr(settings, "WEB_CONCURRENCY", 4)
+    assert event_bus.name == "memory" and not share_cache.sees_all_revocations
+    token = add_link()
+    with SessionLocal() as db:
+        validate_share_token(db, token, "file")
+        # Revoked by another worker, whose event never reaches this one
+        db.query(ShareToken).filter_by(token=token).update({"revoked": True})
+        db.commit()
+        with pytest.raises(HTTPException):
+            validate_share_token(db, token, "file")
+
+def test_expiry():
+    cache = ShareTokenCache(ttl=300, max_entries=10)
+    cache.put("old", {"type": "file"}, datetime.now() - timedelta(seconds=1))
+    claims, expires = cache.get("old")
+    assert expires < time.time()
+
+    token = add_link(expires_in=timedelta(seconds=-5))
+    with SessionLocal() as db, pytest.raises(HTTPException) as expired:
+        validate_share_token(db, token, "file")
+    assert "expired" in expired.value.detail
+
+    # Cached entries are looked up again after the cache's own ttl
+    short = ShareTokenCache(ttl=0, max_entries=10)
+    short.put("t", {"type": "file"}, datetime.now() + timedelta(hours=1))
+    assert short.get("t") is None and short.misses == 1
+
+def test_put_ignores_revoked_tokens():
+    cache = ShareTokenCache(ttl=300, max_entries=2)
+    expires = datetime.now() + timedelta(hours=1)
+    cache.handle_event("shares", {"revoked": token_key("gone"), "expires": expires.timestamp()})
+    cache.put("gone", {"type": "file"}, expires)
+    assert cache.get("gone") is None and cache.is_revoked("gone")
+
+    for name in ("a", "b", "c"):
+        cache.put(name, {"type": "file"}, expires)
+    assert cache.get("a") is None and cache.get("c") is not None
+
+def test_sweeper_deletes_expired_and_revoked_links_in_batches():
+    with SessionLocal() as db:
+        db.query(ShareToken).delete()
+        db.commit()
+    expired = [add_link(expires_in=timedelta(hours=-1)) for _ in range(7)]
+    revoked = [add_link(revoked=True) for _ in range(6)]
+    add_link(expires_in=timedelta(hours=-1), revoked=True)
+    valid = {add_link() for _ in range(5)}
+
+    sweeper = ShareTokenSweeper(interval=0, batch_size=3)
+    assert asyncio.run(sweeper.sweep()) == len(expired) + len(revoked) + 1
+    with SessionLocal() as db:
+        assert {row.token for row in db.query(ShareToken.token)} == valid
+    assert sweeper.deleted == 14 and asyncio.run(sweeper.sweep()) == 0
+
+def test_links_created_as_whole_jwts_still_resolve():
+    legacy = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9." + "x" * 120 + ".signature"
+    assert len(legacy) > len(new_share_id())
+    add_link(token=legacy)
+    with SessionLocal() as db:
+        assert validate_share_token(db, legacy, "file")["filename"] == "a.txt"
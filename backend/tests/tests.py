@@ -65,6 +65,10 @@ def test_download_file(client, tmp_path):
     with open(TEST_FILE_PATH, "rb") as orig:
         assert orig.read() == download_path.read_bytes()
 
+def test_thumbnail_rejects_non_image(client):
+    resp = client.get("/folders/testfolder/files/test.txt/thumbnail")
+    assert resp.status_code == 422
+
 def test_share_file(client):
     global shared_file_token
     resp = client.post("/folders/testfolder/files/test.txt/share")